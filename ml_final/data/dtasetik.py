@@ -1,171 +1,355 @@
-import pandas as pd
-import numpy as np
-from datetime import datetime, timedelta
-import random
-
-def generate_price_history(products_count=30, days=90):
-    """
-    Генерирует историю цен для товаров на 90 дней
-    """
-    # Базовые цены для разных категорий товаров (в рублях)
-    base_prices = {
-        2: 50000,  # Смартфоны
-        3: 80000,  # Ноутбуки
-        4: 15000,  # Наушники
-        6: 5000    # Техника для кухни
-    }
-    
-    price_history = []
-    history_id = 1
-    
-    # Дата начала отслеживания
-    start_date = datetime.now() - timedelta(days=days)
-    
-    for product_id in range(1, products_count + 1):
-        # Определяем категорию товара
-        if product_id <= 7:
-            category_id = 2  # Смартфоны
-        elif product_id <= 14:
-            category_id = 3  # Ноутбуки
-        elif product_id <= 20:
-            category_id = 4  # Наушники
-        else:
-            category_id = 6  # Техника для кухни
-        
-        # Базовая цена с вариациями
-        base_price = base_prices[category_id] * random.uniform(0.8, 1.2)
-        current_price = base_price
-        
-        for day in range(days):
-            date = start_date + timedelta(days=day)
-            
-            # Генерируем изменение цены
-            change_percent = np.random.normal(0, 0.02)  # Среднее изменение 0%, std 2%
-            
-            # Сезонные эффекты (пятница/выходные - рост, понедельник - спад)
-            if date.weekday() in [4, 5, 6]:  # Пятница, суббота, воскресенье
-                change_percent += 0.01
-            elif date.weekday() == 0:  # Понедельник
-                change_percent -= 0.005
-            
-            # Случайные акции и распродажи
-            if random.random() < 0.05:  # 5% вероятность акции
-                change_percent -= random.uniform(0.1, 0.3)  # Скидка 10-30%
-            
-            # Применяем изменение цены
-            price_change = current_price * change_percent
-            current_price += price_change
-            
-            # Ограничиваем минимальную цену (не менее 50% от базовой)
-            current_price = max(current_price, base_price * 0.5)
-            
-            # Округляем до кратного 10 рублям
-            current_price = round(current_price / 10) * 10
-            
-            price_history.append({
-                'id': history_id,
-                'product_id': product_id,
-                'price': float(current_price),
-                'created_at': date.strftime('%Y-%m-%d %H:%M:%S')
-            })
-            
-            history_id += 1
-    
-    return pd.DataFrame(price_history)
-
-def generate_products_dataset():
-    """
-    Создает датасет товаров (уже предоставлен в задании)
-    """
-    products = []
-    
-    # Смартфоны (1-7)
-    smartphones = [
-        (1, '482159736', 'Смартфон iPhone 15 128GB', 2, 'Apple'),
-        (2, '5938472610', 'Смартфон iPhone 15 256GB', 2, 'Apple'),
-        (3, '620184735', 'Смартфон Samsung Galaxy S24 128GB', 2, 'Samsung'),
-        (4, '7493825160', 'Смартфон Samsung Galaxy S23 256GB', 2, 'Samsung'),
-        (5, '815937402', 'Смартфон Xiaomi 13 Lite 128GB', 2, 'Xiaomi'),
-        (6, '9264738151', 'Смартфон Xiaomi Redmi Note 12 128GB', 2, 'Xiaomi'),
-        (7, '1038574926', 'Смартфон OPPO Reno 10 256GB', 2, 'OPPO')
-    ]
-    
-    # Ноутбуки (8-14)
-    laptops = [
-        (8, '284619537', 'Ноутбук MacBook Pro 14" M3 512GB', 3, 'Apple'),
-        (9, '3957281640', 'Ноутбук MacBook Air 13" M2 256GB', 3, 'Apple'),
-        (10, '462839175', 'Ноутбук ASUS VivoBook 15 i5 512GB', 3, 'ASUS'),
-        (11, '5739462810', 'Ноутбук ASUS ZenBook 13 i7 1TB', 3, 'ASUS'),
-        (12, '684157392', 'Ноутбук Lenovo IdeaPad 5 i5 512GB', 3, 'Lenovo'),
-        (13, '7952684031', 'Ноутбук Lenovo ThinkPad T14 i7 512GB', 3, 'Lenovo'),
-        (14, '826394715', 'Ноутбук HP Envy 13 i5 512GB', 3, 'HP')
-    ]
-    
-    # Наушники (15-20)
-    headphones = [
-        (15, '9374851260', 'Наушники AirPods Pro 2', 4, 'Apple'),
-        (16, '148259637', 'Наушники AirPods 3', 4, 'Apple'),
-        (17, '2593671480', 'Наушники Sony WH-1000XM5', 4, 'Sony'),
-        (18, '360478259', 'Наушники Sony LinkBuds S', 4, 'Sony'),
-        (19, '4715893601', 'Наушники Samsung Galaxy Buds2 Pro', 4, 'Samsung'),
-        (20, '582690471', 'Наушники JBL Tune 770NC', 4, 'JBL')
-    ]
-    
-    # Техника для кухни (21-30)
-    kitchen = [
-        (21, '6937015820', 'Электрочайник Philips HD9359 1.7L', 6, 'Philips'),
-        (22, '704812693', 'Электрочайник Tefal KO851 1.7L', 6, 'Tefal'),
-        (23, '8159237041', 'Электрочайник Bosch TWK 550', 6, 'Bosch'),
-        (24, '926034815', 'Блендер Braun Multiquick 7 MQ 7045', 6, 'Braun'),
-        (25, '1371459260', 'Блендер Philips HR3556 2L', 6, 'Philips'),
-        (26, '248256137', 'Блендер Moulinex LM935 1.5L', 6, 'Moulinex'),
-        (27, '3593672480', 'Кофеварка DeLonghi ECAM 320', 6, 'DeLonghi'),
-        (28, '460478359', 'Кофеварка Philips EP5400', 6, 'Philips'),
-        (29, '5715894601', 'Тостер Bosch TAT 7A1', 6, 'Bosch'),
-        (30, '682690571', 'Тостер Tefal Toast & Go TT1', 6, 'Tefal')
-    ]
-    
-    all_products = smartphones + laptops + headphones + kitchen
-    
-    for product in all_products:
-        products.append({
-            'id': product[0],
-            'article': product[1],
-            'name': product[2],
-            'category_id': product[3],
-            'brand': product[4],
-            'image_url': f"/images/product_{product[0]}.jpg",
-            'description': f"Описание товара {product[2]}"
-        })
-    
-    return pd.DataFrame(products)
-
-# Генерируем датасеты
-print("Генерация датасета товаров...")
-products_df = generate_products_dataset()
-
-print("Генерация истории цен на 90 дней...")
-price_history_df = generate_price_history(30, 90)
-
-# Сохраняем в CSV
-products_df.to_csv('products_dataset.csv', index=False, encoding='utf-8')
-price_history_df.to_csv('price_history_dataset.csv', index=False, encoding='utf-8')
-
-# Выводим статистику
-print(f"\n✅ Сгенерировано товаров: {len(products_df)}")
-print(f"✅ Сгенерировано записей истории цен: {len(price_history_df)}")
-print(f"✅ Период покрытия: {price_history_df['created_at'].min()} - {price_history_df['created_at'].max()}")
-
-# Показываем пример данных
-print("\nПример товаров:")
-print(products_df.head(3).to_string(index=False))
-
-print("\nПример истории цен:")
-print(price_history_df.head(5).to_string(index=False))
-
-# Аналитика по ценам
-print(f"\n📊 Статистика цен:")
-print(f"Средняя цена: {price_history_df['price'].mean():.2f} руб.")
-print(f"Минимальная цена: {price_history_df['price'].min():.2f} руб.")
-print(f"Максимальная цена: {price_history_df['price'].max():.2f} руб.")
-print(f"Стандартное отклонение: {price_history_df['price'].std():.2f} руб.")
\ No newline at end of file
+"""
+Генератор синтетического датасета: товары и история цен
+Безопасен для импорта; генерация запускается из командной строки:
+
+    python dtasetik.py --products 100000 --days 100 --seed 42 --format npy
+"""
+import os
+import sys
+import pandas as pd
+import numpy as np
+from datetime import datetime, timedelta
+from typing import Dict, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+CSV_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+# Базовые цены для разных категорий товаров (в рублях)
+BASE_PRICES = {
+    2: 50000,  # Смартфоны
+    3: 80000,  # Ноутбуки
+    4: 15000,  # Наушники
+    6: 5000    # Техника для кухни
+}
+
+CATEGORY_NAMES = {
+    2: 'Смартфон',
+    3: 'Ноутбук',
+    4: 'Наушники',
+    6: 'Техника для кухни'
+}
+
+
+def product_categories(product_ids: np.ndarray) -> np.ndarray:
+    """
+    Категория товара по ID
+    
+    1-7 - смартфоны, 8-14 - ноутбуки, 15-20 - наушники, 21-30 - кухня;
+    для каталога больше 30 товаров раскладка повторяется.
+    """
+    position = (np.asarray(product_ids) - 1) % 30 + 1
+    return np.select(
+        [position <= 7, position <= 14, position <= 20],
+        [2, 3, 4],
+        default=6
+    )
+
+
+def generate_price_matrix(
+    products_count: int = 30,
+    days: int = 90,
+    seed: int = None,
+    start_date: datetime = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Цены всех товаров за все дни - матрица (products_count, days)
+    
+    Случайное блуждание, сезонность по дням недели, акции, ограничение
+    снизу и округление считаются векторно по всем товарам; цикл - только
+    по дням, так как цена дня зависит от цены предыдущего.
+    
+    Returns:
+        (prices, dates) - prices (products_count, days), dates (days,) datetime64[s]
+    """
+    rng = np.random.default_rng(seed)
+    
+    # Дата начала отслеживания
+    if start_date is None:
+        start_date = datetime.now() - timedelta(days=days)
+    start = np.datetime64(start_date.replace(microsecond=0), 's')
+    dates = start + np.arange(days) * np.timedelta64(1, 'D')
+    weekdays = (start_date.weekday() + np.arange(days)) % 7
+    
+    # Сезонные эффекты (пятница/выходные - рост, понедельник - спад)
+    seasonal = np.where(weekdays >= 4, 0.01, np.where(weekdays == 0, -0.005, 0.0))
+    
+    # Базовая цена с вариациями
+    categories = product_categories(np.arange(1, products_count + 1))
+    base_price = np.vectorize(BASE_PRICES.get)(categories) * rng.uniform(0.8, 1.2, products_count)
+    floor = base_price * 0.5
+    
+    prices = np.empty((products_count, days), dtype=np.float64)
+    current_price = base_price.copy()
+    
+    for day in range(days):
+        # Генерируем изменение цены: среднее 0%, std 2%
+        change_percent = rng.normal(0, 0.02, products_count) + seasonal[day]
+        
+        # Случайные акции и распродажи: 5% вероятность, скидка 10-30%
+        promo = rng.random(products_count) < 0.05
+        change_percent -= np.where(promo, rng.uniform(0.1, 0.3, products_count), 0.0)
+        
+        # Применяем изменение цены
+        current_price = current_price * (1 + change_percent)
+        
+        # Ограничиваем минимальную цену (не менее 50% от базовой)
+        np.maximum(current_price, floor, out=current_price)
+        
+        # Округляем до кратного 10 рублям
+        current_price = np.round(current_price / 10) * 10
+        prices[:, day] = current_price
+    
+    return prices, dates
+
+
+def price_history_columns(prices: np.ndarray, dates: np.ndarray) -> Dict[str, np.ndarray]:
+    """Матрица цен -> колонки истории (строки по товарам, внутри - по дням)"""
+    products_count, days = prices.shape
+    return {
+        'id': np.arange(1, products_count * days + 1, dtype=np.int64),
+        'product_id': np.repeat(np.arange(1, products_count + 1, dtype=np.int32), days),
+        'price': prices.ravel(),
+        'created_at': np.tile(dates, products_count)
+    }
+
+
+def generate_price_history(products_count=30, days=90, seed=None, start_date=None):
+    """
+    Генерирует историю цен для товаров на 90 дней
+    """
+    prices, dates = generate_price_matrix(products_count, days, seed, start_date)
+    df = pd.DataFrame(price_history_columns(prices, dates))
+    df['created_at'] = df['created_at'].dt.strftime(CSV_DATE_FORMAT)
+    return df
+
+
+def _digits(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Неотрицательные целые -> ASCII-цифры (n, ширина) и маска значащих цифр
+
+    Ширина - по наибольшему числу; ведущие нули маска отбрасывает,
+    одна цифра остаётся всегда (ноль пишется как "0").
+    """
+    values = np.asarray(values)
+    top = int(values.max()) if len(values) else 0
+    values = values.astype(np.uint32 if top < 2 ** 32 else np.uint64)
+    width = len(str(top))
+    digits = np.empty((len(values), width), dtype=np.uint8)
+    mask = np.ones((len(values), width), dtype=bool)
+    rest = values.copy()
+    for k in range(width):
+        column = width - 1 - k
+        digits[:, column] = rest % 10
+        rest //= 10
+        if k:
+            mask[:, column] = values >= 10 ** k
+    digits += ord('0')
+    return digits, mask
+
+
+def write_price_history_csv(path: str, prices: np.ndarray, dates: np.ndarray, chunk_rows: int = 1_000_000) -> None:
+    """
+    Запись истории в CSV блоками товаров
+    
+    Строки блока собираются в матрицу байтов (строка CSV - строка матрицы
+    фиксированной ширины): цифры id и цены - целочисленной арифметикой,
+    product_id - один раз на товар, даты - один раз на день. Маска
+    отбрасывает ведущие нули, и блок уходит в файл одним tobytes() - без
+    строковых операций на каждую запись. Цены генератора кратны 10,
+    поэтому пишутся как целое + ".0"; формат совпадает с DataFrame.to_csv.
+    
+    10M строк - несколько секунд; быстрее всего - хранилище npy
+    (write_price_history_store, --format npy), где нет текста вовсе.
+    """
+    products_count, days = prices.shape
+    date_strings = pd.Series(dates).dt.strftime(CSV_DATE_FORMAT).to_numpy().astype('S')
+    date_bytes = np.frombuffer(b''.join(date_strings), dtype=np.uint8).reshape(days, -1)
+    chunk_products = max(1, chunk_rows // max(days, 1))
+    
+    with open(path, 'wb') as f:
+        f.write(b'id,product_id,price,created_at\n')
+        for lo in range(0, products_count, chunk_products):
+            hi = min(lo + chunk_products, products_count)
+            ids = _digits(np.arange(lo * days + 1, hi * days + 1, dtype=np.int64))
+            product_ids = _digits(np.arange(lo + 1, hi + 1, dtype=np.int64))
+            chunk_prices = _digits(prices[lo:hi].ravel().astype(np.int64))
+            
+            # (ширина, заполнение) полей строки по порядку
+            fields = [
+                (ids[0].shape[1], lambda: ids),
+                (1, b','),
+                (product_ids[0].shape[1],
+                 lambda: (np.repeat(product_ids[0], days, axis=0), np.repeat(product_ids[1], days, axis=0))),
+                (1, b','),
+                (chunk_prices[0].shape[1], lambda: chunk_prices),
+                (3, b'.0,'),
+                (date_bytes.shape[1], lambda: (np.tile(date_bytes, (hi - lo, 1)), True)),
+                (1, b'\n'),
+            ]
+            rows = (hi - lo) * days
+            line = np.empty((rows, sum(width for width, _ in fields)), dtype=np.uint8)
+            mask = np.ones(line.shape, dtype=bool)
+            col = 0
+            for width, fill in fields:
+                if isinstance(fill, bytes):
+                    line[:, col:col + width] = np.frombuffer(fill, dtype=np.uint8)
+                else:
+                    block, valid = fill()
+                    line[:, col:col + width] = block
+                    mask[:, col:col + width] = valid
+                col += width
+            f.write(line[mask].tobytes())
+
+
+def write_price_history_store(path: str, prices: np.ndarray, dates: np.ndarray) -> None:
+    """Запись истории в колоночное хранилище (storage.history_store)"""
+    from storage.history_store import HistoryStore
+    
+    columns = price_history_columns(prices, dates)
+    HistoryStore.write(
+        path,
+        ids=columns['id'],
+        product_ids=columns['product_id'],
+        prices=columns['price'],
+        created_at=columns['created_at'].astype(np.int64)
+    )
+
+def generate_products_dataset(products_count=30):
+    """
+    Создает датасет товаров (уже предоставлен в задании)
+    
+    Товары сверх 30 для нагрузочных тестов получают обезличенные имена.
+    """
+    products = []
+    
+    # Смартфоны (1-7)
+    smartphones = [
+        (1, '482159736', 'Смартфон iPhone 15 128GB', 2, 'Apple'),
+        (2, '5938472610', 'Смартфон iPhone 15 256GB', 2, 'Apple'),
+        (3, '620184735', 'Смартфон Samsung Galaxy S24 128GB', 2, 'Samsung'),
+        (4, '7493825160', 'Смартфон Samsung Galaxy S23 256GB', 2, 'Samsung'),
+        (5, '815937402', 'Смартфон Xiaomi 13 Lite 128GB', 2, 'Xiaomi'),
+        (6, '9264738151', 'Смартфон Xiaomi Redmi Note 12 128GB', 2, 'Xiaomi'),
+        (7, '1038574926', 'Смартфон OPPO Reno 10 256GB', 2, 'OPPO')
+    ]
+    
+    # Ноутбуки (8-14)
+    laptops = [
+        (8, '284619537', 'Ноутбук MacBook Pro 14" M3 512GB', 3, 'Apple'),
+        (9, '3957281640', 'Ноутбук MacBook Air 13" M2 256GB', 3, 'Apple'),
+        (10, '462839175', 'Ноутбук ASUS VivoBook 15 i5 512GB', 3, 'ASUS'),
+        (11, '5739462810', 'Ноутбук ASUS ZenBook 13 i7 1TB', 3, 'ASUS'),
+        (12, '684157392', 'Ноутбук Lenovo IdeaPad 5 i5 512GB', 3, 'Lenovo'),
+        (13, '7952684031', 'Ноутбук Lenovo ThinkPad T14 i7 512GB', 3, 'Lenovo'),
+        (14, '826394715', 'Ноутбук HP Envy 13 i5 512GB', 3, 'HP')
+    ]
+    
+    # Наушники (15-20)
+    headphones = [
+        (15, '9374851260', 'Наушники AirPods Pro 2', 4, 'Apple'),
+        (16, '148259637', 'Наушники AirPods 3', 4, 'Apple'),
+        (17, '2593671480', 'Наушники Sony WH-1000XM5', 4, 'Sony'),
+        (18, '360478259', 'Наушники Sony LinkBuds S', 4, 'Sony'),
+        (19, '4715893601', 'Наушники Samsung Galaxy Buds2 Pro', 4, 'Samsung'),
+        (20, '582690471', 'Наушники JBL Tune 770NC', 4, 'JBL')
+    ]
+    
+    # Техника для кухни (21-30)
+    kitchen = [
+        (21, '6937015820', 'Электрочайник Philips HD9359 1.7L', 6, 'Philips'),
+        (22, '704812693', 'Электрочайник Tefal KO851 1.7L', 6, 'Tefal'),
+        (23, '8159237041', 'Электрочайник Bosch TWK 550', 6, 'Bosch'),
+        (24, '926034815', 'Блендер Braun Multiquick 7 MQ 7045', 6, 'Braun'),
+        (25, '1371459260', 'Блендер Philips HR3556 2L', 6, 'Philips'),
+        (26, '248256137', 'Блендер Moulinex LM935 1.5L', 6, 'Moulinex'),
+        (27, '3593672480', 'Кофеварка DeLonghi ECAM 320', 6, 'DeLonghi'),
+        (28, '460478359', 'Кофеварка Philips EP5400', 6, 'Philips'),
+        (29, '5715894601', 'Тостер Bosch TAT 7A1', 6, 'Bosch'),
+        (30, '682690571', 'Тостер Tefal Toast & Go TT1', 6, 'Tefal')
+    ]
+    
+    all_products = (smartphones + laptops + headphones + kitchen)[:products_count]
+    
+    extra_ids = np.arange(len(all_products) + 1, products_count + 1)
+    for product_id, category_id in zip(extra_ids.tolist(), product_categories(extra_ids).tolist()):
+        all_products.append((
+            product_id, str(100000000 + product_id),
+            f"{CATEGORY_NAMES[category_id]} #{product_id}", category_id, 'Generic'
+        ))
+    
+    for product in all_products:
+        products.append({
+            'id': product[0],
+            'article': product[1],
+            'name': product[2],
+            'category_id': product[3],
+            'brand': product[4],
+            'image_url': f"/images/product_{product[0]}.jpg",
+            'description': f"Описание товара {product[2]}"
+        })
+    
+    return pd.DataFrame(products)
+
+def main(argv=None):
+    import argparse
+    import time
+    
+    parser = argparse.ArgumentParser(description='Генерация синтетического датасета')
+    parser.add_argument('--products', type=int, default=30, help='Число товаров')
+    parser.add_argument('--days', type=int, default=90, help='Дней истории')
+    parser.add_argument('--seed', type=int, default=None, help='Seed генератора (воспроизводимость)')
+    parser.add_argument('--start-date', default=None, help='Дата начала (YYYY-MM-DD), по умолчанию - days дней назад')
+    parser.add_argument('--out-dir', default='.', help='Каталог для файлов')
+    parser.add_argument('--format', choices=['csv', 'npy', 'both'], default='csv',
+                        help='csv - price_history_dataset.csv, npy - хранилище price_history_store')
+    
+    args = parser.parse_args(argv)
+    start_date = datetime.fromisoformat(args.start_date) if args.start_date else None
+    os.makedirs(args.out_dir, exist_ok=True)
+    
+    # Генерируем датасеты
+    print("Генерация датасета товаров...")
+    products_df = generate_products_dataset(args.products)
+    
+    print(f"Генерация истории цен на {args.days} дней...")
+    started = time.perf_counter()
+    prices, dates = generate_price_matrix(args.products, args.days, args.seed, start_date)
+    generated = time.perf_counter()
+    
+    # Сохраняем
+    products_df.to_csv(os.path.join(args.out_dir, 'products_dataset.csv'), index=False, encoding='utf-8')
+    if args.format in ('csv', 'both'):
+        write_price_history_csv(os.path.join(args.out_dir, 'price_history_dataset.csv'), prices, dates)
+    if args.format in ('npy', 'both'):
+        write_price_history_store(os.path.join(args.out_dir, 'price_history_store'), prices, dates)
+    written = time.perf_counter()
+    
+    # Выводим статистику
+    print(f"\n✅ Сгенерировано товаров: {len(products_df)}")
+    print(f"✅ Сгенерировано записей истории цен: {prices.size}")
+    print(f"✅ Период покрытия: {dates[0]} - {dates[-1]}")
+    print(f"✅ Генерация: {generated - started:.2f}с, запись: {written - generated:.2f}с")
+    
+    # Показываем пример данных
+    print("\nПример товаров:")
+    print(products_df.head(3).to_string(index=False))
+    
+    print("\nПример истории цен:")
+    print(pd.DataFrame({
+        'product_id': np.ones(min(5, dates.size), dtype=int),
+        'price': prices[0, :5],
+        'created_at': dates[:5]
+    }).to_string(index=False))
+    
+    # Аналитика по ценам
+    print(f"\n📊 Статистика цен:")
+    print(f"Средняя цена: {prices.mean():.2f} руб.")
+    print(f"Минимальная цена: {prices.min():.2f} руб.")
+    print(f"Максимальная цена: {prices.max():.2f} руб.")
+    print(f"Стандартное отклонение: {prices.std(ddof=1):.2f} руб.")
+
+
+if __name__ == "__main__":
+    main()
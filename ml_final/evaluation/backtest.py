@@ -0,0 +1,242 @@
+"""
+Бэктест с движущейся точкой отсечения (rolling origin)
+Каждая модель прогнозирует каждый товар из каждой точки отсечения
+диапазона; ошибки собираются в таблицу и распределения по товарам и моделям
+
+Окна обучения и теста - представления (sliding_window_view) одного
+непрерывного массива цен, без копирования рядов. Прогнозы всех точек
+отсечения считаются пакетами через predict_batch и оцениваются
+MetricsEvaluator.evaluate_batch - по матрице (прогнозы, horizon) за проход.
+"""
+import os
+import sys
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from models.forecast_models import get_model
+from evaluation.metrics import MetricsEvaluator
+
+
+PERCENTILES = (0.1, 0.5, 0.9)
+
+
+@dataclass
+class BacktestResult:
+    """
+    Результат бэктеста
+
+    table - строка на (товар, модель, точка отсечения): cutoff - число точек
+    обучения, cutoff_date - дата последней точки обучения.
+    """
+    table: pd.DataFrame
+    horizon: int
+    elapsed: float
+
+    def by_model(self) -> pd.DataFrame:
+        """Распределение ошибок по моделям"""
+        return _summarize(self.table, ["model"])
+
+    def by_product(self) -> pd.DataFrame:
+        """Распределение ошибок по товарам и моделям"""
+        return _summarize(self.table, ["product_id", "model"])
+
+    def best_models(self) -> pd.Series:
+        """Модель с наименьшей медианой MAPE для каждого товара"""
+        summary = self.by_product().reset_index()
+        best = summary.loc[summary.groupby("product_id")["mape_p50"].idxmin()]
+        return best.set_index("product_id")["model"]
+
+    def to_dict(self) -> Dict:
+        return {
+            "horizon": self.horizon,
+            "forecasts": len(self.table),
+            "products": int(self.table["product_id"].nunique()) if len(self.table) else 0,
+            "elapsed": round(self.elapsed, 3),
+            "models": self.by_model().round(2).to_dict(orient="index")
+        }
+
+
+def _summarize(table: pd.DataFrame, keys: List[str]) -> pd.DataFrame:
+    grouped = table.groupby(keys, sort=True)
+    summary = grouped["mape"].agg(["count", "mean", "std"]).rename(
+        columns={"count": "forecasts", "mean": "mape_mean", "std": "mape_std"}
+    )
+    quantiles = grouped["mape"].quantile(list(PERCENTILES)).unstack()
+    quantiles.columns = [f"mape_p{int(q * 100)}" for q in PERCENTILES]
+    summary = summary.join(quantiles)
+    summary["direction_accuracy"] = grouped["direction_accuracy"].mean()
+    summary["forecast_7d_quality"] = grouped["forecast_7d_quality"].mean() * 100
+    return summary
+
+
+class Backtester:
+    """
+    Walk-forward оценка моделей
+
+    Для товара длины n точки отсечения c идут от min_train до n - horizon
+    с шагом step (max_cutoffs - только последние). Обучение - все точки до c
+    (window=None) или последние window точек, тест - точки c..c+horizon.
+    """
+
+    def __init__(
+        self,
+        model_types: Sequence[str] = ("naive", "ma", "linear"),
+        horizon: int = 7,
+        min_train: int = 14,
+        step: int = 1,
+        window: Optional[int] = None,
+        max_cutoffs: Optional[int] = None,
+        batch_bytes: int = 64 * 1024 * 1024
+    ):
+        """
+        Args:
+            model_types: Типы моделей (get_model)
+            horizon: Горизонт теста (дней)
+            min_train: Минимум точек обучения (первая точка отсечения)
+            step: Шаг между точками отсечения
+            window: Фиксированное окно обучения (None - расширяющееся)
+            max_cutoffs: Не больше стольких последних точек отсечения на товар
+            batch_bytes: Объём матрицы обучения одного пакета predict_batch
+        """
+        self.model_types = list(model_types)
+        self.horizon = horizon
+        self.min_train = max(min_train, window or 0)
+        self.step = step
+        self.window = window
+        self.max_cutoffs = max_cutoffs
+        self.batch_bytes = batch_bytes
+
+    def cutoffs(self, lengths: np.ndarray):
+        """
+        Все пары (товар, точка отсечения)
+
+        Returns:
+            (positions, cutoffs) - номер товара и число точек обучения
+        """
+        lengths = np.asarray(lengths, dtype=np.int64)
+        last = lengths - self.horizon
+        count = np.where(last >= self.min_train, (last - self.min_train) // self.step + 1, 0)
+        if self.max_cutoffs is not None:
+            count = np.minimum(count, self.max_cutoffs)
+
+        positions = np.repeat(np.arange(len(lengths)), count)
+        # Отсчёт от последней точки, чтобы max_cutoffs оставлял самые свежие
+        rank = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+        cutoffs = np.repeat(last, count) - rank * self.step
+        return positions, cutoffs
+
+    def run(self, history) -> BacktestResult:
+        """
+        Args:
+            history: CompactHistory или GroupedHistory (дневные ряды)
+        """
+        start = time.perf_counter()
+        offsets = np.asarray(history.offsets, dtype=np.int64)
+        offsets = offsets - offsets[0]
+        lengths = np.diff(offsets)
+        positions, cutoffs = self.cutoffs(lengths)
+
+        # Непрерывный массив цен с хвостом, чтобы окна у конца были определены
+        width = self.window or (int(lengths.max()) if len(lengths) else 1)
+        values = np.asarray(history.prices, dtype=np.float64)[:offsets[-1]]
+        values = np.concatenate([values, np.full(max(width, self.horizon), np.nan)])
+        train_windows = sliding_window_view(values, width)
+        test_windows = sliding_window_view(values, self.horizon)
+
+        # Строки окон: начало обучения и начало теста в общем массиве
+        test_start = offsets[positions] + cutoffs
+        if self.window is None:
+            train_start, train_len = offsets[positions], cutoffs
+        else:
+            train_start, train_len = test_start - self.window, np.full(len(cutoffs), self.window)
+
+        dates = np.asarray(history.created_at).astype('datetime64[s]')
+        product_ids = np.asarray(history.product_ids)
+        rows_per_batch = max(1, self.batch_bytes // (width * 8))
+
+        frames = []
+        for model_type in self.model_types:
+            model = get_model(model_type)
+            valid = np.flatnonzero(train_len >= model.min_points)
+
+            for lo in range(0, len(valid), rows_per_batch):
+                rows = valid[lo:lo + rows_per_batch]
+                train = train_windows[train_start[rows]]
+                actual = test_windows[test_start[rows]]
+
+                batch = model.predict_batch(train, train_len[rows], days_ahead=self.horizon)
+                inference_time = batch.inference_time / len(rows)
+
+                metrics = MetricsEvaluator.evaluate_batch(actual, batch.predictions, inference_time)
+                frames.append(pd.DataFrame({
+                    "product_id": product_ids[positions[rows]],
+                    "model": model.name,
+                    "cutoff": cutoffs[rows],
+                    "cutoff_date": dates[test_start[rows] - 1],
+                    "mape": metrics.mape,
+                    "direction_accuracy": metrics.direction_accuracy,
+                    "forecast_7d_quality": metrics.forecast_7d_quality,
+                }))
+
+        table = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(
+            columns=["product_id", "model", "cutoff", "cutoff_date",
+                     "mape", "direction_accuracy", "forecast_7d_quality"]
+        )
+        return BacktestResult(table=table, horizon=self.horizon, elapsed=time.perf_counter() - start)
+
+
+# ============================================================================
+# ГЛАВНАЯ ФУНКЦИЯ
+# ============================================================================
+
+if __name__ == "__main__":
+    import argparse
+
+    from evaluation.test_on_dataset import load_dataset
+
+    parser = argparse.ArgumentParser(description='Бэктест моделей с движущейся точкой отсечения')
+    parser.add_argument('--models', nargs='+', default=['naive', 'ma', 'linear'], help='Типы моделей')
+    parser.add_argument('--horizon', type=int, default=7, help='Горизонт теста (дней)')
+    parser.add_argument('--min-train', type=int, default=14, help='Минимум точек обучения')
+    parser.add_argument('--step', type=int, default=1, help='Шаг точек отсечения')
+    parser.add_argument('--window', type=int, default=None, help='Фиксированное окно обучения')
+    parser.add_argument('--max-cutoffs', type=int, default=None, help='Последних точек отсечения на товар')
+    parser.add_argument('--out', default=None, help='CSV с таблицей результатов')
+    parser.add_argument('--by-product', default=None, help='CSV с распределениями по товарам')
+
+    args = parser.parse_args()
+
+    history, _ = load_dataset()
+    backtester = Backtester(
+        model_types=args.models,
+        horizon=args.horizon,
+        min_train=args.min_train,
+        step=args.step,
+        window=args.window,
+        max_cutoffs=args.max_cutoffs
+    )
+    result = backtester.run(history)
+
+    print(f"✅ Прогнозов: {len(result.table)} (товаров {len(history)}, "
+          f"моделей {len(args.models)}) за {result.elapsed:.3f}с")
+    print("\n📊 MAPE по моделям:")
+    print(result.by_model().round(2).to_string())
+
+    best = result.best_models().value_counts()
+    print("\n🏆 Лучшая модель по товарам:")
+    for model_name, count in best.items():
+        print(f"  {model_name}: {count}")
+
+    if args.out:
+        result.table.to_csv(args.out, index=False)
+        print(f"\n💾 Таблица: {args.out}")
+    if args.by_product:
+        result.by_product().to_csv(args.by_product)
+        print(f"💾 По товарам: {args.by_product}")
@@ -0,0 +1,402 @@
+"""
+Бенчмарки ML-компонентов на синтетическом каталоге
+Модели, ConfidenceCalculator, RecommendationEngine, MLForecastService
+и загрузка истории на сетке (товары × длина истории)
+
+Результаты сохраняются в JSON; режим сравнения сверяет прогон с базовым
+файлом и отмечает замедления сверх порога.
+
+Использование:
+    python evaluation/benchmark.py --out bench.json
+    python evaluation/benchmark.py --products 1 1000 --days 30 90 --out new.json --compare bench.json
+    python evaluation/benchmark.py --compare bench.json --current new.json
+"""
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from data.dtasetik import generate_price_matrix, write_price_history_csv, write_price_history_store
+from evaluation.metrics import MetricsResult
+from ml_service import MLForecastService
+from models.forecast_models import get_model
+from services.confidence import ConfidenceCalculator
+from services.recommendations import RecommendationEngine
+from storage.compact_history import CompactHistory
+from storage.grouped_history import GroupedHistory
+
+
+PRODUCTS = (1, 1000, 100_000)
+DAYS = (30, 90, 365)
+MODEL_TYPES = ("naive", "ma", "linear")
+BENCHMARKS = ("models", "confidence", "recommendations", "service", "loading")
+
+# Максимум товаров в одном вызове generate_forecast_batch (ответы - словари)
+SERVICE_CHUNK = 10_000
+
+
+@dataclass
+class BenchmarkResult:
+    """Замер одной операции в одной ячейке сетки"""
+    name: str
+    products: int
+    days: int
+    items: int               # Сколько товаров обработано за один прогон
+    repeat: int
+    min: float               # Секунды на прогон
+    median: float
+    mean: float
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}@{self.products}x{self.days}"
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        data["per_item_us"] = round(self.median / max(self.items, 1) * 1e6, 3)
+        return data
+
+
+def time_call(fn: Callable[[], object], repeat: int = 3, warmup: int = 1) -> List[float]:
+    """Время repeat прогонов fn после warmup холостых"""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+class BenchmarkCase:
+    """
+    Данные одной ячейки сетки: матрица цен (products, days) и даты
+
+    Раскладки для разных API строятся из одной матрицы; файлы для
+    бенчмарка загрузки пишутся во временный каталог по требованию.
+    """
+
+    def __init__(self, products: int, days: int, seed: int = 42, sample: int = 1000):
+        self.products = products
+        self.days = days
+        self.prices, self.dates = generate_price_matrix(
+            products, days, seed=seed, start_date=datetime(2025, 1, 1)
+        )
+        self.lengths = np.full(products, days, dtype=np.int64)
+        self.last_dates = [self.dates[-1].astype('datetime64[us]').item()] * products
+        self.series_dates = self.dates.astype('datetime64[us]').tolist()
+        # Поштучные вызовы меряются на первых sample товарах
+        self.sample = min(sample, products)
+        self._tmp = None
+
+    def history(self) -> GroupedHistory:
+        return GroupedHistory.from_series(list(self.prices), last_dates=self.last_dates)
+
+    def files(self) -> Dict[str, str]:
+        """CSV и колоночное хранилище ячейки"""
+        if self._tmp is None:
+            self._tmp = tempfile.mkdtemp(prefix="bench-")
+            write_price_history_csv(os.path.join(self._tmp, "history.csv"), self.prices, self.dates)
+            write_price_history_store(os.path.join(self._tmp, "store"), self.prices, self.dates)
+        return {
+            "csv": os.path.join(self._tmp, "history.csv"),
+            "store": os.path.join(self._tmp, "store")
+        }
+
+    def close(self) -> None:
+        if self._tmp is not None:
+            shutil.rmtree(self._tmp, ignore_errors=True)
+            self._tmp = None
+
+
+# ============================================================================
+# БЕНЧМАРКИ
+# ============================================================================
+
+def bench_models(case: BenchmarkCase) -> Dict[str, tuple]:
+    """predict_batch на всём каталоге и predict на выборке"""
+    cases = {}
+    for model_type in MODEL_TYPES:
+        model = get_model(model_type)
+        if case.days < model.min_points:
+            continue
+        cases[f"model.{model_type}.batch"] = (
+            case.products,
+            lambda m=model: m.predict_batch(case.prices, case.lengths, days_ahead=30)
+        )
+        cases[f"model.{model_type}.single"] = (
+            case.sample,
+            lambda m=model: [
+                m.predict(case.prices[i], case.series_dates, days_ahead=30) for i in range(case.sample)
+            ]
+        )
+    return cases
+
+
+def bench_confidence(case: BenchmarkCase) -> Dict[str, tuple]:
+    return {
+        "confidence.batch": (
+            case.products,
+            lambda: ConfidenceCalculator.calculate_confidence_batch(case.prices, case.lengths, mape=10.0)
+        ),
+        "confidence.single": (
+            case.sample,
+            lambda: [
+                ConfidenceCalculator.calculate_confidence(case.prices[i], mape=10.0)
+                for i in range(case.sample)
+            ]
+        ),
+    }
+
+
+def bench_recommendations(case: BenchmarkCase) -> Dict[str, tuple]:
+    last = case.prices[:, -1].tolist()
+    forecast_7d = (case.prices[:, -1] * 1.01).tolist()
+    forecast_30d = (case.prices[:, -1] * 1.03).tolist()
+    return {
+        "recommendations": (
+            case.sample,
+            lambda: [
+                RecommendationEngine.generate_recommendations(
+                    current_price=last[i],
+                    forecast_7d=forecast_7d[i],
+                    forecast_30d=forecast_30d[i],
+                    confidence=0.8,
+                    volatility=0.05
+                )
+                for i in range(case.sample)
+            ]
+        ),
+    }
+
+
+def bench_service(case: BenchmarkCase) -> Dict[str, tuple]:
+    service = MLForecastService(model_type="linear")
+    history = case.history()
+
+    def batch():
+        for lo in range(0, case.products, SERVICE_CHUNK):
+            service.generate_forecast_batch(
+                history=history.slice(lo, min(lo + SERVICE_CHUNK, case.products)),
+                scenarios=["optimist", "pessimist"]
+            )
+
+    return {
+        "service.generate_forecast": (
+            case.sample,
+            lambda: [
+                service.generate_forecast(case.prices[i], case.series_dates, forecast_days=7)
+                for i in range(case.sample)
+            ]
+        ),
+        "service.generate_forecast_batch": (case.products, batch),
+    }
+
+
+def bench_loading(case: BenchmarkCase) -> Dict[str, tuple]:
+    files = case.files()
+    return {
+        "loading.csv": (case.products, lambda: GroupedHistory.load(files["csv"])),
+        "loading.store": (case.products, lambda: GroupedHistory.load(files["store"])),
+        "loading.compact": (case.products, lambda: CompactHistory.load(files["store"])),
+    }
+
+
+BENCHMARK_FUNCTIONS = {
+    "models": bench_models,
+    "confidence": bench_confidence,
+    "recommendations": bench_recommendations,
+    "service": bench_service,
+    "loading": bench_loading,
+}
+
+
+# ============================================================================
+# ЗАПУСК И СРАВНЕНИЕ
+# ============================================================================
+
+def run_suite(
+    products: Sequence[int] = PRODUCTS,
+    days: Sequence[int] = DAYS,
+    benchmarks: Sequence[str] = BENCHMARKS,
+    repeat: int = 3,
+    sample: int = 1000,
+    seed: int = 42,
+    verbose: bool = True
+) -> Dict:
+    """
+    Прогон сетки products × days
+
+    Returns:
+        {"meta": {...}, "results": [BenchmarkResult.to_dict(), ...]}
+    """
+    results: List[BenchmarkResult] = []
+
+    for n_products in products:
+        for n_days in days:
+            case = BenchmarkCase(n_products, n_days, seed=seed, sample=sample)
+            try:
+                for group in benchmarks:
+                    for name, (items, fn) in BENCHMARK_FUNCTIONS[group](case).items():
+                        timings = time_call(fn, repeat=repeat)
+                        result = BenchmarkResult(
+                            name=name,
+                            products=n_products,
+                            days=n_days,
+                            items=items,
+                            repeat=repeat,
+                            min=min(timings),
+                            median=statistics.median(timings),
+                            mean=statistics.fmean(timings)
+                        )
+                        results.append(result)
+                        if verbose:
+                            print(f"  {result.key:45} {result.median * 1000:10.2f} мс "
+                                  f"({result.to_dict()['per_item_us']:.1f} мкс/товар)")
+            finally:
+                case.close()
+
+    return {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec='seconds'),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "products": list(products),
+            "days": list(days),
+            "benchmarks": list(benchmarks),
+            "repeat": repeat,
+            "sample": sample,
+            "seed": seed,
+            "time_target": MetricsResult.time_target
+        },
+        "results": [r.to_dict() for r in results]
+    }
+
+
+def check_targets(report: Dict) -> List[Dict]:
+    """Поштучный generate_forecast против MetricsResult.time_target"""
+    target = report["meta"].get("time_target", MetricsResult.time_target)
+    return [
+        {
+            "key": f"{r['name']}@{r['products']}x{r['days']}",
+            "seconds_per_call": r["median"] / max(r["items"], 1),
+            "ok": r["median"] / max(r["items"], 1) < target
+        }
+        for r in report["results"]
+        if r["name"] == "service.generate_forecast"
+    ]
+
+
+def compare(baseline: Dict, current: Dict, threshold: float = 0.2, min_seconds: float = 1e-3) -> List[Dict]:
+    """
+    Сравнение с базовым прогоном по медиане
+
+    Args:
+        threshold: Допустимое замедление (0.2 - на 20%)
+        min_seconds: Замеры короче этого не считаются регрессией (шум таймера)
+
+    Returns:
+        Строки сравнения: key, baseline, current, ratio, status
+        (regression / improvement / ok / new / missing)
+    """
+    def index(report):
+        return {f"{r['name']}@{r['products']}x{r['days']}": r for r in report["results"]}
+
+    base, cur = index(baseline), index(current)
+    rows = []
+    for key in sorted(set(base) | set(cur)):
+        if key not in cur:
+            rows.append({"key": key, "baseline": base[key]["median"], "current": None,
+                         "ratio": None, "status": "missing"})
+            continue
+        if key not in base:
+            rows.append({"key": key, "baseline": None, "current": cur[key]["median"],
+                         "ratio": None, "status": "new"})
+            continue
+
+        old, new = base[key]["median"], cur[key]["median"]
+        ratio = new / old if old > 0 else float('inf')
+        if ratio > 1 + threshold and new - old > min_seconds:
+            status = "regression"
+        elif ratio < 1 - threshold and old - new > min_seconds:
+            status = "improvement"
+        else:
+            status = "ok"
+        rows.append({"key": key, "baseline": old, "current": new, "ratio": ratio, "status": status})
+    return rows
+
+
+def main(argv: List[str] = None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Бенчмарки ML-компонентов')
+    parser.add_argument('--products', nargs='+', type=int, default=list(PRODUCTS), help='Размеры каталога')
+    parser.add_argument('--days', nargs='+', type=int, default=list(DAYS), help='Длины истории')
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, default=list(BENCHMARKS), help='Группы бенчмарков')
+    parser.add_argument('--repeat', type=int, default=3, help='Прогонов на замер')
+    parser.add_argument('--sample', type=int, default=1000, help='Товаров для поштучных вызовов')
+    parser.add_argument('--seed', type=int, default=42, help='Seed синтетических данных')
+    parser.add_argument('--out', default=None, help='JSON с результатами')
+    parser.add_argument('--compare', default=None, help='Базовый JSON для сравнения')
+    parser.add_argument('--current', default=None, help='Сравнить готовый JSON вместо нового прогона')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Допустимое замедление (0.2 = 20%%)')
+
+    args = parser.parse_args(argv)
+
+    if args.current:
+        with open(args.current, encoding='utf-8') as f:
+            report = json.load(f)
+    else:
+        print(f"⏱️  Сетка: товары {args.products} × дни {args.days}, прогонов {args.repeat}")
+        report = run_suite(
+            products=args.products,
+            days=args.days,
+            benchmarks=args.only,
+            repeat=args.repeat,
+            sample=args.sample,
+            seed=args.seed
+        )
+        if args.out:
+            with open(args.out, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+            print(f"\n💾 Результаты: {args.out}")
+
+    for target in check_targets(report):
+        mark = "✅" if target["ok"] else "❌"
+        print(f"{mark} {target['key']}: {target['seconds_per_call'] * 1000:.3f} мс на прогноз "
+              f"(цель: < {report['meta'].get('time_target', MetricsResult.time_target)}с)")
+
+    if not args.compare:
+        return 0
+
+    with open(args.compare, encoding='utf-8') as f:
+        baseline = json.load(f)
+    rows = compare(baseline, report, threshold=args.threshold)
+    marks = {"regression": "⚠️ ", "improvement": "🚀", "ok": "✅", "new": "🆕", "missing": "❔"}
+
+    print(f"\n📊 Сравнение с {args.compare} (порог {args.threshold:.0%}):")
+    for row in rows:
+        ratio = f"x{row['ratio']:.2f}" if row["ratio"] is not None else "-"
+        print(f"  {marks[row['status']]} {row['key']:45} {ratio:>8}  {row['status']}")
+
+    regressions = [r for r in rows if r["status"] == "regression"]
+    print(f"\n{'❌' if regressions else '✅'} Регрессий: {len(regressions)}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,7 +3,7 @@
 Согласно документу "Метрики для проверки алгоритмов"
 """
 import numpy as np
-from typing import List, Dict
+from typing import List, Dict, Union
 from dataclasses import dataclass
 
 
@@ -44,6 +44,52 @@ class MetricsResult:
         }
 
 
+@dataclass
+class BatchMetricsResult:
+    """
+    Метрики пакета прогнозов: по значению на строку матрицы (n_series, horizon)
+    
+    valid_points - точек, вошедших в MAPE строки (ненулевые и не пропущенные
+    фактические цены); строки без них получают MAPE 100%, как в calculate_mape.
+    """
+    mape: np.ndarray                 # (n,) MAPE строки, %
+    direction_accuracy: np.ndarray   # (n,) точность направления, %
+    forecast_7d_quality: np.ndarray  # (n,) bool
+    valid_points: np.ndarray         # (n,) int
+    
+    mape_target: float = 15.0
+    direction_target: float = 65.0
+    
+    def __len__(self) -> int:
+        return len(self.mape)
+    
+    @property
+    def scored(self) -> np.ndarray:
+        """Строки, в которых есть хотя бы одна фактическая цена"""
+        return self.valid_points > 0
+    
+    def summary(self) -> Dict:
+        """Агрегаты по оценённым строкам"""
+        scored = self.scored
+        n = int(scored.sum())
+        mape = self.mape[scored]
+        direction = self.direction_accuracy[scored]
+        return {
+            "series": len(self),
+            "scored": n,
+            "mape": float(mape.mean()) if n else 100.0,
+            "mape_median": float(np.median(mape)) if n else 100.0,
+            "mape_ok_share": float((mape < self.mape_target).mean() * 100) if n else 0.0,
+            "direction_accuracy": float(direction.mean()) if n else 0.0,
+            "direction_ok_share": float((direction > self.direction_target).mean() * 100) if n else 0.0,
+            "forecast_7d_quality_share": float(self.forecast_7d_quality[scored].mean() * 100) if n else 0.0
+        }
+    
+    def to_dict(self) -> dict:
+        return {key: round(value, 2) if isinstance(value, float) else value
+                for key, value in self.summary().items()}
+
+
 class MetricsEvaluator:
     """Класс для вычисления метрик"""
     
@@ -144,6 +190,111 @@ class MetricsEvaluator:
             inference_time=inference_time,
             forecast_7d_quality=forecast_7d
         )
+    
+    # ------------------------------------------------------------------
+    # Пакетные метрики: матрицы (n_series, horizon), одна строка - один прогноз
+    # ------------------------------------------------------------------
+    
+    @staticmethod
+    def _as_matrices(actual, predicted):
+        actual = np.asarray(actual, dtype=np.float64)
+        predicted = np.asarray(predicted, dtype=np.float64)
+        if actual.ndim == 1:
+            actual, predicted = actual[None, :], predicted.reshape(1, -1)
+        if actual.shape != predicted.shape or actual.ndim != 2:
+            raise ValueError("Матрицы actual и predicted должны быть одной формы (n_series, horizon)")
+        # Пропуски: NaN/inf в любой из матриц
+        present = np.isfinite(actual) & np.isfinite(predicted)
+        return actual, predicted, present
+    
+    @staticmethod
+    def _ape(actual: np.ndarray, predicted: np.ndarray, present: np.ndarray):
+        """APE в % (0 вне маски) и маска: нулевые и пропущенные цены исключаются"""
+        mask = present & (actual != 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ape = np.where(mask, np.abs((actual - predicted) / actual), 0.0) * 100
+        return ape, mask
+    
+    @staticmethod
+    def _direction_hits(actual: np.ndarray, predicted: np.ndarray, present: np.ndarray):
+        """Совпадения направления соседних шагов и маска пар без пропусков"""
+        pairs = present[:, 1:] & present[:, :-1]
+        hits = ((np.diff(actual, axis=1) > 0) == (np.diff(predicted, axis=1) > 0)) & pairs
+        return hits, pairs
+    
+    @staticmethod
+    def _row_mean(values: np.ndarray, mask: np.ndarray, empty: float):
+        count = mask.sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = values.sum(axis=1) / count
+        return np.where(count > 0, mean, empty), count
+    
+    @staticmethod
+    def calculate_mape_batch(actual, predicted) -> np.ndarray:
+        """
+        MAPE каждой строки матриц (n_series, horizon)
+        
+        Нулевые и пропущенные (NaN) фактические цены в строке не учитываются;
+        строка без значимых точек получает 100%.
+        """
+        actual, predicted, present = MetricsEvaluator._as_matrices(actual, predicted)
+        ape, mask = MetricsEvaluator._ape(actual, predicted, present)
+        return MetricsEvaluator._row_mean(ape, mask, 100.0)[0]
+    
+    @staticmethod
+    def calculate_direction_accuracy_batch(actual, predicted) -> np.ndarray:
+        """
+        Точность направления каждой строки (%)
+        
+        Учитываются только пары соседних дней без пропусков;
+        строка без таких пар получает 0%.
+        """
+        actual, predicted, present = MetricsEvaluator._as_matrices(actual, predicted)
+        hits, pairs = MetricsEvaluator._direction_hits(actual, predicted, present)
+        return MetricsEvaluator._row_mean(hits * 100.0, pairs, 0.0)[0]
+    
+    @staticmethod
+    def evaluate_batch(
+        actual,
+        predicted,
+        inference_time: Union[float, np.ndarray] = 0.0
+    ) -> BatchMetricsResult:
+        """
+        Полная оценка пакета прогнозов за один векторный проход
+        
+        На строках без пропусков значения совпадают с evaluate_model.
+        
+        Args:
+            actual: Фактические цены (n_series, horizon), NaN - пропуск
+            predicted: Прогнозы (n_series, horizon)
+            inference_time: Время прогноза - общее или по строкам
+        """
+        actual, predicted, present = MetricsEvaluator._as_matrices(actual, predicted)
+        ape, mask = MetricsEvaluator._ape(actual, predicted, present)
+        hits, pairs = MetricsEvaluator._direction_hits(actual, predicted, present)
+        
+        mape, valid_points = MetricsEvaluator._row_mean(ape, mask, 100.0)
+        direction, _ = MetricsEvaluator._row_mean(hits * 100.0, pairs, 0.0)
+        
+        # 7-дневный прогноз: первые 7 дней без пропусков, критерии evaluate_forecast_7d_quality
+        if actual.shape[1] >= 7:
+            mape_7d, _ = MetricsEvaluator._row_mean(ape[:, :7], mask[:, :7], 100.0)
+            direction_7d, _ = MetricsEvaluator._row_mean(hits[:, :6] * 100.0, pairs[:, :6], 0.0)
+            forecast_7d = (
+                present[:, :7].all(axis=1) &
+                (mape_7d < 12.0) &
+                (direction_7d > 60.0) &
+                (np.asarray(inference_time) < 2.0)
+            )
+        else:
+            forecast_7d = np.zeros(len(actual), dtype=bool)
+        
+        return BatchMetricsResult(
+            mape=mape,
+            direction_accuracy=direction,
+            forecast_7d_quality=forecast_7d,
+            valid_points=valid_points
+        )
 
 
 # ============================================================================
@@ -176,3 +327,13 @@ if __name__ == "__main__":
     print(f"\nJSON:")
     import json
     print(json.dumps(metrics.to_dict(), indent=2, ensure_ascii=False))
+    
+    # Пакетная оценка: та же пара строкой матрицы плюс строка с пропуском
+    batch = evaluator.evaluate_batch(
+        [actual, [100, 0, 105, np.nan, 107, 110, 108, 112]],
+        [predicted, predicted],
+        inference_time=0.05
+    )
+    print(f"\n📦 Пакет: MAPE по строкам {np.round(batch.mape, 2).tolist()}, "
+          f"направление {np.round(batch.direction_accuracy, 2).tolist()}")
+    print(json.dumps(batch.to_dict(), indent=2, ensure_ascii=False))
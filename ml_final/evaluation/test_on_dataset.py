@@ -12,23 +12,50 @@ from datetime import datetime
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
 from models.forecast_models import get_model, NaiveModel, MovingAverageModel, LinearExtrapolationModel
+from models.series_stats import SeriesStats
 from evaluation.metrics import MetricsEvaluator
 from services.confidence import ConfidenceCalculator
 from services.recommendations import RecommendationEngine, Scenario
+from storage.compact_history import CompactHistory
+from storage.grouped_history import GroupedHistory
+from storage.history_store import HistoryStore
+from storage.streaming import HistoryStream
 
 
 def load_dataset():
-    """Загрузка датасета"""
+    """
+    Загрузка датасета
+    
+    История разбирается и сортируется один раз и группируется по товарам.
+    Если рядом с CSV есть колоночное хранилище (data/price_history_store)
+    или SQLite-база (data/price_history.db), история читается из них
+    без разбора текста; CSV читается потоком (HistoryStream) и пакуется
+    по пакетам товаров, без DataFrame всей истории.
+    
+    История приводится к дневным барам (модели и разбиение на train/test
+    считают позицию в ряду номером дня) и упаковывается в CompactHistory.
+    
+    Returns:
+        (CompactHistory, DataFrame товаров)
+    """
     data_dir = os.path.join(os.path.dirname(__file__), '..', 'data')
     
-    price_history = pd.read_csv(os.path.join(data_dir, 'price_history_dataset.csv'))
+    store_dir = os.path.join(data_dir, 'price_history_store')
+    db_path = os.path.join(data_dir, 'price_history.db')
+    if HistoryStore.exists(store_dir):
+        price_history = CompactHistory.from_grouped(GroupedHistory.load(store_dir), fill="ffill")
+    elif os.path.exists(db_path):
+        price_history = CompactHistory.from_grouped(GroupedHistory.load(db_path), fill="ffill")
+    else:
+        stream = HistoryStream(os.path.join(data_dir, 'price_history_dataset.csv'))
+        price_history = CompactHistory.from_stream(stream, fill="ffill")
     products = pd.read_csv(os.path.join(data_dir, 'products_dataset.csv'))
     
     return price_history, products
 
 
 def test_model_on_product(
-    price_history_df: pd.DataFrame,
+    price_history: CompactHistory,
     product_id: int,
     model_type: str = "linear",
     test_days: int = 7
@@ -37,7 +64,7 @@ def test_model_on_product(
     Тестирование модели на одном товаре
     
     Args:
-        price_history_df: DataFrame с историей цен
+        price_history: История цен, сгруппированная по товарам
         product_id: ID товара
         model_type: Тип модели
         test_days: Сколько дней использовать для теста
@@ -45,30 +72,28 @@ def test_model_on_product(
     Returns:
         dict с результатами
     """
-    # Получаем историю цен товара
-    product_prices = price_history_df[price_history_df['product_id'] == product_id].copy()
-    product_prices['created_at'] = pd.to_datetime(product_prices['created_at'])
-    product_prices = product_prices.sort_values('created_at')
+    # Получаем историю цен товара (срезы общих массивов, без копий)
+    prices, dates = price_history.series(product_id)
     
-    if len(product_prices) < 14:
+    if len(prices) < 14:
         return None
     
     # Разделяем на обучение и тест
     # Берём последние test_days дней как тест, остальное - обучение
-    train_data = product_prices.iloc[:-test_days]
-    test_data = product_prices.iloc[-test_days:]
+    train_prices = prices[:-test_days]
+    train_dates = dates[:-test_days]
     
-    train_prices = train_data['price'].tolist()
-    train_dates = train_data['created_at'].tolist()
+    actual_prices = prices[-test_days:]
+    actual_dates = dates[-test_days:]
     
-    actual_prices = test_data['price'].tolist()
-    actual_dates = test_data['created_at'].tolist()
+    # Статистика обучающего ряда - одна на модель, уверенность и рекомендации
+    stats = SeriesStats.from_prices(train_prices)
     
     # Делаем прогноз
     model = get_model(model_type)
     
     try:
-        forecast = model.predict(train_prices, train_dates, days_ahead=test_days)
+        forecast = model.predict(train_prices, train_dates, days_ahead=test_days, stats=stats)
     except Exception as e:
         print(f"  ❌ Ошибка прогноза для товара {product_id}: {e}")
         return None
@@ -83,34 +108,22 @@ def test_model_on_product(
     )
     
     # Вычисляем уверенность
-    volatility = np.std(train_prices) / np.mean(train_prices) if train_prices else 0
-    
     confidence_result = ConfidenceCalculator.calculate_confidence(
         price_history=train_prices,
-        mape=metrics.mape
+        mape=metrics.mape,
+        stats=stats
     )
     
     # Генерируем рекомендации
-    current_price = train_prices[-1]
     forecast_7d = predicted_prices[min(6, len(predicted_prices)-1)]
     forecast_30d = forecast_7d * 1.02  # Упрощение для примера
     
-    rec_optimist = RecommendationEngine.generate_recommendation(
-        current_price=current_price,
-        forecast_7d=forecast_7d,
-        forecast_30d=forecast_30d,
-        confidence=confidence_result.final_confidence,
-        volatility=volatility,
-        scenario=Scenario.OPTIMIST
-    )
-    
-    rec_pessimist = RecommendationEngine.generate_recommendation(
-        current_price=current_price,
+    recommendations = RecommendationEngine.generate_recommendations(
+        current_price=stats.last_price,
         forecast_7d=forecast_7d,
         forecast_30d=forecast_30d,
         confidence=confidence_result.final_confidence,
-        volatility=volatility,
-        scenario=Scenario.PESSIMIST
+        volatility=stats.volatility
     )
     
     return {
@@ -118,8 +131,8 @@ def test_model_on_product(
         'model': model.name,
         'metrics': metrics,
         'confidence': confidence_result,
-        'recommendation_optimist': rec_optimist,
-        'recommendation_pessimist': rec_pessimist,
+        'recommendation_optimist': recommendations[Scenario.OPTIMIST],
+        'recommendation_pessimist': recommendations[Scenario.PESSIMIST],
         'actual_prices': actual_prices,
         'predicted_prices': predicted_prices
     }
@@ -136,7 +149,7 @@ def run_full_test():
     price_history, products = load_dataset()
     
     print(f"  Товаров: {len(products)}")
-    print(f"  Записей истории: {len(price_history)}")
+    print(f"  Записей истории: {price_history.n_records}")
     
     # Тестируем каждую модель
     models = ["naive", "ma", "linear"]
@@ -10,10 +10,26 @@ import numpy as np
 
 sys.path.insert(0, os.path.dirname(__file__))
 
-from models.forecast_models import get_model
+from models.forecast_models import get_model, to_padded, forecast_dates_batch, format_dates_iso
+from models.series_stats import SeriesStats
 from evaluation.metrics import MetricsEvaluator
 from services.confidence import ConfidenceCalculator
 from services.recommendations import RecommendationEngine, Scenario
+from services.forecast_cache import ForecastCache
+from services.error_store import DEFAULT_MAPE, ErrorStore
+from services.tracing import TRACER, spans_us
+
+
+def _as_datetime(value) -> datetime:
+    """datetime или numpy.datetime64 -> datetime"""
+    if isinstance(value, np.datetime64):
+        return value.astype('datetime64[us]').item()
+    return value
+
+
+def _with_spans(response: Dict, spans: Dict[str, int], items: int = 1) -> Dict:
+    """Копия ответа с замерами этапов в блоке metrics (кэш хранит ответ без них)"""
+    return {**response, "metrics": {**response["metrics"], "spans_us": spans_us(spans, items)}}
 
 
 class MLForecastService:
@@ -23,28 +39,60 @@ class MLForecastService:
     Это то, что будет вызываться из .NET backend
     """
     
-    def __init__(self, model_type: str = "linear"):
+    # Горизонт, который всегда считается моделью для 30-дневной оценки рекомендаций
+    RECOMMENDATION_HORIZON = 30
+    
+    def __init__(self, model_type: str = "linear", cache: ForecastCache = None, errors: ErrorStore = None):
         """
         Args:
             model_type: Тип модели ("naive", "ma", "linear")
+            cache: Кэш ответов (используется для запросов с product_id)
+            errors: Фактическая MAPE по товарам - для уверенности; выданные
+                прогнозы ставятся в нём на сверку (запросы с product_id)
         """
+        self.model_type = model_type
         self.model = get_model(model_type)
+        self.cache = cache
+        self.errors = errors
     
     def generate_forecast(
         self,
-        price_history: List[float],
-        dates: List[datetime],
+        price_history: List[float] = None,
+        dates: List[datetime] = None,
         scenario: str = "optimist",
-        forecast_days: int = 7
+        forecast_days: int = 7,
+        trend_state=None,
+        product_id: int = None,
+        history_version: str = None,
+        horizons: List[int] = None,
+        scenarios: List[str] = None,
+        history=None,
+        include_spans: bool = False
     ) -> Dict:
         """
         ГЛАВНАЯ ФУНКЦИЯ - Генерация полного прогноза
         
         Args:
-            price_history: История цен [50000, 51000, ...]
-            dates: Даты истории [datetime(...), ...]
-            scenario: "optimist" или "pessimist"
+            price_history: История цен [50000, 51000, ...] (список или ndarray)
+            dates: Даты истории [datetime(...), ...] или массив datetime64
+            scenario: "optimist", "pessimist" или "all" (все сценарии)
             forecast_days: Количество дней прогноза (7, 30, 90)
+            trend_state: Инкрементальное состояние тренда товара
+                (TrendAccumulator, например из PriceUpdater.trend_states)
+            product_id: ID товара - включает кэширование ответа
+            history_version: Версия истории для ключа кэша
+                (по умолчанию - дата последней цены и длина истории)
+            horizons: Несколько горизонтов за один вызов, например [7, 30, 90].
+                Модель строится один раз на максимальный горизонт, ответ
+                дополняется блоком "horizons" с ценой на конец каждого
+            scenarios: Несколько сценариев по одному прогнозу, например
+                ["optimist", "pessimist"]. Модель и уверенность считаются
+                один раз, ответ дополняется картой "recommendations"
+            history: CompactHistory / GroupedHistory каталога - вместо
+                price_history и dates берётся ряд товара product_id
+            include_spans: Добавить в "metrics" длительности этапов запроса
+                ("spans_us": fit, trend, dates, confidence, recommendation,
+                serialization - в микросекундах; trend и часть dates входят в fit)
         
         Returns:
             {
@@ -71,92 +119,422 @@ class MLForecastService:
                 }
             }
         """
+        args = (price_history, dates, scenario, forecast_days, trend_state,
+                product_id, history_version, horizons, scenarios, history)
+        if not include_spans:
+            return self._generate_forecast(*args)
+        
+        with TRACER.collect() as spans:
+            response = self._generate_forecast(*args)
+        return _with_spans(response, spans)
+    
+    def _generate_forecast(
+        self,
+        price_history,
+        dates,
+        scenario: str,
+        forecast_days: int,
+        trend_state,
+        product_id: int,
+        history_version: str,
+        horizons: List[int],
+        scenarios: List[str],
+        history
+    ) -> Dict:
+        """Тело generate_forecast (замеры этапов собирает вызывающий)"""
+        if history is not None:
+            if product_id is None:
+                raise ValueError("Для history нужен product_id")
+            price_history, dates = history.series(product_id)
         
-        if not price_history or not dates:
+        if price_history is None or dates is None or len(price_history) == 0 or len(dates) == 0:
             raise ValueError("История цен и даты не могут быть пустыми")
         
-        # 1. ПРОГНОЗ
-        forecast_result = self.model.predict(price_history, dates, days_ahead=forecast_days)
+        scenarios = self._resolve_scenarios(scenario, scenarios)
         
-        # 2. УВЕРЕННОСТЬ
-        volatility = np.std(price_history) / np.mean(price_history) if price_history else 0
+        cache_key = None
+        if self.cache is not None and product_id is not None:
+            if history_version is None:
+                history_version = f"{_as_datetime(dates[-1]).isoformat()}#{len(price_history)}"
+            horizon_key = ",".join(map(str, horizons)) if horizons else forecast_days
+            cache_key = ForecastCache.make_key(
+                product_id, history_version, self.model_type, horizon_key,
+                ",".join(scenarios) if scenarios else scenario
+            )
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        period_days, fit_days = self._fit_days(forecast_days, horizons)
+        
+        with TRACER.span("fit"):
+            # 0. СТАТИСТИКА РЯДА (один массив, одна регрессия на весь запрос)
+            stats = SeriesStats.from_prices(price_history, trend_state=trend_state)
+            
+            # 1. ПРОГНОЗ (одна модель на все горизонты, не меньше 30 дней для рекомендаций)
+            forecast_result = self.model.predict(
+                price_history, dates, days_ahead=fit_days, stats=stats
+            )
         
-        # Для MAPE используем упрощённую оценку на обучении
-        # (в реальности нужны исторические прогнозы)
-        estimated_mape = 10.0  # Оценочное значение, можно улучшить
+        with TRACER.span("dates"):
+            forecast_dates = format_dates_iso(forecast_result.dates[:period_days])
         
-        confidence_result = ConfidenceCalculator.calculate_confidence(
-            price_history=price_history,
-            mape=estimated_mape
+        # 2. УВЕРЕННОСТЬ
+        with TRACER.span("confidence"):
+            volatility = stats.volatility
+            
+            # Фактическая MAPE товара по прошлым прогнозам (O(1) из ErrorStore)
+            if self.errors is not None and product_id is not None:
+                estimated_mape = self.errors.mape(product_id, self.model_type)
+                self.errors.register(product_id, self.model_type, dates[-1], forecast_result.predictions)
+            else:
+                estimated_mape = DEFAULT_MAPE
+            
+            confidence_result = ConfidenceCalculator.calculate_confidence(
+                price_history=price_history,
+                mape=estimated_mape,
+                stats=stats
+            )
+        
+        # 3. РЕКОМЕНДАЦИИ + 4. ФОРМИРУЕМ РЕЗУЛЬТАТ
+        response = self._build_response(
+            current_price=stats.last_price,
+            predictions=forecast_result.predictions,
+            forecast_dates=forecast_dates,
+            trend=forecast_result.trend,
+            forecast_days=period_days,
+            inference_time=forecast_result.inference_time,
+            model_name=forecast_result.model_name,
+            confidence_result=confidence_result,
+            volatility=volatility,
+            scenario=scenario,
+            horizons=horizons,
+            scenarios=scenarios
         )
         
-        # 3. РЕКОМЕНДАЦИИ
-        current_price = price_history[-1]
+        if cache_key is not None:
+            self.cache.put(cache_key, response)
+        return response
+    
+    def generate_forecast_batch(
+        self,
+        last_dates: List[datetime] = None,
+        prices: np.ndarray = None,
+        lengths: np.ndarray = None,
+        values: np.ndarray = None,
+        offsets: np.ndarray = None,
+        scenario: str = "optimist",
+        forecast_days: int = 7,
+        horizons: List[int] = None,
+        scenarios: List[str] = None,
+        history=None,
+        product_ids: List[int] = None,
+        include_spans: bool = False
+    ) -> List[Dict]:
+        """
+        Пакетная генерация прогнозов для многих товаров за один вызов
         
-        # Прогнозы на разные периоды
-        forecast_7d = forecast_result.predictions[min(6, len(forecast_result.predictions)-1)]
+        Принимает одну из раскладок:
+        - prices (n, max_len) + lengths: выровненная матрица, ряды прижаты влево
+        - values + offsets (n+1): ragged, товар i = values[offsets[i]:offsets[i+1]]
+        - history: GroupedHistory / CompactHistory (ragged-раскладка и даты последних цен)
         
-        # Для 30-дневного прогноза можем экстраполировать или использовать тренд
-        if len(forecast_result.predictions) >= 30:
-            forecast_30d = forecast_result.predictions[29]
-        else:
-            # Экстраполируем тренд
-            if forecast_result.trend == "up":
-                forecast_30d = forecast_7d * 1.05
-            elif forecast_result.trend == "down":
-                forecast_30d = forecast_7d * 0.95
+        Модели считаются векторно по всему пакету, уверенность - через
+        ConfidenceCalculator.calculate_confidence_batch, рекомендации - через
+        RecommendationEngine, поэтому ответ по каждому товару совпадает
+        с generate_forecast (с точностью округления в ответе).
+        
+        Args:
+            last_dates: Дата последней цены каждого товара
+            scenario: "optimist", "pessimist" или "all"
+            forecast_days: Количество дней прогноза
+            horizons: Несколько горизонтов за один вызов (как в generate_forecast)
+            scenarios: Несколько сценариев за один вызов (как в generate_forecast)
+            history: GroupedHistory или CompactHistory вместо prices/values и last_dates
+            product_ids: ID товаров (по умолчанию из history) - для MAPE из ErrorStore
+            include_spans: Замеры этапов (как в generate_forecast) - доля
+                одного товара, как и inference_time
+        
+        Returns:
+            Список ответов в формате generate_forecast, по одному на товар
+        """
+        args = (last_dates, prices, lengths, values, offsets, scenario, forecast_days,
+                horizons, scenarios, history, product_ids)
+        if not include_spans:
+            return self._generate_forecast_batch(*args)
+        
+        with TRACER.collect() as spans:
+            responses = self._generate_forecast_batch(*args)
+        return [_with_spans(response, spans, len(responses)) for response in responses]
+    
+    def _generate_forecast_batch(
+        self,
+        last_dates,
+        prices,
+        lengths,
+        values,
+        offsets,
+        scenario: str,
+        forecast_days: int,
+        horizons: List[int],
+        scenarios: List[str],
+        history,
+        product_ids
+    ) -> List[Dict]:
+        """Тело generate_forecast_batch (замеры этапов собирает вызывающий)"""
+        scenarios = self._resolve_scenarios(scenario, scenarios)
+        
+        if history is not None:
+            values, offsets = history.prices, history.offsets
+            if last_dates is None:
+                last_dates = history.last_dates()
+            if product_ids is None:
+                product_ids = history.product_ids
+        if last_dates is None:
+            raise ValueError("Нужны last_dates или history")
+        
+        if values is not None:
+            if offsets is None:
+                raise ValueError("Для ragged-раскладки нужны offsets")
+            prices, lengths = to_padded(values, offsets)
+        elif prices is None:
+            raise ValueError("Нужна матрица prices или пара values/offsets")
+        
+        prices = np.asarray(prices, dtype=float)
+        if prices.ndim != 2:
+            raise ValueError("prices должна быть 2D матрицей (n_products, max_len)")
+        if lengths is None:
+            lengths = np.full(len(prices), prices.shape[1])
+        lengths = np.asarray(lengths, dtype=np.int64)
+        
+        if len(last_dates) != len(lengths):
+            raise ValueError("Число дат не совпадает с числом товаров")
+        empty = np.flatnonzero(lengths < 1)
+        if len(empty):
+            raise ValueError(f"История цен не может быть пустой (строки {empty.tolist()})")
+        
+        # 1. ПРОГНОЗ (одна векторная модель на весь пакет)
+        period_days, fit_days = self._fit_days(forecast_days, horizons)
+        with TRACER.span("fit"):
+            batch = self.model.predict_batch(prices, lengths, days_ahead=fit_days)
+        
+        forecast_dates = forecast_dates_batch(last_dates, period_days)
+        with TRACER.span("dates"):
+            forecast_dates = format_dates_iso(forecast_dates)
+        
+        # 2. УВЕРЕННОСТЬ
+        with TRACER.span("confidence"):
+            mask = np.arange(prices.shape[1]) < lengths[:, None]
+            filled = np.where(mask, prices, 0.0)
+            mean = filled.sum(axis=1) / lengths
+            std = np.sqrt((np.where(mask, prices - mean[:, None], 0.0) ** 2).sum(axis=1) / lengths)
+            volatility = (std / mean).tolist()
+            
+            if self.errors is not None and product_ids is not None:
+                estimated_mape = self.errors.mape_batch(product_ids, self.model_type)
+                self.errors.register_batch(product_ids, self.model_type, last_dates, batch.predictions)
             else:
-                forecast_30d = forecast_7d
+                estimated_mape = DEFAULT_MAPE
+            confidence_results = ConfidenceCalculator.calculate_confidence_batch(
+                prices, lengths, mape=estimated_mape
+            )
         
-        scenario_enum = Scenario.OPTIMIST if scenario == "optimist" else Scenario.PESSIMIST
+        # 3-4. РЕКОМЕНДАЦИИ И РЕЗУЛЬТАТ по каждому товару
+        current_prices = prices[np.arange(len(lengths)), lengths - 1].tolist()
+        predictions = batch.predictions
+        inference_time = batch.inference_time / max(len(lengths), 1)
         
-        recommendation = RecommendationEngine.generate_recommendation(
-            current_price=current_price,
-            forecast_7d=forecast_7d,
-            forecast_30d=forecast_30d,
-            confidence=confidence_result.final_confidence,
-            volatility=volatility,
-            scenario=scenario_enum
-        )
+        return [
+            self._build_response(
+                current_price=current_prices[i],
+                predictions=predictions[i],
+                forecast_dates=forecast_dates[i],
+                trend=batch.trends[i],
+                forecast_days=period_days,
+                inference_time=inference_time,
+                model_name=batch.model_name,
+                confidence_result=confidence_results[i],
+                volatility=volatility[i],
+                scenario=scenario,
+                horizons=horizons,
+                scenarios=scenarios
+            )
+            for i in range(len(lengths))
+        ]
+    
+    @staticmethod
+    def _resolve_scenarios(scenario: str, scenarios: List[str] = None) -> List[str]:
+        """Список сценариев для веерного режима (None - один сценарий scenario)"""
+        if scenarios:
+            return list(scenarios)
+        if scenario == "all":
+            return [s.value for s in Scenario]
+        return None
+    
+    @classmethod
+    def _fit_days(cls, forecast_days: int, horizons: List[int] = None):
+        """
+        (period_days, fit_days): длина прогноза в ответе и сколько дней считает модель
         
-        # 4. ФОРМИРУЕМ РЕЗУЛЬТАТ
-        return {
-            "forecast": {
-                "predictions": [round(p, 2) for p in forecast_result.predictions],
-                "dates": [d.isoformat() for d in forecast_result.dates],
-                "trend": forecast_result.trend,
-                "period_days": forecast_days
-            },
-            "metrics": {
-                "inference_time": round(forecast_result.inference_time, 4),
-                "model_name": forecast_result.model_name
-            },
-            "confidence": {
-                "value": round(confidence_result.final_confidence, 3),
-                "level": confidence_result.level,
-                "components": {
-                    "data_quality": round(confidence_result.data_quality, 3),
-                    "model_quality": round(confidence_result.model_quality, 3),
-                    "external_factors": round(confidence_result.external_factors, 3)
-                }
-            },
-            "recommendation": {
-                "price_action": recommendation.action.value,
-                "percentage": round(recommendation.percentage, 1),
-                "timeframe": recommendation.timeframe,
-                "confidence": round(recommendation.confidence, 3),
-                "reasoning": recommendation.reasoning,
-                "scenario": scenario
-            },
-            "current_price": round(current_price, 2)
+        Модель всегда считает не меньше RECOMMENDATION_HORIZON дней, чтобы
+        30-дневная оценка для рекомендаций бралась из модели, а не из эвристики.
+        """
+        if horizons:
+            if min(horizons) < 1:
+                raise ValueError("Горизонты прогноза должны быть положительными")
+            period_days = max(horizons)
+        else:
+            period_days = forecast_days
+        return period_days, max(period_days, cls.RECOMMENDATION_HORIZON)
+    
+    @staticmethod
+    def _build_response(
+        current_price: float,
+        predictions: np.ndarray,
+        forecast_dates: List[str],
+        trend: str,
+        forecast_days: int,
+        inference_time: float,
+        model_name: str,
+        confidence_result,
+        volatility: float,
+        scenario: str,
+        horizons: List[int] = None,
+        scenarios: List[str] = None
+    ) -> Dict:
+        """
+        Рекомендация и итоговый ответ (общие для одиночного и пакетного режимов)
+        
+        predictions - полный прогноз модели (не меньше 30 дней),
+        в ответ попадают первые forecast_days значений.
+        При scenarios рекомендации строятся для каждого сценария по одному
+        прогнозу; "recommendation" - рекомендация первого из них.
+        """
+        # Прогнозы на разные периоды (оба - из модели)
+        forecast_7d = float(predictions[6])
+        forecast_30d = float(predictions[29])
+        
+        names = scenarios or [scenario]
+        scenario_enums = {
+            name: Scenario.OPTIMIST if name == "optimist" else Scenario.PESSIMIST
+            for name in names
         }
+        with TRACER.span("recommendation"):
+            recommendations = RecommendationEngine.generate_recommendations(
+                current_price=current_price,
+                forecast_7d=forecast_7d,
+                forecast_30d=forecast_30d,
+                confidence=confidence_result.final_confidence,
+                volatility=volatility,
+                scenarios=list(set(scenario_enums.values()))
+            )
+        
+        with TRACER.span("serialization"):
+            recommendation_blocks = {}
+            for name, scenario_enum in scenario_enums.items():
+                rec = recommendations[scenario_enum]
+                recommendation_blocks[name] = {
+                    "price_action": rec.action.value,
+                    "percentage": round(rec.percentage, 1),
+                    "timeframe": rec.timeframe,
+                    "confidence": round(rec.confidence, 3),
+                    "reasoning": rec.reasoning,
+                    "scenario": name
+                }
+            
+            response = {
+                "forecast": {
+                    "predictions": np.round(predictions[:forecast_days], 2).tolist(),
+                    "dates": forecast_dates,
+                    "trend": trend,
+                    "period_days": forecast_days
+                },
+                "metrics": {
+                    "inference_time": round(inference_time, 4),
+                    "model_name": model_name
+                },
+                "confidence": {
+                    "value": round(confidence_result.final_confidence, 3),
+                    "level": confidence_result.level,
+                    "components": {
+                        "data_quality": round(confidence_result.data_quality, 3),
+                        "model_quality": round(confidence_result.model_quality, 3),
+                        "external_factors": round(confidence_result.external_factors, 3)
+                    }
+                },
+                "recommendation": recommendation_blocks[names[0]],
+                "current_price": round(current_price, 2)
+            }
+            
+            if scenarios:
+                response["recommendations"] = recommendation_blocks
+            
+            if horizons:
+                response["horizons"] = {
+                    str(h): {
+                        "price": round(float(predictions[h - 1]), 2),
+                        "date": forecast_dates[h - 1]
+                    }
+                    for h in sorted(set(horizons))
+                }
+        return response
+
+
+# ============================================================================
+# ТОЧКА ВХОДА (демонстрация / воркер)
+# ============================================================================
+
+def main(argv: List[str] = None) -> None:
+    """
+    Точка входа CLI
+    
+    Использование:
+        python -m ml_service                              # Демонстрация
+        python -m ml_service --serve                      # JSON-lines через stdin/stdout
+        python -m ml_service --serve --socket 127.0.0.1:8765 --workers 4
+        python -m ml_service --serve --socket /tmp/ml_service.sock
+    """
+    import argparse
+    from services.worker import ForecastWorker, serve_stream, serve_socket
+    
+    parser = argparse.ArgumentParser(description='ML сервис прогнозирования цен')
+    parser.add_argument('--serve', action='store_true', help='Запустить воркер (JSON-lines)')
+    parser.add_argument('--socket', help='host:port или путь Unix-сокета (по умолчанию stdin/stdout)')
+    parser.add_argument('--workers', type=int, default=1, help='Количество pre-fork процессов')
+    parser.add_argument('--cache-size', type=int, default=0, help='Размер кэша ответов (0 - без кэша)')
+    parser.add_argument('--cache-db', default=None,
+                        help='SQLite-файл общего уровня кэша (через него доходят сбросы PriceUpdater)')
+    parser.add_argument('--errors-db', default=None, help='SQLite-файл фактической MAPE по товарам (ErrorStore)')
+    parser.add_argument('--trace', action='store_true', help='Гистограммы этапов запроса (метод "trace")')
+    
+    args = parser.parse_args(argv)
+    if args.trace:
+        TRACER.enabled = True
+    
+    if not args.serve:
+        run_demo()
+        return
+    
+    def make_worker() -> ForecastWorker:
+        cache = ForecastCache(max_size=args.cache_size, disk_path=args.cache_db) \
+            if args.cache_size > 0 else None
+        errors = ErrorStore(args.errors_db) if args.errors_db else None
+        return ForecastWorker(service_factory=MLForecastService, cache=cache, errors=errors)
+    
+    if args.socket:
+        serve_socket(args.socket, workers=args.workers, worker_factory=make_worker)
+    else:
+        worker = make_worker()
+        worker.warm_up()
+        serve_stream(worker)
 
 
 # ============================================================================
 # ТЕСТИРОВАНИЕ
 # ============================================================================
 
-if __name__ == "__main__":
+def run_demo() -> None:
+    """Демонстрация на синтетических данных"""
     print("="*80)
     print("🧪 ТЕСТИРОВАНИЕ ML FORECAST SERVICE")
     print("="*80)
@@ -217,6 +595,37 @@ if __name__ == "__main__":
     print(f"  Срок: {result2['recommendation']['timeframe']}")
     print(f"  Обоснование: {result2['recommendation']['reasoning']}")
     
+    # ТЕСТ 3: Пакетный режим
+    print("\n" + "="*80)
+    print("ТЕСТ 3: Пакетный прогноз (3 товара, ragged)")
+    print("="*80)
+    
+    from storage.grouped_history import GroupedHistory
+    
+    history = GroupedHistory.from_series(
+        [prices, prices[:20], [p * 0.5 for p in prices[5:]]],
+        last_dates=[dates[-1], dates[19], dates[-1]]
+    )
+    
+    batch_results = service.generate_forecast_batch(
+        history=history,
+        scenario="optimist",
+        forecast_days=7
+    )
+    
+    for i, r in enumerate(batch_results):
+        print(f"  Товар {i}: тренд={r['forecast']['trend']}, "
+              f"действие={r['recommendation']['price_action']}, "
+              f"уверенность={r['confidence']['value']}")
+
+    # Тот же каталог в компактном виде: ряд товара берётся из контейнера
+    from storage.compact_history import CompactHistory
+
+    compact = CompactHistory.from_grouped(history, fill=None)
+    r = service.generate_forecast(history=compact, product_id=1, forecast_days=7)
+    print(f"  Компактно: {compact.nbytes} байт, товар 1: тренд={r['forecast']['trend']}, "
+          f"действие={r['recommendation']['price_action']}")
+
     # JSON
     print("\n" + "="*80)
     print("JSON ОТВЕТ (для .NET backend):")
@@ -224,3 +633,7 @@ if __name__ == "__main__":
     
     import json
     print(json.dumps(result, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,61 +2,235 @@
 ML модели прогнозирования цен с метриками
 Реализация согласно документу "Метрики для проверки алгоритмов"
 """
+import sys
+import os
+import struct
 import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import List, Tuple, Dict
 from dataclasses import dataclass
 import time
 
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from models.series_stats import SeriesStats, fit_linear_batch, row_mask
+from services.tracing import TRACER
+
+
+# ============================================================================
+# ДАТЫ ПРОГНОЗА
+# ============================================================================
+
+def forecast_dates(last_date, days_ahead: int) -> np.ndarray:
+    """Даты прогноза last_date + 1..days_ahead дней (datetime64[us])"""
+    with TRACER.span("dates"):
+        start = np.datetime64(last_date, 'us')
+        return start + np.arange(1, days_ahead + 1) * np.timedelta64(1, 'D')
+
+
+def forecast_dates_batch(last_dates, days_ahead: int) -> np.ndarray:
+    """Сетка дат прогноза (n_products, days_ahead) одной операцией"""
+    with TRACER.span("dates"):
+        base = np.array([np.datetime64(d, 'us') for d in last_dates], dtype='datetime64[us]')
+        return base[:, None] + np.arange(1, days_ahead + 1) * np.timedelta64(1, 'D')
+
+
+def format_dates_iso(dates: np.ndarray) -> list:
+    """
+    datetime64 -> ISO строки (как datetime.isoformat), векторно
+    
+    isoformat() опускает микросекунды, если они нулевые - так же и здесь,
+    поэлементно. Форма результата совпадает с формой массива.
+    """
+    dates = np.asarray(dates, dtype='datetime64[us]')
+    formatted = np.datetime_as_string(dates, unit='s').astype(object)
+    has_us = (dates - dates.astype('datetime64[s]')) != np.timedelta64(0, 'us')
+    if has_us.any():
+        formatted[has_us] = np.datetime_as_string(dates[has_us], unit='us')
+    return formatted.tolist()
+
 
 @dataclass
 class ForecastResult:
-    """Результат прогноза"""
-    predictions: List[float]  # Прогнозные цены
-    dates: List[datetime]      # Даты прогноза
+    """Результат прогноза (колоночный: массивы NumPy)"""
+    predictions: np.ndarray    # Прогнозные цены (float64)
+    dates: np.ndarray          # Даты прогноза (datetime64[us])
     trend: str                 # up, down, stable
     model_name: str
     inference_time: float      # Время генерации (секунды)
     
+    # Заголовок бинарного формата: сигнатура, число точек, время генерации
+    _HEADER = struct.Struct('<4sIdHH')
+    _MAGIC = b'FRC1'
+    
     def to_dict(self) -> dict:
         return {
-            "predictions": self.predictions,
-            "dates": [d.isoformat() for d in self.dates],
+            "predictions": self.predictions.tolist(),
+            "dates": format_dates_iso(self.dates),
             "trend": self.trend,
             "model_name": self.model_name,
             "inference_time": self.inference_time
         }
+    
+    def to_bytes(self) -> bytes:
+        """
+        Бинарный формат: заголовок, trend и model_name (UTF-8),
+        затем predictions (<f8) и dates (<i8, микросекунды от эпохи)
+        """
+        trend = self.trend.encode('utf-8')
+        name = self.model_name.encode('utf-8')
+        header = self._HEADER.pack(
+            self._MAGIC, len(self.predictions), self.inference_time, len(trend), len(name)
+        )
+        return b''.join([
+            header, trend, name,
+            np.asarray(self.predictions, dtype='<f8').tobytes(),
+            np.asarray(self.dates, dtype='datetime64[us]').astype('<i8').tobytes()
+        ])
+    
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "ForecastResult":
+        """Обратное преобразование to_bytes (массивы без копирования)"""
+        magic, n, inference_time, trend_len, name_len = cls._HEADER.unpack_from(data)
+        if magic != cls._MAGIC:
+            raise ValueError("Неизвестный формат ForecastResult")
+        
+        pos = cls._HEADER.size
+        trend = data[pos:pos + trend_len].decode('utf-8')
+        pos += trend_len
+        name = data[pos:pos + name_len].decode('utf-8')
+        pos += name_len
+        
+        predictions = np.frombuffer(data, dtype='<f8', count=n, offset=pos)
+        dates = np.frombuffer(data, dtype='<i8', count=n, offset=pos + 8 * n).view('datetime64[us]')
+        
+        return cls(
+            predictions=predictions,
+            dates=dates,
+            trend=trend,
+            model_name=name,
+            inference_time=inference_time
+        )
+
+
+@dataclass
+class BatchForecastResult:
+    """Результат пакетного прогноза (строка = товар)"""
+    predictions: np.ndarray    # (n_products, days_ahead)
+    trends: List[str]          # up, down, stable для каждого товара
+    model_name: str
+    inference_time: float      # Время генерации всего пакета (секунды)
+
+
+# ============================================================================
+# ПАКЕТНЫЕ ВЫЧИСЛЕНИЯ
+# ============================================================================
+
+def to_padded(values, offsets) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Ragged-раскладка (values + offsets) -> выровненная 2D матрица
+
+    Товар i занимает values[offsets[i]:offsets[i+1]].
+    Ряды прижаты влево, хвост строки заполнен NaN.
+
+    Returns:
+        (prices, lengths): матрица (n, max_len) и длины рядов
+    """
+    values = np.asarray(values, dtype=float)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    lengths = np.diff(offsets)
+    n = len(lengths)
+    width = int(lengths.max()) if n else 0
+    
+    padded = np.full((n, width), np.nan)
+    rows = np.repeat(np.arange(n), lengths)
+    cols = np.arange(len(rows)) - np.repeat(offsets[:-1] - offsets[0], lengths)
+    padded[rows, cols] = values[offsets[0]:offsets[-1]]
+    return padded, lengths
+
+
+def _last_prices(prices: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Последняя цена каждой строки"""
+    return prices[np.arange(len(lengths)), lengths - 1]
+
+
+def _trend_labels(slope: np.ndarray, mean: np.ndarray) -> List[str]:
+    """Метки тренда по наклону (порог 0.1% от средней цены)"""
+    threshold = mean * 0.001
+    labels = np.where(slope > threshold, "up", np.where(slope < -threshold, "down", "stable"))
+    return labels.tolist()
 
 
 class BaseModel:
     """Базовый класс для моделей"""
     
+    # Минимальная длина истории для прогноза
+    min_points = 1
+    
     def __init__(self, name: str):
         self.name = name
     
-    def predict(self, prices: List[float], dates: List[datetime], days_ahead: int = 7) -> ForecastResult:
-        """Прогноз"""
+    def predict(
+        self,
+        prices: List[float],
+        dates: List[datetime],
+        days_ahead: int = 7,
+        trend_state=None,
+        stats: SeriesStats = None
+    ) -> ForecastResult:
+        """
+        Прогноз
+        
+        trend_state: TrendAccumulator товара (models/trend_state.py); если он
+        соответствует истории, тренд берётся из него без повторной регрессии
+        stats: готовая SeriesStats запроса - массив и регрессия не пересчитываются
+        """
         raise NotImplementedError
     
-    def _detect_trend(self, prices: List[float]) -> str:
+    def predict_batch(self, prices: np.ndarray, lengths: np.ndarray, days_ahead: int = 7) -> BatchForecastResult:
+        """
+        Пакетный прогноз
+        
+        Args:
+            prices: Матрица (n_products, max_len), ряды прижаты влево
+            lengths: Длина истории каждого товара
+            days_ahead: Горизонт прогноза
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def _series_stats(prices: List[float], trend_state=None, stats: SeriesStats = None) -> SeriesStats:
+        """Статистика запроса: переданная или построенная один раз"""
+        if stats is not None:
+            return stats
+        return SeriesStats.from_prices(prices, trend_state=trend_state)
+    
+    def _detect_trend(self, stats: SeriesStats) -> str:
         """Определение тренда"""
-        if len(prices) < 2:
+        if stats.n < 2:
             return "stable"
         
-        # Линейная регрессия
-        x = np.arange(len(prices))
-        coeffs = np.polyfit(x, prices, 1)
-        slope = coeffs[0]
-        
-        # Пороги
-        threshold = np.mean(prices) * 0.001  # 0.1%
-        
-        if slope > threshold:
-            return "up"
-        elif slope < -threshold:
-            return "down"
-        return "stable"
+        with TRACER.span("trend"):
+            # Линейная регрессия (уже посчитана в SeriesStats)
+            slope = stats.slope
+            
+            # Пороги
+            threshold = stats.mean * 0.001  # 0.1%
+            
+            if slope > threshold:
+                return "up"
+            elif slope < -threshold:
+                return "down"
+            return "stable"
+    
+    def _detect_trend_batch(self, prices: np.ndarray, lengths: np.ndarray) -> List[str]:
+        """Определение тренда для каждой строки матрицы"""
+        with TRACER.span("trend"):
+            slope, _ = fit_linear_batch(prices, lengths)
+            mean = np.where(row_mask(prices, lengths), prices, 0.0).sum(axis=1) / np.maximum(lengths, 1)
+            slope = np.where(lengths < 2, 0.0, slope)
+            return _trend_labels(slope, mean)
 
 
 class NaiveModel(BaseModel):
@@ -68,28 +242,52 @@ class NaiveModel(BaseModel):
     def __init__(self):
         super().__init__("Naive (Tomorrow = Today)")
     
-    def predict(self, prices: List[float], dates: List[datetime], days_ahead: int = 7) -> ForecastResult:
-        start_time = time.time()
+    def predict(
+        self,
+        prices: List[float],
+        dates: List[datetime],
+        days_ahead: int = 7,
+        trend_state=None,
+        stats: SeriesStats = None
+    ) -> ForecastResult:
+        start_time = time.perf_counter()
         
-        if not prices:
+        if len(prices) == 0:
             raise ValueError("Нет данных для прогноза")
         
-        last_price = prices[-1]
+        stats = self._series_stats(prices, trend_state, stats)
+        last_price = stats.last_price
         last_date = dates[-1]
         
         # Все дни - та же цена
-        forecast_dates = [last_date + timedelta(days=i+1) for i in range(days_ahead)]
-        forecast_prices = [last_price] * days_ahead
+        future_dates = forecast_dates(last_date, days_ahead)
+        forecast_prices = np.full(days_ahead, last_price)
         
-        inference_time = time.time() - start_time
+        inference_time = time.perf_counter() - start_time
         
         return ForecastResult(
             predictions=forecast_prices,
-            dates=forecast_dates,
-            trend=self._detect_trend(prices),
+            dates=future_dates,
+            trend=self._detect_trend(stats),
             model_name=self.name,
             inference_time=inference_time
         )
+    
+    def predict_batch(self, prices: np.ndarray, lengths: np.ndarray, days_ahead: int = 7) -> BatchForecastResult:
+        start_time = time.perf_counter()
+        
+        if np.any(lengths < 1):
+            raise ValueError("Нет данных для прогноза")
+        
+        last_price = _last_prices(prices, lengths)
+        forecast_prices = np.repeat(last_price[:, None], days_ahead, axis=1)
+        
+        return BatchForecastResult(
+            predictions=forecast_prices,
+            trends=self._detect_trend_batch(prices, lengths),
+            model_name=self.name,
+            inference_time=time.perf_counter() - start_time
+        )
 
 
 class MovingAverageModel(BaseModel):
@@ -101,43 +299,79 @@ class MovingAverageModel(BaseModel):
     def __init__(self, window: int = 7):
         super().__init__(f"Moving Average (window={window})")
         self.window = window
+        self.min_points = window
     
-    def predict(self, prices: List[float], dates: List[datetime], days_ahead: int = 7) -> ForecastResult:
-        start_time = time.time()
+    def predict(
+        self,
+        prices: List[float],
+        dates: List[datetime],
+        days_ahead: int = 7,
+        trend_state=None,
+        stats: SeriesStats = None
+    ) -> ForecastResult:
+        start_time = time.perf_counter()
         
         if len(prices) < self.window:
             raise ValueError(f"Недостаточно данных. Нужно минимум {self.window} точек")
         
+        stats = self._series_stats(prices, trend_state, stats)
         last_date = dates[-1]
         
         # Вычисляем скользящее среднее
-        prices_array = np.array(prices)
+        prices_array = stats.prices
         ma = np.convolve(prices_array, np.ones(self.window)/self.window, mode='valid')
         
         # Прогноз - последнее значение MA
         forecast_price = ma[-1]
         
         # Генерируем прогноз с экспоненциальным сглаживанием
-        forecast_dates = [last_date + timedelta(days=i+1) for i in range(days_ahead)]
-        forecast_prices = []
+        future_dates = forecast_dates(last_date, days_ahead)
+        forecast_prices = np.empty(days_ahead)
         
-        current_price = prices[-1]
+        current_price = stats.last_price
         alpha = 0.3  # Коэффициент сглаживания
         
-        for _ in range(days_ahead):
+        for day in range(days_ahead):
             # Экспоненциальное сглаживание к MA
             current_price = current_price * (1 - alpha) + forecast_price * alpha
-            forecast_prices.append(current_price)
+            forecast_prices[day] = current_price
         
-        inference_time = time.time() - start_time
+        inference_time = time.perf_counter() - start_time
         
         return ForecastResult(
             predictions=forecast_prices,
-            dates=forecast_dates,
-            trend=self._detect_trend(prices),
+            dates=future_dates,
+            trend=self._detect_trend(stats),
             model_name=self.name,
             inference_time=inference_time
         )
+    
+    def predict_batch(self, prices: np.ndarray, lengths: np.ndarray, days_ahead: int = 7) -> BatchForecastResult:
+        start_time = time.perf_counter()
+        
+        if np.any(lengths < self.window):
+            raise ValueError(f"Недостаточно данных. Нужно минимум {self.window} точек")
+        
+        # Последнее значение MA = среднее последних window точек
+        idx = lengths[:, None] - self.window + np.arange(self.window)
+        window_prices = np.take_along_axis(prices, idx, axis=1)
+        forecast_price = (window_prices * (1 / self.window)).sum(axis=1)
+        
+        # Та же рекурсия сглаживания, векторизованная по товарам
+        forecast_prices = np.empty((len(lengths), days_ahead))
+        current_price = _last_prices(prices, lengths)
+        alpha = 0.3
+        
+        for day in range(days_ahead):
+            current_price = current_price * (1 - alpha) + forecast_price * alpha
+            forecast_prices[:, day] = current_price
+        
+        return BatchForecastResult(
+            predictions=forecast_prices,
+            trends=self._detect_trend_batch(prices, lengths),
+            model_name=self.name,
+            inference_time=time.perf_counter() - start_time
+        )
 
 
 class LinearExtrapolationModel(BaseModel):
@@ -146,40 +380,72 @@ class LinearExtrapolationModel(BaseModel):
     Продлевает текущий тренд в будущее
     """
     
+    min_points = 2
+    
     def __init__(self):
         super().__init__("Linear Extrapolation")
     
-    def predict(self, prices: List[float], dates: List[datetime], days_ahead: int = 7) -> ForecastResult:
-        start_time = time.time()
+    def predict(
+        self,
+        prices: List[float],
+        dates: List[datetime],
+        days_ahead: int = 7,
+        trend_state=None,
+        stats: SeriesStats = None
+    ) -> ForecastResult:
+        start_time = time.perf_counter()
         
         if len(prices) < 2:
             raise ValueError("Недостаточно данных. Нужно минимум 2 точки")
         
+        stats = self._series_stats(prices, trend_state, stats)
         last_date = dates[-1]
         
-        # Линейная регрессия
-        x = np.arange(len(prices))
-        coeffs = np.polyfit(x, prices, 1)
-        slope, intercept = coeffs
+        # Линейная регрессия (одна на запрос, общая с определением тренда)
+        slope, intercept = stats.slope, stats.intercept
         
         # Прогноз
-        forecast_dates = [last_date + timedelta(days=i+1) for i in range(days_ahead)]
-        forecast_x = np.arange(len(prices), len(prices) + days_ahead)
+        future_dates = forecast_dates(last_date, days_ahead)
+        forecast_x = np.arange(stats.n, stats.n + days_ahead)
         forecast_prices = slope * forecast_x + intercept
         
         # Ограничиваем от нереалистичных значений
-        last_price = prices[-1]
+        last_price = stats.last_price
         forecast_prices = np.clip(forecast_prices, last_price * 0.5, last_price * 1.5)
         
-        inference_time = time.time() - start_time
+        inference_time = time.perf_counter() - start_time
         
         return ForecastResult(
-            predictions=forecast_prices.tolist(),
-            dates=forecast_dates,
-            trend=self._detect_trend(prices),
+            predictions=forecast_prices,
+            dates=future_dates,
+            trend=self._detect_trend(stats),
             model_name=self.name,
             inference_time=inference_time
         )
+    
+    def predict_batch(self, prices: np.ndarray, lengths: np.ndarray, days_ahead: int = 7) -> BatchForecastResult:
+        start_time = time.perf_counter()
+        
+        if np.any(lengths < 2):
+            raise ValueError("Недостаточно данных. Нужно минимум 2 точки")
+        
+        # Одна регрессия на товар - и для прогноза, и для тренда
+        slope, intercept = fit_linear_batch(prices, lengths)
+        
+        forecast_x = lengths[:, None] + np.arange(days_ahead)
+        forecast_prices = slope[:, None] * forecast_x + intercept[:, None]
+        
+        last_price = _last_prices(prices, lengths)[:, None]
+        forecast_prices = np.clip(forecast_prices, last_price * 0.5, last_price * 1.5)
+        
+        mean = np.where(row_mask(prices, lengths), prices, 0.0).sum(axis=1) / lengths
+        
+        return BatchForecastResult(
+            predictions=forecast_prices,
+            trends=_trend_labels(slope, mean),
+            model_name=self.name,
+            inference_time=time.perf_counter() - start_time
+        )
 
 
 # ============================================================================
@@ -187,13 +453,17 @@ class LinearExtrapolationModel(BaseModel):
 # ============================================================================
 
 def get_model(model_type: str = "linear") -> BaseModel:
-    """Получить модель по типу"""
-    models = {
-        "naive": NaiveModel(),
-        "ma": MovingAverageModel(window=7),
-        "linear": LinearExtrapolationModel()
-    }
-    return models.get(model_type, LinearExtrapolationModel())
+    """
+    Получить модель по типу
+    
+    Возвращает общий экземпляр из реестра (models/registry.py);
+    неизвестный тип - линейная модель.
+    """
+    from models.registry import registry
+    
+    if model_type not in registry:
+        model_type = "linear"
+    return registry.get(model_type)
 
 
 if __name__ == "__main__":
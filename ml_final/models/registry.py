@@ -0,0 +1,98 @@
+"""
+Реестр моделей прогнозирования
+Каждая модель создаётся один раз и переиспользуется всеми запросами
+"""
+import importlib
+import threading
+from typing import Any, Callable, Dict, List, Union
+
+
+ModelTarget = Union[str, Callable[..., Any]]
+
+
+class ModelRegistry:
+    """
+    Реестр моделей по имени
+
+    Модель регистрируется классом или строкой "модуль:Класс" с параметрами
+    конструктора. Модуль импортируется, а экземпляр создаётся только при
+    первом запросе; дальше все получают один и тот же экземпляр.
+    Модели не хранят состояние между вызовами predict, поэтому общий
+    экземпляр безопасен для параллельных потоков.
+    """
+
+    def __init__(self):
+        self._specs: Dict[str, tuple] = {}
+        self._instances: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, target: ModelTarget, **params) -> None:
+        """
+        Регистрация модели
+
+        Args:
+            name: Имя модели ("linear", "ma", ...)
+            target: Класс модели или строка "models.my_module:MyModel"
+            **params: Параметры конструктора (например, window=14)
+        """
+        with self._lock:
+            self._specs[name] = (target, params)
+            self._instances.pop(name, None)
+
+    def get(self, name: str):
+        """Общий экземпляр модели (создаётся при первом обращении)"""
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+
+        with self._lock:
+            instance = self._instances.get(name)
+            if instance is None:
+                if name not in self._specs:
+                    raise KeyError(f"Модель не зарегистрирована: {name}")
+                target, params = self._specs[name]
+                instance = self._resolve(target)(**params)
+                self._instances[name] = instance
+            return instance
+
+    def names(self) -> List[str]:
+        """Зарегистрированные имена"""
+        return list(self._specs)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._specs
+
+    @staticmethod
+    def _resolve(target: ModelTarget) -> Callable[..., Any]:
+        """Ленивый импорт "модуль:Класс" """
+        if isinstance(target, str):
+            module_name, _, attr = target.partition(":")
+            return getattr(importlib.import_module(module_name), attr)
+        return target
+
+
+registry = ModelRegistry()
+
+# Встроенные модели (модуль импортируется при первом запросе)
+registry.register("naive", "models.forecast_models:NaiveModel")
+registry.register("ma", "models.forecast_models:MovingAverageModel", window=7)
+registry.register("linear", "models.forecast_models:LinearExtrapolationModel")
+
+
+def register_model(name: str, target: ModelTarget = None, **params):
+    """
+    Регистрация модели в общем реестре
+
+    Можно вызвать напрямую или использовать как декоратор класса:
+
+        @register_model("ma14", window=14)
+        class MyMovingAverage(MovingAverageModel): ...
+    """
+    if target is not None:
+        registry.register(name, target, **params)
+        return target
+
+    def decorator(cls):
+        registry.register(name, cls, **params)
+        return cls
+    return decorator
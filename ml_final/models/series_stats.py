@@ -0,0 +1,183 @@
+"""
+Общая статистика ряда цен для одного запроса
+Массив, регрессия и моменты считаются один раз и передаются в модели,
+расчёт уверенности и рекомендации
+"""
+import numpy as np
+from typing import List, Tuple
+from dataclasses import dataclass
+
+
+# ============================================================================
+# РЕГРЕССИЯ
+# ============================================================================
+
+def row_mask(prices: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Маска валидных точек выровненной матрицы"""
+    return np.arange(prices.shape[1]) < lengths[:, None]
+
+
+def fit_linear_batch(prices: np.ndarray, lengths: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    МНК-прямая по x = 0..n-1 для каждой строки матрицы
+
+    Та же прямая, что np.polyfit(x, prices, 1), в центрированной форме:
+    slope = Σ(x - x̄)·y / Σ(x - x̄)²,  intercept = ȳ - slope·x̄
+    """
+    n = lengths.astype(float)
+    mask = row_mask(prices, lengths)
+    y = np.where(mask, prices, 0.0)
+
+    x_mean = (n - 1) / 2
+    y_mean = y.sum(axis=1) / np.maximum(n, 1)
+    w = (np.arange(prices.shape[1]) - x_mean[:, None]) * mask
+    sxx = n * (n * n - 1) / 12
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.where(sxx > 0, (w * y).sum(axis=1) / sxx, 0.0)
+    intercept = y_mean - slope * x_mean
+    return slope, intercept
+
+
+def fit_linear(prices: List[float]) -> Tuple[float, float]:
+    """МНК-прямая для одного ряда (общая формула с пакетным режимом)"""
+    arr = np.asarray(prices, dtype=float)
+    slope, intercept = fit_linear_batch(arr[None, :], np.array([len(arr)]))
+    return float(slope[0]), float(intercept[0])
+
+
+def state_matches(trend_state, prices: np.ndarray, mean: float, rtol: float = 1e-9) -> bool:
+    """
+    Построено ли состояние тренда по этому ряду (проверка за O(1))
+
+    Сверяются длина, первая и последняя цена и средняя (она считается
+    для статистики в любом случае). Исправление любой цены ряда меняет
+    среднюю, поэтому устаревшее состояние не проходит; подмена, сохраняющая
+    и концы, и сумму ряда, этой проверкой не ловится.
+    """
+    n = len(prices)
+    if trend_state is None or trend_state.n != n or n == 0:
+        return False
+    scale = max(abs(mean), 1.0)
+    return (
+        trend_state.y_ref == prices[0] and
+        trend_state.last_price == prices[-1] and
+        abs(trend_state.mean - mean) <= rtol * scale
+    )
+
+
+# ============================================================================
+# СТАТИСТИКА РЯДА
+# ============================================================================
+
+@dataclass
+class SeriesStats:
+    """Статистика истории цен товара (строится один раз на запрос)"""
+    prices: np.ndarray       # История цен (float64)
+    n: int                   # Количество точек
+    mean: float              # Средняя цена
+    std: float               # Стандартное отклонение
+    slope: float             # Наклон МНК-прямой
+    intercept: float         # Свободный член МНК-прямой
+    last_price: float        # Последняя цена
+    tail_size: int           # Размер хвостового окна
+    tail_mean: float         # Средняя по хвостовому окну
+    tail_std: float          # Стандартное отклонение по хвостовому окну
+
+    TAIL_WINDOW = 10  # Окно волатильности для качества данных
+
+    @classmethod
+    def from_prices(cls, prices: List[float], trend_state=None, tail: int = None) -> "SeriesStats":
+        """
+        Args:
+            prices: История цен (список или ndarray)
+            trend_state: TrendAccumulator товара - если он построен по этой
+                истории (state_matches), регрессия берётся из него без
+                пересчёта; иначе считается заново
+            tail: Размер хвостового окна (по умолчанию TAIL_WINDOW)
+
+        Средняя и std считаются по массиву и с подходящим состоянием:
+        средняя - единственное, что отличает исправленную задним числом
+        историю от той, по которой построено состояние, а std на том же
+        массиве - ещё один векторный проход. Состояние экономит регрессию.
+        """
+        arr = np.asarray(prices, dtype=float)
+        n = len(arr)
+        if n == 0:
+            raise ValueError("Нет данных для прогноза")
+
+        tail = cls.TAIL_WINDOW if tail is None else tail
+        recent = arr[-tail:]
+        mean = float(arr.mean())
+
+        if state_matches(trend_state, arr, mean):
+            slope, intercept = trend_state.coefficients()
+        elif n >= 2:
+            slope, intercept = fit_linear(arr)
+        else:
+            slope, intercept = 0.0, float(arr[0])
+
+        return cls(
+            prices=arr,
+            n=n,
+            mean=mean,
+            std=float(arr.std()),
+            slope=slope,
+            intercept=intercept,
+            last_price=float(arr[-1]),
+            tail_size=len(recent),
+            tail_mean=float(recent.mean()),
+            tail_std=float(recent.std())
+        )
+
+    @property
+    def volatility(self) -> float:
+        """Волатильность = std / mean"""
+        return self.std / self.mean
+
+
+# ============================================================================
+# ТЕСТИРОВАНИЕ
+# ============================================================================
+
+if __name__ == "__main__":
+    import os
+    import sys
+
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+    from models.trend_state import TrendAccumulator
+
+    print("📐 Регрессия SeriesStats с состоянием тренда против np.polyfit\n")
+
+    rng = np.random.default_rng(7)
+    reused = 0
+
+    for trial in range(200):
+        n = int(rng.integers(3, 1000))
+        prices = rng.uniform(1000, 200000) * np.cumprod(1 + rng.normal(0, 0.02, n))
+
+        # Состояние наращивается по одной цене, как в PriceUpdater
+        state = TrendAccumulator()
+        for p in prices[:-1]:
+            state.add(p)
+
+        # Состояние отстаёт на одну цену: регрессия пересчитывается
+        stats = SeriesStats.from_prices(prices, trend_state=state)
+        assert not state_matches(state, prices, stats.mean)
+        assert np.allclose([stats.slope, stats.intercept], np.polyfit(np.arange(n), prices, 1), rtol=1e-9)
+
+        # Цена дописана: регрессия берётся из состояния
+        state.add(prices[-1])
+        stats = SeriesStats.from_prices(prices, trend_state=state)
+        reused += state_matches(state, prices, stats.mean)
+        assert np.allclose([stats.slope, stats.intercept], np.polyfit(np.arange(n), prices, 1), rtol=1e-9)
+
+        # Исправленная цена той же длины: состояние не подходит
+        corrected = prices.copy()
+        corrected[int(rng.integers(0, n))] *= 1.1
+        stats = SeriesStats.from_prices(corrected, trend_state=state)
+        assert not state_matches(state, corrected, stats.mean)
+        assert np.allclose([stats.slope, stats.intercept], np.polyfit(np.arange(n), corrected, 1), rtol=1e-9)
+
+    assert reused == 200
+    print(f"  200 рядов: дописанные - из состояния, отставшие и исправленные - пересчёт ✓")
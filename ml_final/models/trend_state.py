@@ -0,0 +1,223 @@
+"""
+Инкрементальное состояние линейного тренда
+Накопленные суммы МНК по каждому товару: новая цена обновляет наклон за O(1)
+"""
+import numpy as np
+from typing import Callable, Dict, List, Optional, Tuple
+from dataclasses import dataclass
+
+
+@dataclass
+class TrendAccumulator:
+    """
+    Накопленные суммы для прямой МНК по x = 0..n-1
+
+    Цены хранятся со сдвигом на первую цену (y - y_ref), чтобы суммы
+    Σy и Σxy не росли до величин, где теряется точность.
+    """
+    n: int = 0
+    sum_x: float = 0.0
+    sum_xx: float = 0.0
+    sum_y: float = 0.0       # Σ(y - y_ref)
+    sum_xy: float = 0.0      # Σx·(y - y_ref)
+    y_ref: float = 0.0       # Опорная цена (первая точка)
+    last_price: float = 0.0
+    updates_since_check: int = 0
+
+    @classmethod
+    def from_prices(cls, prices: List[float]) -> "TrendAccumulator":
+        """Построение состояния по всей истории (один проход)"""
+        acc = cls()
+        acc.rebuild(prices)
+        return acc
+
+    def rebuild(self, prices: List[float]) -> None:
+        """Пересчёт сумм с нуля"""
+        y = np.asarray(prices, dtype=float)
+        n = len(y)
+        y_ref = float(y[0]) if n else 0.0
+        x = np.arange(n, dtype=float)
+        dy = y - y_ref
+
+        self.n = n
+        self.sum_x = float(x.sum())
+        self.sum_xx = float((x * x).sum())
+        self.sum_y = float(dy.sum())
+        self.sum_xy = float((x * dy).sum())
+        self.y_ref = y_ref
+        self.last_price = float(y[-1]) if n else 0.0
+        self.updates_since_check = 0
+
+    def add(self, price: float) -> None:
+        """Добавление новой цены - O(1)"""
+        price = float(price)
+        if self.n == 0:
+            self.y_ref = price
+        x = float(self.n)
+        dy = price - self.y_ref
+
+        self.n += 1
+        self.sum_x += x
+        self.sum_xx += x * x
+        self.sum_y += dy
+        self.sum_xy += x * dy
+        self.last_price = price
+        self.updates_since_check += 1
+
+    @property
+    def mean(self) -> float:
+        """Средняя цена"""
+        if self.n == 0:
+            return 0.0
+        return self.y_ref + self.sum_y / self.n
+
+    def coefficients(self) -> Tuple[float, float]:
+        """(slope, intercept) прямой МНК"""
+        if self.n < 2:
+            return 0.0, self.mean
+        denom = self.n * self.sum_xx - self.sum_x ** 2
+        slope = (self.n * self.sum_xy - self.sum_x * self.sum_y) / denom
+        intercept = self.mean - slope * self.sum_x / self.n
+        return float(slope), float(intercept)
+
+    def forecast(self, days_ahead: int = 7) -> np.ndarray:
+        """Линейный прогноз на days_ahead дней без обращения к истории"""
+        slope, intercept = self.coefficients()
+        forecast_x = np.arange(self.n, self.n + days_ahead)
+        return slope * forecast_x + intercept
+
+    def matches(self, prices: List[float], rtol: float = 1e-9) -> bool:
+        """Сверка с пересчётом по полной истории"""
+        if len(prices) != self.n:
+            return False
+        if self.n < 2:
+            return True
+
+        reference = TrendAccumulator.from_prices(prices)
+        slope, intercept = self.coefficients()
+        ref_slope, ref_intercept = reference.coefficients()
+        scale = max(abs(reference.mean), 1.0)
+        return (
+            abs(slope - ref_slope) <= rtol * scale and
+            abs(intercept - ref_intercept) <= rtol * scale
+        )
+
+
+class TrendStateStore:
+    """
+    Состояния тренда по товарам
+
+    Проверка дрейфа: каждые recompute_every обновлений состояние товара
+    сверяется с пересчётом по истории (history_provider) и при расхождении
+    пересчитывается с нуля. Без history_provider сверку запускает владелец:
+    due() - товары, которым пора, verify() - по истории, прочитанной пакетом.
+    """
+
+    def __init__(
+        self,
+        history_provider: Optional[Callable[[int], List[float]]] = None,
+        recompute_every: int = 30,
+        rtol: float = 1e-9
+    ):
+        """
+        Args:
+            history_provider: Функция product_id -> полная история цен
+            recompute_every: Через сколько обновлений сверять с историей
+            rtol: Допустимое относительное расхождение с пересчётом
+        """
+        self.history_provider = history_provider
+        self.recompute_every = recompute_every
+        self.rtol = rtol
+        self._states: Dict[int, TrendAccumulator] = {}
+        self.rebuilds = 0
+
+    def get(self, product_id: int) -> Optional[TrendAccumulator]:
+        """Состояние товара (None, если товар ещё не встречался)"""
+        return self._states.get(product_id)
+
+    def load(self, product_id: int, prices: List[float]) -> TrendAccumulator:
+        """Инициализация состояния по полной истории"""
+        state = TrendAccumulator.from_prices(prices)
+        self._states[product_id] = state
+        return state
+
+    def add(self, product_id: int, price: float) -> TrendAccumulator:
+        """Новая цена товара - O(1), с периодической сверкой"""
+        state = self._states.get(product_id)
+        if state is None:
+            state = self._states[product_id] = TrendAccumulator()
+        state.add(price)
+
+        if self.history_provider is not None and state.updates_since_check >= self.recompute_every:
+            self.verify(product_id, self.history_provider(product_id))
+        return state
+
+    def due(self) -> List[int]:
+        """Товары, у которых накопилось recompute_every обновлений без сверки"""
+        return [
+            product_id for product_id, state in self._states.items()
+            if state.updates_since_check >= self.recompute_every
+        ]
+
+    def verify(self, product_id: int, prices: List[float]) -> bool:
+        """
+        Сверка состояния с историей
+
+        Returns:
+            True, если состояние совпало; иначе оно пересчитывается и возвращается False
+        """
+        state = self._states.get(product_id)
+        if state is not None and state.matches(prices, self.rtol):
+            state.updates_since_check = 0
+            return True
+
+        self.load(product_id, prices)
+        self.rebuilds += 1
+        return False
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def __contains__(self, product_id: int) -> bool:
+        return product_id in self._states
+
+
+# ============================================================================
+# ТЕСТИРОВАНИЕ
+# ============================================================================
+
+if __name__ == "__main__":
+    print("📈 Проверка инкрементального тренда против np.polyfit\n")
+
+    rng = np.random.default_rng(42)
+    worst = 0.0
+
+    for trial in range(200):
+        n = int(rng.integers(2, 2000))
+        base = rng.uniform(1000, 200000)
+        prices = base * np.cumprod(1 + rng.normal(0, 0.02, n))
+
+        # Наращиваем по одной точке, как PriceUpdater
+        acc = TrendAccumulator()
+        for p in prices:
+            acc.add(p)
+
+        slope, intercept = acc.coefficients()
+        ref_slope, ref_intercept = np.polyfit(np.arange(n), prices, 1)
+        scale = np.mean(prices)
+
+        err = max(abs(slope - ref_slope), abs(intercept - ref_intercept)) / scale
+        worst = max(worst, err)
+        assert err < 1e-9, f"Расхождение {err} на n={n}"
+
+    print(f"  200 рядов, макс. относительное расхождение: {worst:.2e} ✓")
+
+    # Сверка и пересчёт при порче состояния
+    history = list(50000 + np.arange(60) * 100.0)
+    store = TrendStateStore(history_provider=lambda pid: history, recompute_every=10)
+    store.load(1, history)
+    store.get(1).sum_xy += 1e6  # Имитируем дрейф
+
+    assert not store.verify(1, history)
+    assert store.get(1).matches(history)
+    print(f"  Дрейф обнаружен и состояние пересчитано (rebuilds={store.rebuilds}) ✓")
@@ -0,0 +1,365 @@
+"""
+Предрасчёт прогнозов для всего каталога
+Результаты (товар × модель × горизонт × сценарий) сохраняются в SQLite,
+откуда API читает их по первичному ключу
+"""
+import sys
+import os
+import math
+import sqlite3
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ml_service import MLForecastService
+from services.serialization import dumps, loads
+from storage.compact_history import CompactHistory
+from storage.grouped_history import GroupedHistory
+from storage.resample import resample_daily
+from storage.streaming import HistoryStream
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS forecast_materialized (
+    product_id INTEGER NOT NULL,
+    model_type TEXT NOT NULL,
+    horizon INTEGER NOT NULL,
+    scenario TEXT NOT NULL,
+    run_id TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (product_id, model_type, horizon, scenario)
+);
+CREATE TABLE IF NOT EXISTS precompute_runs (
+    run_id TEXT PRIMARY KEY,
+    chunk_size INTEGER NOT NULL,
+    total_chunks INTEGER NOT NULL,
+    started_at TEXT NOT NULL,
+    finished_at TEXT
+);
+CREATE TABLE IF NOT EXISTS precompute_progress (
+    run_id TEXT NOT NULL,
+    chunk_id INTEGER NOT NULL,
+    worker_pid INTEGER NOT NULL,
+    products INTEGER NOT NULL,
+    elapsed REAL NOT NULL,
+    PRIMARY KEY (run_id, chunk_id)
+);
+"""
+
+
+def _split_horizons(result: Dict, horizons: List[int]) -> Dict[int, Dict]:
+    """
+    Ответ generate_forecast(horizons=...) -> ответы по каждому горизонту
+    
+    Модель считается один раз на максимальный горизонт; ответ горизонта h -
+    первые h дней прогноза, как при forecast_days=h.
+    """
+    result.pop("horizons", None)
+    forecast = result["forecast"]
+    return {
+        horizon: {**result, "forecast": {
+            "predictions": forecast["predictions"][:horizon],
+            "dates": forecast["dates"][:horizon],
+            "trend": forecast["trend"],
+            "period_days": horizon
+        }}
+        for horizon in horizons
+    }
+
+
+def _compute_chunk(
+    chunk_id: int,
+    history: GroupedHistory,
+    model_types: List[str],
+    horizons: List[int],
+    scenarios: List[str],
+    resample: Optional[str] = "ffill"
+) -> Dict:
+    """
+    Расчёт одного чанка в процессе пула
+    
+    История чанка приводится к дневным барам (resample - режим заполнения
+    пропусков, None - без приведения); CompactHistory уже дневная. Товары с достаточной историей
+    считаются пакетно (все горизонты и сценарии - по одному прогнозу),
+    остальные пропускаются с записью ошибки.
+    """
+    start = time.perf_counter()
+    if resample is not None and not isinstance(history, CompactHistory):
+        history = resample_daily(history, fill=resample).to_grouped()
+    lengths = history.lengths
+    product_ids = history.product_ids
+    rows = []
+    errors = []
+
+    for model_type in model_types:
+        service = MLForecastService(model_type=model_type)
+        valid = np.flatnonzero(lengths >= service.model.min_points)
+        for i in np.flatnonzero(lengths < service.model.min_points):
+            errors.append((int(product_ids[i]), model_type, "недостаточно истории"))
+        if len(valid) == 0:
+            continue
+
+        sub = history if len(valid) == len(history) else history.take(valid)
+
+        results = service.generate_forecast_batch(
+            history=sub,
+            horizons=list(horizons),
+            scenarios=scenarios
+        )
+        for product_id, result in zip(sub.product_ids, results):
+            recommendations = result.pop("recommendations")
+            for horizon, response in _split_horizons(result, horizons).items():
+                for scenario in scenarios:
+                    response["recommendation"] = recommendations[scenario]
+                    rows.append((
+                        int(product_id), model_type, horizon, scenario,
+                        dumps(response)
+                    ))
+
+    return {
+        "chunk_id": chunk_id,
+        "pid": os.getpid(),
+        "products": len(history),
+        "rows": rows,
+        "errors": errors,
+        "elapsed": time.perf_counter() - start
+    }
+
+
+def run_precompute(
+    history_file: str,
+    db_path: str,
+    model_types: List[str] = ("linear",),
+    horizons: List[int] = (7, 30, 90),
+    scenarios: List[str] = ("optimist", "pessimist"),
+    workers: int = None,
+    run_id: str = None,
+    chunk_size: int = None,
+    stream: bool = False,
+    sorted_input: bool = False,
+    resample: Optional[str] = "ffill"
+) -> Dict:
+    """
+    Предрасчёт всего каталога
+
+    Args:
+        history_file: CSV с историей цен или каталог HistoryStore
+        db_path: SQLite-файл материализованных прогнозов
+        workers: Размер пула процессов (по умолчанию - число ядер)
+        run_id: ID запуска; повторный запуск с тем же ID продолжает с места остановки
+        chunk_size: Товаров в чанке (по умолчанию ~4 чанка на ядро,
+            в потоковом режиме - 1000)
+        stream: Читать CSV потоком (HistoryStream) с ограниченной памятью
+        sorted_input: CSV отсортирован по product_id (потоковый режим без корзин)
+        resample: Заполнение пропущенных дней в дневных барах (ffill, none)
+            или None - модели получают записи как есть
+
+    Returns:
+        Сводка по запуску
+    """
+    workers = workers or os.cpu_count() or 1
+    run_id = run_id or datetime.now().strftime('%Y%m%d')
+
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+
+    # Размер чанка фиксируется при первом запуске, чтобы возобновление совпало по границам
+    row = conn.execute("SELECT chunk_size FROM precompute_runs WHERE run_id = ?", (run_id,)).fetchone()
+
+    load_start = time.perf_counter()
+    if stream:
+        # Каталог не загружается целиком: чанки собираются из потока рядов,
+        # число товаров становится известно только в конце
+        history_stream = HistoryStream(history_file, sorted_input=sorted_input)
+        chunk_size = row[0] if row is not None else (chunk_size or 1000)
+        total_chunks = 0
+        chunks = enumerate(history_stream.batches(chunk_size))
+        product_count = None
+    else:
+        # Каталог целиком - в компактном виде (float32 + int32 дни),
+        # чанки передаются процессам без распаковки. Без приведения к дням
+        # записи остаются как есть - тогда GroupedHistory
+        if resample is not None:
+            history = CompactHistory.load(history_file, fill=resample)
+        else:
+            history = GroupedHistory.load(history_file)
+        product_count = len(history)
+        chunk_size = row[0] if row is not None else \
+            (chunk_size or max(1, math.ceil(product_count / (workers * 4))))
+        total_chunks = math.ceil(product_count / chunk_size)
+        chunks = (
+            (c, history.slice(c * chunk_size, min((c + 1) * chunk_size, product_count)))
+            for c in range(total_chunks)
+        )
+    load_time = time.perf_counter() - load_start
+
+    conn.execute(
+        "INSERT OR IGNORE INTO precompute_runs (run_id, chunk_size, total_chunks, started_at) VALUES (?, ?, ?, ?)",
+        (run_id, chunk_size, total_chunks, datetime.now().isoformat())
+    )
+    conn.commit()
+
+    done = {
+        r[0] for r in conn.execute("SELECT chunk_id FROM precompute_progress WHERE run_id = ?", (run_id,))
+    }
+
+    print(f"🔄 Предрасчёт {run_id}: товаров {product_count if product_count is not None else '?'}, "
+          f"чанков {total_chunks or '?'} (готово {len(done)}), процессов {workers}")
+
+    per_worker: Dict[int, Dict[str, float]] = {}
+    errors = []
+    compute_start = time.perf_counter()
+
+    def store(result: Dict) -> None:
+        created_at = datetime.now().isoformat()
+
+        # Результаты чанка и отметка о готовности - одной транзакцией
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO forecast_materialized "
+                "(product_id, model_type, horizon, scenario, run_id, payload, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [r[:4] + (run_id, r[4], created_at) for r in result["rows"]]
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO precompute_progress "
+                "(run_id, chunk_id, worker_pid, products, elapsed) VALUES (?, ?, ?, ?, ?)",
+                (run_id, result["chunk_id"], result["pid"], result["products"], result["elapsed"])
+            )
+
+        stats = per_worker.setdefault(result["pid"], {"products": 0, "elapsed": 0.0, "chunks": 0})
+        stats["products"] += result["products"]
+        stats["elapsed"] += result["elapsed"]
+        stats["chunks"] += 1
+        errors.extend(result["errors"])
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Не больше двух чанков на процесс в очереди - память ограничена
+        # и при потоковом чтении
+        in_flight = set()
+        for chunk_id, chunk in chunks:
+            total_chunks = max(total_chunks, chunk_id + 1)
+            if chunk_id in done:
+                continue
+            if len(in_flight) >= workers * 2:
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    store(future.result())
+            in_flight.add(pool.submit(
+                _compute_chunk,
+                chunk_id,
+                chunk,
+                list(model_types),
+                list(horizons),
+                list(scenarios),
+                resample
+            ))
+
+        for future in as_completed(in_flight):
+            store(future.result())
+
+    if stream:
+        product_count = history_stream.stats.products
+        conn.execute("UPDATE precompute_runs SET total_chunks = ? WHERE run_id = ?", (total_chunks, run_id))
+
+    compute_time = time.perf_counter() - compute_start
+    conn.execute("UPDATE precompute_runs SET finished_at = ? WHERE run_id = ?",
+                 (datetime.now().isoformat(), run_id))
+    conn.commit()
+    conn.close()
+
+    processed = sum(s["products"] for s in per_worker.values())
+    return {
+        "run_id": run_id,
+        "products": product_count,
+        "processed_products": processed,
+        "skipped_chunks": len(done),
+        "results_per_product": len(model_types) * len(horizons) * len(scenarios),
+        "errors": len(errors),
+        "load_time": round(load_time, 3),
+        "compute_time": round(compute_time, 3),
+        "throughput": round(processed / compute_time, 1) if compute_time > 0 else 0.0,
+        "per_core": {
+            pid: {
+                "chunks": s["chunks"],
+                "products": s["products"],
+                "products_per_sec": round(s["products"] / s["elapsed"], 1) if s["elapsed"] > 0 else 0.0
+            }
+            for pid, s in per_worker.items()
+        }
+    }
+
+
+def load_materialized(
+    db_path: str,
+    product_id: int,
+    model_type: str = "linear",
+    horizon: int = 7,
+    scenario: str = "optimist"
+) -> Optional[Dict]:
+    """Чтение готового прогноза по первичному ключу"""
+    conn = sqlite3.connect(db_path)
+    try:
+        row = conn.execute(
+            "SELECT payload FROM forecast_materialized "
+            "WHERE product_id = ? AND model_type = ? AND horizon = ? AND scenario = ?",
+            (product_id, model_type, horizon, scenario)
+        ).fetchone()
+    finally:
+        conn.close()
+    return loads(row[0]) if row else None
+
+
+# ============================================================================
+# ГЛАВНАЯ ФУНКЦИЯ
+# ============================================================================
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Предрасчёт прогнозов для всего каталога')
+    parser.add_argument('--history', default='data/price_history_dataset.csv', help='CSV с историей цен или каталог хранилища')
+    parser.add_argument('--db', default='data/forecasts.db', help='SQLite-файл с прогнозами')
+    parser.add_argument('--models', nargs='+', default=['linear'], help='Типы моделей')
+    parser.add_argument('--horizons', nargs='+', type=int, default=[7, 30, 90], help='Горизонты (дни)')
+    parser.add_argument('--scenarios', nargs='+', default=['optimist', 'pessimist'], help='Сценарии')
+    parser.add_argument('--workers', type=int, default=None, help='Процессов (по умолчанию - все ядра)')
+    parser.add_argument('--chunk-size', type=int, default=None, help='Товаров в чанке')
+    parser.add_argument('--run-id', default=None, help='ID запуска (для возобновления)')
+    parser.add_argument('--stream', action='store_true', help='Потоковое чтение CSV (память не растёт с размером файла)')
+    parser.add_argument('--sorted', action='store_true', help='CSV отсортирован по product_id')
+    parser.add_argument('--resample', choices=['ffill', 'none', 'off'], default='ffill',
+                        help='Дневные бары: заполнение пропусков (off - без приведения)')
+
+    args = parser.parse_args()
+
+    summary = run_precompute(
+        history_file=args.history,
+        db_path=args.db,
+        model_types=args.models,
+        horizons=args.horizons,
+        scenarios=args.scenarios,
+        workers=args.workers,
+        run_id=args.run_id,
+        chunk_size=args.chunk_size,
+        stream=args.stream,
+        sorted_input=args.sorted,
+        resample=None if args.resample == 'off' else args.resample
+    )
+
+    print(f"\n✅ Обработано товаров: {summary['processed_products']} из {summary['products']} "
+          f"(пропущено готовых чанков: {summary['skipped_chunks']})")
+    print(f"✅ Загрузка истории: {summary['load_time']}с, расчёт: {summary['compute_time']}с")
+    print(f"✅ Пропускная способность: {summary['throughput']} товаров/с")
+    if summary['errors']:
+        print(f"⚠️  Пропущено (товар × модель): {summary['errors']}")
+
+    print("\n📊 По ядрам:")
+    for pid, s in summary['per_core'].items():
+        print(f"  PID {pid}: чанков {s['chunks']}, товаров {s['products']}, {s['products_per_sec']} товаров/с")
@@ -2,10 +2,22 @@
 Скрипт автоматического обновления цен
 Обновляет PriceHistory каждый день
 """
+import sys
+import os
 import pandas as pd
 import numpy as np
 from datetime import datetime
-import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from models.trend_state import TrendStateStore
+from services.price_collector import PriceCollector
+from storage.grouped_history import GroupedHistory
+from storage.history_index import HistoryIndex
+from storage.history_store import (
+    HistoryStore, append_history_frame, frame_columns, open_history_store
+)
+from storage.streaming import HistoryStream
 
 
 class PriceUpdater:
@@ -17,18 +29,50 @@ class PriceUpdater:
     """
     
     def __init__(self, products_file: str = "data/products_dataset.csv", 
-                 history_file: str = "data/price_history_dataset.csv"):
+                 history_file: str = "data/price_history_dataset.csv",
+                 forecast_cache=None,
+                 compact_after: int = 7,
+                 collector: PriceCollector = None,
+                 errors=None):
         """
         Args:
             products_file: Путь к файлу с товарами
-            history_file: Путь к файлу с историей цен
+            history_file: Путь к CSV с историей цен, к каталогу HistoryStore
+                или к SQLite-базе (.db/.sqlite) со схемой PriceHistory
+            forecast_cache: ForecastCache - записи товара сбрасываются при новой цене.
+                Кэши воркеров в других процессах сбрасываются, только если
+                у них и здесь общий дисковый уровень (disk_path / --cache-db)
+            compact_after: Число сегментов хранилища, после которого запускается
+                фоновое уплотнение
+            collector: PriceCollector - цены запрашиваются с маркетплейсов
+                параллельно; без него цены симулируются
+            errors: ErrorStore - новые цены сверяются с выданными прогнозами
         """
         self.products_file = products_file
         self.history_file = history_file
+        self.forecast_cache = forecast_cache
+        self.compact_after = compact_after
+        self.compaction = None
+        self.collector = collector
+        self.errors = errors
         
-        # Загружаем данные
+        # Загружаем данные. История в памяти не держится: после запуска
+        # нужны только индекс и состояния тренда, новые строки дописывает хранилище
         self.products = pd.read_csv(products_file)
-        self.price_history = pd.read_csv(history_file)
+        self.store = open_history_store(history_file)
+        
+        # Инкрементальные состояния тренда (O(1) на новую цену);
+        # сверка с историей - пакетом после записи (_verify_trend_states)
+        self.trend_states = TrendStateStore()
+        
+        # Индекс товаров: последняя цена и время за O(1).
+        # Хранилище держит его на диске, база строит агрегирующим запросом
+        if self.store is not None:
+            self.index = self.store.index
+            for product_id, prices, _ in GroupedHistory.from_columns(self.store.columns):
+                self.trend_states.load(product_id, prices.tolist())
+        else:
+            self.index = self._load_csv_history()
     
     def update_prices(self) -> int:
         """
@@ -43,8 +87,10 @@ class PriceUpdater:
         new_records = []
         
         # Получаем последний ID
-        max_id = self.price_history['id'].max() if len(self.price_history) > 0 else 0
-        next_id = max_id + 1
+        next_id = self.index.max_id + 1
+        
+        # Цены с маркетплейсов - одним параллельным обходом
+        collected = self._collect_prices() if self.collector is not None else None
         
         # Обновляем каждый товар
         for _, product in self.products.iterrows():
@@ -52,15 +98,20 @@ class PriceUpdater:
             
             try:
                 # Получаем текущую цену
-                # В РЕАЛЬНОСТИ: new_price = self.parse_price(product['article'])
-                new_price = self._simulate_price_update(product_id)
+                if collected is not None:
+                    result = collected[product_id]
+                    if not result.ok:
+                        raise RuntimeError(result.error)
+                    new_price = result.price
+                else:
+                    new_price = self._simulate_price_update(product_id)
                 
                 # Добавляем запись
                 new_records.append({
                     'id': next_id,
                     'product_id': product_id,
                     'price': float(new_price),
-                    'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                    'created_at': pd.Timestamp(datetime.now()).floor('s')
                 })
                 
                 next_id += 1
@@ -68,24 +119,103 @@ class PriceUpdater:
                 
                 print(f"  ✓ Товар {product['name'][:40]:40} - {new_price:.2f} руб")
                 
-                # Задержка чтобы не перегружать сервер
-                time.sleep(0.1)
-                
             except Exception as e:
                 print(f"  ✗ Ошибка для товара {product_id}: {e}")
         
         # Добавляем новые записи
         if new_records:
             new_df = pd.DataFrame(new_records)
-            self.price_history = pd.concat([self.price_history, new_df], ignore_index=True)
             
-            # Сохраняем
-            self.price_history.to_csv(self.history_file, index=False, encoding='utf-8')
+            # Сохраняем: дописываются только новые строки. Запись идёт до
+            # обновления состояний тренда - их сверка читает историю из хранилища
+            if self.store is not None:
+                self.store.append_frame(new_df)
+                self.index = self.store.index
+            else:
+                append_history_frame(self.history_file, new_df)
+                self.index = self.index.merge(frame_columns(new_df))
+            
+            # Обновляем состояния тренда и сбрасываем устаревшие прогнозы
+            for record in new_records:
+                self.trend_states.add(record['product_id'], record['price'])
+            self._verify_trend_states()
+            if self.forecast_cache is not None:
+                self.forecast_cache.invalidate_products(new_df['product_id'].tolist())
+            
+            # Фактические цены для сверки выданных прогнозов (MAPE товаров)
+            if self.errors is not None:
+                self.errors.record_actuals(
+                    new_df['product_id'].to_numpy(),
+                    new_df['price'].to_numpy(),
+                    new_df['created_at'].to_numpy()
+                )
+            
+            if isinstance(self.store, HistoryStore):
+                self.compaction = self.store.compact_async(min_segments=self.compact_after)
             print(f"\n✅ Обновлено товаров: {updated_count}")
             print(f"✅ Новых записей: {len(new_records)}")
         
         return updated_count
     
+    def _load_csv_history(self) -> HistoryIndex:
+        """
+        Один потоковый проход по CSV (HistoryStream): состояния тренда
+        и сводка для индекса; в памяти - блок строк и ряд одного товара
+        """
+        stream = HistoryStream(self.history_file)
+        product_ids, last_prices, last_created_at, counts = [], [], [], []
+        for product_id, prices, created_at in stream:
+            self.trend_states.load(product_id, prices.tolist())
+            product_ids.append(product_id)
+            last_prices.append(prices[-1])
+            last_created_at.append(created_at[-1].astype('datetime64[s]').astype(np.int64))
+            counts.append(len(prices))
+        return HistoryIndex.from_latest(product_ids, last_prices, last_created_at, counts, stream.stats.max_id)
+    
+    def _collect_prices(self) -> dict:
+        """
+        Параллельный сбор цен всех товаров через PriceCollector
+        
+        Частоту запросов ограничивает token bucket маркетплейса,
+        а не пауза между товарами.
+        
+        Returns:
+            CollectResult по product_id
+        """
+        marketplaces = self.products['marketplace'] if 'marketplace' in self.products \
+            else ["wildberries"] * len(self.products)
+        requests = zip(self.products['id'], self.products['article'].astype(str), marketplaces)
+        results = self.collector.collect_sync(requests)
+        print(f"  🌐 Запросов: {self.collector.stats.requests}, "
+              f"повторов: {self.collector.stats.retries}, "
+              f"ошибок: {self.collector.stats.failures} "
+              f"({self.collector.stats.elapsed:.2f}с)")
+        return {result.key: result for result in results}
+    
+    def _verify_trend_states(self) -> None:
+        """
+        Сверка состояний тренда, которым пора (recompute_every обновлений)
+
+        Срок обычно подходит у всех товаров в одном запуске, поэтому история
+        читается один раз на запуск: хранилище отдаёт ряды по индексу,
+        CSV - одним потоковым проходом (HistoryStream), а не по файлу на товар.
+        """
+        due = set(self.trend_states.due())
+        if not due:
+            return
+        if self.store is not None:
+            histories = ((product_id, self.store.series(product_id)[0]) for product_id in sorted(due))
+        else:
+            histories = (
+                (product_id, prices)
+                for product_id, prices, _ in HistoryStream(self.history_file)
+                if product_id in due
+            )
+        rebuilds = self.trend_states.rebuilds
+        for product_id, prices in histories:
+            self.trend_states.verify(product_id, prices.tolist())
+        print(f"  📐 Сверка трендов: {len(due)} товаров, пересчитано: {self.trend_states.rebuilds - rebuilds}")
+    
     def _simulate_price_update(self, product_id: int) -> float:
         """
         СИМУЛЯЦИЯ обновления цены
@@ -106,16 +236,14 @@ class PriceUpdater:
             # ...
         """
         
-        # Получаем последнюю цену
-        product_history = self.price_history[
-            self.price_history['product_id'] == product_id
-        ].sort_values('created_at')
+        # Получаем последнюю цену из индекса
+        latest = self.index.latest(product_id)
         
-        if len(product_history) == 0:
+        if latest is None:
             # Если нет истории, используем базовую цену
             return 50000.0
         
-        last_price = product_history.iloc[-1]['price']
+        last_price, _ = latest
         
         # Симулируем изменение цены (из dtasetik.py)
         # Случайное изменение ±2%
@@ -154,8 +282,15 @@ class PriceUpdater:
         Returns:
             Цена товара
         
-        TODO: Реализовать реальный парсинг
+        С PriceCollector запрос идёт через его пул соединений,
+        лимит частоты и повторы.
         """
+        if self.collector is not None:
+            result = self.collector.collect_sync([(article, article, marketplace)])[0]
+            if not result.ok:
+                raise RuntimeError(f"{marketplace}/{article}: {result.error}")
+            return result.price
+        
         if marketplace == "wildberries":
             return self._parse_wildberries(article)
         elif marketplace == "ozon":
@@ -241,13 +376,42 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Обновление цен товаров')
     parser.add_argument('--schedule', action='store_true', help='Запустить планировщик')
     parser.add_argument('--now', action='store_true', help='Обновить цены сейчас')
+    parser.add_argument('--marketplace-url', default=None,
+                        help='Шлюз маркетплейсов {url}/{marketplace}/{article} (например, заглушка)')
+    parser.add_argument('--rate', type=float, default=5.0, help='Запросов в секунду на маркетплейс')
+    parser.add_argument('--concurrency', type=int, default=50, help='Одновременных запросов')
+    parser.add_argument('--timeout', type=float, default=10.0, help='Таймаут запроса, секунды')
+    parser.add_argument('--retries', type=int, default=3, help='Повторов при ошибке')
+    parser.add_argument('--errors-db', default=None, help='SQLite-файл ErrorStore (сверка прогнозов с новыми ценами)')
+    parser.add_argument('--cache-db', default=None,
+                        help='SQLite-файл кэша прогнозов воркеров (--cache-db ml_service) - сброс товаров с новой ценой')
     
     args = parser.parse_args()
     
     if args.schedule:
         schedule_daily_updates()
     elif args.now:
-        updater = PriceUpdater()
+        collector = None
+        if args.marketplace_url:
+            from services.price_collector import aiohttp, marketplaces_from_base_url
+            if aiohttp is None:
+                print("❌ Установите aiohttp: pip install aiohttp")
+                sys.exit(1)
+            collector = PriceCollector(
+                marketplaces_from_base_url(args.marketplace_url, rate=args.rate),
+                concurrency=args.concurrency,
+                timeout=args.timeout,
+                retries=args.retries
+            )
+        errors = None
+        if args.errors_db:
+            from services.error_store import ErrorStore
+            errors = ErrorStore(args.errors_db)
+        forecast_cache = None
+        if args.cache_db:
+            from services.forecast_cache import ForecastCache
+            forecast_cache = ForecastCache(max_size=0, disk_path=args.cache_db)
+        updater = PriceUpdater(forecast_cache=forecast_cache, collector=collector, errors=errors)
         updater.update_prices()
     else:
         print("Использование:")
@@ -42,7 +42,8 @@ class ConfidenceCalculator:
     def calculate_data_quality(
         price_history: List[float],
         successful_parses: int = None,
-        total_parses: int = None
+        total_parses: int = None,
+        stats=None
     ) -> float:
         """
         1. Качество данных (вес 40%)
@@ -51,12 +52,14 @@ class ConfidenceCalculator:
         - полнота_истории = min(количество_точек / 30, 1.0)
         - стабильность_сбора = успешных_парсингов / общих_попыток
         - волатильность_цен = 1.0 - (std(последние_10) / средняя_цена)
+        
+        stats: SeriesStats запроса - моменты хвостового окна берутся из неё
         """
-        if not price_history:
+        if stats is None and len(price_history) == 0:
             return 0.0
         
         # 1.1 Полнота истории
-        data_points = len(price_history)
+        data_points = stats.n if stats is not None else len(price_history)
         completeness = min(data_points / 30, 1.0)
         
         # 1.2 Стабильность сбора
@@ -66,10 +69,15 @@ class ConfidenceCalculator:
             stability = 1.0  # Предполагаем стабильность если нет данных
         
         # 1.3 Волатильность цен (последние 10 точек или все если меньше)
-        recent_prices = price_history[-10:] if len(price_history) >= 10 else price_history
-        if len(recent_prices) > 1:
+        if stats is not None:
+            recent_count, std, mean = stats.tail_size, stats.tail_std, stats.tail_mean
+        else:
+            recent_prices = price_history[-10:] if len(price_history) >= 10 else price_history
+            recent_count = len(recent_prices)
             std = np.std(recent_prices)
             mean = np.mean(recent_prices)
+        
+        if recent_count > 1:
             volatility_score = 1.0 - min(std / mean, 1.0) if mean > 0 else 0.5
         else:
             volatility_score = 0.5
@@ -111,6 +119,18 @@ class ConfidenceCalculator:
         model_quality = (accuracy_score + consistency + stability) / 3
         return float(model_quality)
     
+    @staticmethod
+    def calculate_model_quality_batch(
+        mape: np.ndarray,
+        forecast_correlation: float = None,
+        stability_score: float = None
+    ) -> np.ndarray:
+        """Качество модели для пакета (своя MAPE у каждого товара)"""
+        accuracy_score = 1.0 - np.minimum(np.asarray(mape, dtype=float) / 100, 1.0)
+        consistency = forecast_correlation if forecast_correlation is not None else 0.8
+        stability = stability_score if stability_score is not None else 0.9
+        return (accuracy_score + consistency + stability) / 3
+    
     @staticmethod
     def calculate_external_factors(
         seasonal_match: float = None,
@@ -140,6 +160,7 @@ class ConfidenceCalculator:
         mape: float,
         successful_parses: int = None,
         total_parses: int = None,
+        stats=None,
         **kwargs
     ) -> ConfidenceComponents:
         """
@@ -150,6 +171,7 @@ class ConfidenceCalculator:
             mape: MAPE модели (в процентах)
             successful_parses: Количество успешных парсингов
             total_parses: Общее количество попыток парсинга
+            stats: SeriesStats запроса (без повторных проходов по истории)
             **kwargs: Дополнительные параметры
         
         Returns:
@@ -157,7 +179,7 @@ class ConfidenceCalculator:
         """
         # 1. Качество данных
         data_quality = cls.calculate_data_quality(
-            price_history, successful_parses, total_parses
+            price_history, successful_parses, total_parses, stats
         )
         
         # 2. Качество модели
@@ -181,23 +203,117 @@ class ConfidenceCalculator:
             cls.WEIGHT_EXTERNAL * external
         )
         
-        # Определяем уровень
-        if confidence >= 0.9:
-            level = "высокая уверенность"
-        elif confidence >= 0.7:
-            level = "средняя уверенность"
-        elif confidence >= 0.5:
-            level = "низкая уверенность"
-        else:
-            level = "очень низкая уверенность"
-        
         return ConfidenceComponents(
             data_quality=data_quality,
             model_quality=model_quality,
             external_factors=external,
             final_confidence=confidence,
-            level=level
+            level=cls.confidence_level(confidence)
         )
+    
+    @staticmethod
+    def confidence_level(confidence: float) -> str:
+        """Уровень уверенности по итоговому значению"""
+        if confidence >= 0.9:
+            return "высокая уверенность"
+        elif confidence >= 0.7:
+            return "средняя уверенность"
+        elif confidence >= 0.5:
+            return "низкая уверенность"
+        return "очень низкая уверенность"
+    
+    @staticmethod
+    def calculate_data_quality_batch(
+        prices: np.ndarray,
+        lengths: np.ndarray,
+        successful_parses: int = None,
+        total_parses: int = None
+    ) -> np.ndarray:
+        """
+        Качество данных для пакета товаров (та же формула, что calculate_data_quality)
+        
+        Args:
+            prices: Матрица (n_products, max_len), ряды прижаты влево
+            lengths: Длина истории каждого товара
+        """
+        lengths = np.asarray(lengths)
+        
+        # 1.1 Полнота истории
+        completeness = np.minimum(lengths / 30, 1.0)
+        
+        # 1.2 Стабильность сбора
+        if successful_parses is not None and total_parses is not None and total_parses > 0:
+            stability = successful_parses / total_parses
+        else:
+            stability = 1.0
+        
+        # 1.3 Волатильность по последним 10 точкам
+        count = np.minimum(lengths, 10)
+        idx = (lengths - count)[:, None] + np.arange(10)
+        valid = np.arange(10) < count[:, None]
+        recent = np.where(valid, np.take_along_axis(prices, np.minimum(idx, prices.shape[1] - 1), axis=1), 0.0)
+        
+        safe_count = np.maximum(count, 1)
+        mean = recent.sum(axis=1) / safe_count
+        std = np.sqrt((np.where(valid, recent - mean[:, None], 0.0) ** 2).sum(axis=1) / safe_count)
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            volatility_score = np.where(mean > 0, 1.0 - np.minimum(std / mean, 1.0), 0.5)
+        volatility_score = np.where(count > 1, volatility_score, 0.5)
+        
+        data_quality = (completeness + stability + volatility_score) / 3
+        return np.where(lengths > 0, data_quality, 0.0)
+    
+    @classmethod
+    def calculate_confidence_batch(
+        cls,
+        prices: np.ndarray,
+        lengths: np.ndarray,
+        mape: float,
+        successful_parses: int = None,
+        total_parses: int = None,
+        **kwargs
+    ) -> List[ConfidenceComponents]:
+        """
+        Пакетный расчёт уверенности
+        
+        Качество данных считается векторно по всем товарам,
+        качество модели и внешние факторы - теми же формулами, что и в calculate_confidence.
+        mape - одно значение или массив (своя MAPE у каждого товара).
+        """
+        data_quality = cls.calculate_data_quality_batch(
+            prices, lengths, successful_parses, total_parses
+        )
+        model_quality = np.broadcast_to(
+            cls.calculate_model_quality_batch(
+                mape,
+                kwargs.get('forecast_correlation'),
+                kwargs.get('stability_score')
+            ),
+            data_quality.shape
+        )
+        external = cls.calculate_external_factors(
+            kwargs.get('seasonal_match'),
+            kwargs.get('category_reliability'),
+            kwargs.get('market_stability')
+        )
+        
+        confidence = (
+            cls.WEIGHT_DATA * data_quality +
+            cls.WEIGHT_MODEL * model_quality +
+            cls.WEIGHT_EXTERNAL * external
+        )
+        
+        return [
+            ConfidenceComponents(
+                data_quality=dq,
+                model_quality=mq,
+                external_factors=external,
+                final_confidence=c,
+                level=cls.confidence_level(c)
+            )
+            for dq, mq, c in zip(data_quality.tolist(), model_quality.tolist(), confidence.tolist())
+        ]
 
 
 # ============================================================================
@@ -0,0 +1,575 @@
+"""
+Хранилище фактической точности прогнозов по товарам и моделям
+Выданные прогнозы ждут фактических цен; каждая новая цена сравнивается
+с прогнозом на её день, и ошибка товара обновляется за O(1).
+
+Запрос читает MAPE товара из словаря в памяти и ставит прогноз в очередь -
+без бэктеста и без обращения к диску. SQLite-файл (опционально) переживает
+перезапуск и связывает процессы: воркеры регистрируют прогнозы, PriceUpdater
+сверяет их с новыми ценами. Фоновый поток раз в refresh секунд пишет очередь
+одной транзакцией и забирает только изменённые другими процессами ошибки
+(по номеру версии строки), не перечитывая таблицы.
+"""
+import sqlite3
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+
+# Оценка для товара без сравнений (прежнее фиксированное значение сервиса)
+DEFAULT_MAPE = 10.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS forecast_errors (
+    product_id INTEGER NOT NULL,
+    model_type TEXT NOT NULL,
+    weight REAL NOT NULL,
+    ape_sum REAL NOT NULL,
+    count INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (product_id, model_type)
+);
+CREATE TABLE IF NOT EXISTS pending_forecasts (
+    product_id INTEGER NOT NULL,
+    model_type TEXT NOT NULL,
+    start_day INTEGER NOT NULL,
+    last_day INTEGER NOT NULL,
+    predictions BLOB NOT NULL,
+    PRIMARY KEY (product_id, model_type)
+);
+"""
+
+# Чтение изменённых строк - диапазон по индексу версии
+VERSION_INDEX = "CREATE INDEX IF NOT EXISTS ix_forecast_errors_version ON forecast_errors (version)"
+
+# Прогноз из очереди заменяет записанный, только если тот сверен до конца
+# или устарел - то же правило, что и для прогнозов в памяти
+UPSERT_PENDING = """
+INSERT INTO pending_forecasts (product_id, model_type, start_day, last_day, predictions)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (product_id, model_type) DO UPDATE SET
+    start_day = excluded.start_day,
+    last_day = excluded.last_day,
+    predictions = excluded.predictions
+WHERE pending_forecasts.start_day + length(pending_forecasts.predictions) / 8 - 1 < excluded.start_day
+   OR pending_forecasts.last_day >= pending_forecasts.start_day + length(pending_forecasts.predictions) / 8 - 1
+"""
+
+# Параметров в одном IN (...) - ниже лимита SQLite
+IN_CHUNK = 500
+
+
+def _day(value) -> int:
+    """datetime / Timestamp / datetime64 -> номер дня от эпохи"""
+    return int(np.datetime64(value, 'D').astype(np.int64))
+
+
+@dataclass
+class ErrorStats:
+    """
+    Затухающие суммы абсолютных процентных ошибок (APE)
+
+    Каждое новое сравнение умножает прошлые суммы на decay,
+    поэтому оценка следует за изменением поведения товара.
+    """
+    weight: float = 0.0       # Σ decay^k
+    ape_sum: float = 0.0      # Σ decay^k · APE
+    count: int = 0            # Всего сравнений
+    updated_at: float = 0.0
+
+    def add(self, ape: float, decay: float) -> None:
+        self.weight = self.weight * decay + 1.0
+        self.ape_sum = self.ape_sum * decay + ape
+        self.count += 1
+        self.updated_at = time.time()
+
+
+@dataclass
+class PendingForecast:
+    """Прогноз, ожидающий фактических цен: predictions[k] - на день start_day + k"""
+    start_day: int
+    predictions: np.ndarray
+    last_day: int             # Последний сверенный день
+
+    @property
+    def end_day(self) -> int:
+        return self.start_day + len(self.predictions) - 1
+
+
+class ErrorStore:
+    """
+    MAPE по (товар, модель)
+
+    Оценка сглаживается к prior_mape: (prior · prior_weight + Σ APE) /
+    (prior_weight + Σ весов), так что пара первых сравнений не даёт
+    крайних значений уверенности.
+
+    На товар и модель отслеживается один прогноз за раз: новый
+    регистрируется, когда предыдущий сверен до конца или устарел.
+    Так каждая цена сравнивается с прогнозом на 1..track_days дней
+    вперёд, как в оценке 7-дневного прогноза, а не только на день вперёд.
+
+    С SQLite-файлом путь запроса (mape, register) не обращается к диску:
+    регистрации копятся в очереди, фоновый поток раз в refresh секунд
+    записывает её и подтягивает строки forecast_errors с версией новее
+    увиденной. Сверка (record_actuals) читает прогнозы и ошибки своих
+    товаров из файла в одной транзакции - файл здесь главный источник.
+    Регистрации последних refresh секунд теряются, если процесс
+    завершился без close().
+    """
+
+    def __init__(
+        self,
+        path: str = None,
+        prior_mape: float = DEFAULT_MAPE,
+        prior_weight: float = 3.0,
+        decay: float = 0.98,
+        track_days: int = 7,
+        refresh: float = 1.0
+    ):
+        """
+        Args:
+            path: SQLite-файл (None - только в памяти)
+            prior_mape: Оценка без данных
+            prior_weight: Вес prior_mape в сравнениях
+            decay: Затухание старых сравнений (1.0 - простое среднее)
+            track_days: Сколько дней прогноза сверяется
+            refresh: Период фоновой синхронизации с файлом, секунды
+        """
+        self.path = path
+        self.prior_mape = prior_mape
+        self.prior_weight = prior_weight
+        self.decay = decay
+        self.track_days = track_days
+        self.refresh = refresh
+
+        self._errors: Dict[Tuple[int, str], ErrorStats] = {}
+        self._pending: Dict[int, Dict[str, PendingForecast]] = {}   # Без файла
+        self._queue: Dict[Tuple[int, str], tuple] = {}
+        self._lock = threading.Lock()        # Словари и очередь в памяти
+        self._db_lock = threading.Lock()     # Соединение SQLite
+
+        self._db = None
+        self._data_version = None
+        self._seen_version = 0
+        self.synced_rows = 0                 # Строк ошибок, полученных от других процессов
+        self._stop = threading.Event()
+        self._thread = None
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False, timeout=30.0)
+            self._db.executescript(SCHEMA)
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(forecast_errors)")]
+            if "version" not in columns:
+                self._db.execute("ALTER TABLE forecast_errors ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            self._db.execute(VERSION_INDEX)
+            self._db.commit()
+            self._load()
+
+            self._thread = threading.Thread(target=self._run, name="error-store-sync", daemon=True)
+            self._thread.start()
+
+    # ------------------------------------------------------------------
+    # Чтение (путь запроса)
+    # ------------------------------------------------------------------
+
+    def mape(self, product_id: int, model_type: str) -> float:
+        """Оценка MAPE товара для модели - O(1)"""
+        stats = self._errors.get((int(product_id), model_type))
+        if stats is None:
+            return self.prior_mape
+        return (self.prior_mape * self.prior_weight + stats.ape_sum) / (self.prior_weight + stats.weight)
+
+    def mape_batch(self, product_ids: Iterable[int], model_type: str) -> np.ndarray:
+        """MAPE для пакета товаров"""
+        return np.array([self.mape(pid, model_type) for pid in product_ids], dtype=np.float64)
+
+    def stats(self, product_id: int, model_type: str) -> Optional[ErrorStats]:
+        return self._errors.get((int(product_id), model_type))
+
+    # ------------------------------------------------------------------
+    # Регистрация прогнозов
+    # ------------------------------------------------------------------
+
+    def register(self, product_id: int, model_type: str, last_date, predictions) -> bool:
+        """
+        Прогноз от даты последней цены last_date
+
+        Returns:
+            True, если прогноз поставлен на сверку (с файлом - в очередь записи)
+        """
+        return self.register_batch([product_id], model_type, [last_date], [predictions]) == 1
+
+    def register_batch(self, product_ids, model_type: str, last_dates, predictions) -> int:
+        """
+        Прогнозы пакета (predictions - матрица (n, horizon) или список рядов)
+
+        Без файла прогноз сразу встаёт на сверку, если предыдущий сверен
+        или устарел. С файлом - попадает в очередь (по одному на товар
+        и модель), а то же правило применяет запись очереди в файл.
+
+        Returns:
+            Сколько прогнозов поставлено на сверку (в очередь)
+        """
+        added = 0
+        with self._lock:
+            for product_id, last_date, forecast in zip(product_ids, last_dates, predictions):
+                product_id = int(product_id)
+                start_day = _day(last_date) + 1
+
+                if self._db is not None:
+                    queued = self._queue.get((product_id, model_type))
+                    if queued is not None and queued[2] >= start_day:
+                        continue
+                    values = np.asarray(forecast, dtype=np.float64)[:self.track_days]
+                    self._queue[(product_id, model_type)] = (
+                        product_id, model_type, start_day, start_day - 1, values.tobytes()
+                    )
+                    added += 1
+                    continue
+
+                models = self._pending.setdefault(product_id, {})
+                pending = models.get(model_type)
+                if pending is not None and pending.end_day >= start_day and pending.last_day < pending.end_day:
+                    continue
+                values = np.asarray(forecast, dtype=np.float64)[:self.track_days].copy()
+                models[model_type] = PendingForecast(start_day, values, start_day - 1)
+                added += 1
+        return added
+
+    # ------------------------------------------------------------------
+    # Фактические цены
+    # ------------------------------------------------------------------
+
+    def record_actual(self, product_id: int, price: float, created_at) -> int:
+        """Новая фактическая цена товара; возвращает число сверенных прогнозов"""
+        return self.record_actuals([product_id], [price], [created_at])
+
+    def record_actuals(self, product_ids, prices, created_at) -> int:
+        """
+        Новые фактические цены (например, записи одного запуска PriceUpdater)
+
+        Цена сверяется с прогнозом на её день; второй раз за день тот же
+        прогноз не сверяется. Полностью сверенные и устаревшие прогнозы
+        снимаются.
+
+        С файлом прогнозы и ошибки этих товаров читаются из него в той же
+        транзакции, что и запись результата: видны прогнозы всех воркеров,
+        а параллельная сверка другим процессом не теряется.
+
+        Returns:
+            Число сравнений
+        """
+        product_ids = [int(pid) for pid in product_ids]
+        days = np.asarray(created_at).astype('datetime64[D]').astype(np.int64).tolist()
+
+        if self._db is None:
+            with self._lock:
+                compared, _, _, _ = self._compare(product_ids, prices, days, self._pending, self._errors)
+            return compared
+
+        self.flush()
+        with self._db_lock, self._db:
+            self._db.execute("BEGIN IMMEDIATE")
+            pending = self._read_pending(product_ids)
+            errors = self._read_errors(product_ids)
+            compared, error_rows, pending_rows, done_rows = self._compare(
+                product_ids, prices, days, pending, errors
+            )
+            version = self._db.execute("SELECT COALESCE(MAX(version), 0) FROM forecast_errors").fetchone()[0] + 1
+            self._db.executemany(
+                "INSERT OR REPLACE INTO forecast_errors "
+                "(product_id, model_type, weight, ape_sum, count, updated_at, version) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [row + (version,) for row in error_rows]
+            )
+            self._db.executemany(
+                "UPDATE pending_forecasts SET last_day = ? WHERE product_id = ? AND model_type = ?",
+                pending_rows
+            )
+            self._db.executemany(
+                "DELETE FROM pending_forecasts WHERE product_id = ? AND model_type = ?",
+                done_rows
+            )
+
+        with self._lock:
+            for product_id, model_type, *_ in error_rows:
+                self._errors[(product_id, model_type)] = errors[(product_id, model_type)]
+        return compared
+
+    def _compare(self, product_ids, prices, days, pending, errors):
+        """
+        Сверка цен с прогнозами pending, ошибки копятся в errors
+
+        Returns:
+            (сравнений, строки ошибок, строки last_day, снятые прогнозы)
+        """
+        compared = 0
+        error_rows, pending_rows, done_rows = [], [], []
+        for product_id, price, day in zip(product_ids, prices, days):
+            models = pending.get(product_id)
+            if not models or price is None or price <= 0:
+                continue
+
+            for model_type, forecast in list(models.items()):
+                if day <= forecast.last_day or day < forecast.start_day:
+                    continue
+                if day <= forecast.end_day:
+                    predicted = forecast.predictions[day - forecast.start_day]
+                    stats = errors.setdefault((product_id, model_type), ErrorStats())
+                    stats.add(float(abs(price - predicted) / price * 100), self.decay)
+                    forecast.last_day = day
+                    compared += 1
+                    error_rows.append((product_id, model_type, stats.weight, stats.ape_sum,
+                                       stats.count, stats.updated_at))
+
+                if day >= forecast.end_day:
+                    del models[model_type]
+                    done_rows.append((product_id, model_type))
+                else:
+                    pending_rows.append((forecast.last_day, product_id, model_type))
+        return compared, error_rows, pending_rows, done_rows
+
+    # ------------------------------------------------------------------
+    # Синхронизация с файлом
+    # ------------------------------------------------------------------
+
+    def sync(self) -> int:
+        """
+        Запись очереди и приём ошибок, изменённых другими процессами
+
+        Returns:
+            Сколько строк ошибок получено
+        """
+        if self._db is None:
+            return 0
+        self.flush()
+        with self._db_lock:
+            # data_version меняется только после коммитов других соединений
+            data_version = self._db.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == self._data_version:
+                return 0
+            self._data_version = data_version
+            rows = self._db.execute(
+                "SELECT product_id, model_type, weight, ape_sum, count, updated_at, version "
+                "FROM forecast_errors WHERE version > ?",
+                (self._seen_version,)
+            ).fetchall()
+
+        with self._lock:
+            for product_id, model_type, weight, ape_sum, count, updated_at, version in rows:
+                self._errors[(product_id, model_type)] = ErrorStats(weight, ape_sum, count, updated_at)
+                self._seen_version = max(self._seen_version, version)
+        self.synced_rows += len(rows)
+        return len(rows)
+
+    def flush(self) -> int:
+        """Запись очереди регистраций одной транзакцией; возвращает число строк"""
+        if self._db is None:
+            return 0
+        with self._lock:
+            rows, self._queue = list(self._queue.values()), {}
+        if rows:
+            with self._db_lock, self._db:
+                self._db.executemany(UPSERT_PENDING, rows)
+        return len(rows)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.refresh):
+            try:
+                self.sync()
+            except sqlite3.Error as e:
+                print(f"⚠️ ErrorStore: синхронизация не удалась: {e}", file=sys.stderr)
+
+    def _read_pending(self, product_ids) -> Dict[int, Dict[str, PendingForecast]]:
+        pending: Dict[int, Dict[str, PendingForecast]] = {}
+        for rows in self._select_in(
+            "SELECT product_id, model_type, start_day, last_day, predictions FROM pending_forecasts",
+            product_ids
+        ):
+            for product_id, model_type, start_day, last_day, blob in rows:
+                pending.setdefault(product_id, {})[model_type] = PendingForecast(
+                    start_day, np.frombuffer(blob, dtype=np.float64).copy(), last_day
+                )
+        return pending
+
+    def _read_errors(self, product_ids) -> Dict[Tuple[int, str], ErrorStats]:
+        errors: Dict[Tuple[int, str], ErrorStats] = {}
+        for rows in self._select_in(
+            "SELECT product_id, model_type, weight, ape_sum, count, updated_at FROM forecast_errors",
+            product_ids
+        ):
+            for product_id, model_type, weight, ape_sum, count, updated_at in rows:
+                errors[(product_id, model_type)] = ErrorStats(weight, ape_sum, count, updated_at)
+        return errors
+
+    def _select_in(self, query: str, product_ids):
+        """query с WHERE product_id IN (...) порциями по IN_CHUNK"""
+        product_ids = sorted(set(product_ids))
+        for lo in range(0, len(product_ids), IN_CHUNK):
+            chunk = product_ids[lo:lo + IN_CHUNK]
+            yield self._db.execute(
+                f"{query} WHERE product_id IN ({', '.join('?' * len(chunk))})", chunk
+            ).fetchall()
+
+    # ------------------------------------------------------------------
+    # Служебное
+    # ------------------------------------------------------------------
+
+    def items(self) -> Iterable[Tuple[int, str, float, int]]:
+        """(product_id, model_type, MAPE, число сравнений) по всем парам"""
+        for (product_id, model_type), stats in list(self._errors.items()):
+            yield product_id, model_type, self.mape(product_id, model_type), stats.count
+
+    def pending_count(self) -> int:
+        if self._db is not None:
+            self.flush()
+            with self._db_lock:
+                return self._db.execute("SELECT COUNT(*) FROM pending_forecasts").fetchone()[0]
+        return sum(len(models) for models in self._pending.values())
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._stop.set()
+            self._thread.join()
+            self.flush()
+            self._db.close()
+            self._db = None
+
+    def __len__(self) -> int:
+        return len(self._errors)
+
+    def _load(self) -> None:
+        """Ошибки всех товаров - один раз при открытии файла"""
+        for product_id, model_type, weight, ape_sum, count, updated_at, version in self._db.execute(
+            "SELECT product_id, model_type, weight, ape_sum, count, updated_at, version FROM forecast_errors"
+        ):
+            self._errors[(product_id, model_type)] = ErrorStats(weight, ape_sum, count, updated_at)
+            self._seen_version = max(self._seen_version, version)
+        self._data_version = self._db.execute("PRAGMA data_version").fetchone()[0]
+
+
+# ============================================================================
+# ТЕСТИРОВАНИЕ
+# ============================================================================
+
+def _register_in_process(path: str, product_id: int, last_date: str, predictions) -> None:
+    store = ErrorStore(path)
+    store.register(product_id, "linear", np.datetime64(last_date), predictions)
+    store.close()
+
+
+def _record_in_process(path: str, product_id: int, price: float, created_at: str) -> None:
+    store = ErrorStore(path)
+    store.record_actual(product_id, price, np.datetime64(created_at))
+    store.close()
+
+
+def run_check(products: int = 100_000) -> None:
+    """Два процесса на одном файле: воркер читает и регистрирует, PriceUpdater сверяет"""
+    import multiprocessing
+    import os
+    import tempfile
+
+    print("🔄 Проверка обмена ErrorStore между процессами\n")
+
+    def in_process(target, *args):
+        process = multiprocessing.Process(target=target, args=args)
+        process.start()
+        process.join()
+        assert process.exitcode == 0
+
+    def wait_until(condition, timeout: float = 10.0) -> None:
+        deadline = time.monotonic() + timeout
+        while not condition():
+            assert time.monotonic() < deadline, "фоновая синхронизация не успела"
+            time.sleep(0.05)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "errors.db")
+        refresh = 0.2
+
+        # Воркер выдал прогноз, другой процесс сверил его с новой ценой
+        reader = ErrorStore(path, refresh=refresh)
+        reader.register(1, "linear", np.datetime64("2024-01-01"), [100.0] * 7)
+        assert reader.mape(1, "linear") == reader.prior_mape
+        reader.flush()
+
+        in_process(_record_in_process, path, 1, 110.0, "2024-01-02")
+        expected = (reader.prior_mape * reader.prior_weight + 100 / 11) / (reader.prior_weight + 1)
+        wait_until(lambda: abs(reader.mape(1, "linear") - expected) < 1e-9)
+        print(f"  Читатель увидел сверку другого процесса: MAPE {reader.mape(1, 'linear'):.3f}% ✓")
+
+        # Долгоживущий PriceUpdater видит прогнозы, выданные после его запуска
+        writer = ErrorStore(path, refresh=refresh)
+        in_process(_register_in_process, path, 2, "2024-01-01", [200.0] * 7)
+        assert writer.record_actual(2, 180.0, np.datetime64("2024-01-02")) == 1
+        print(f"  Писатель сверил прогноз, зарегистрированный после его запуска ✓")
+
+        # Повторная регистрация не сбрасывает начатую сверку
+        in_process(_register_in_process, path, 1, "2024-01-01", [100.0] * 7)
+        assert writer.record_actual(1, 100.0, np.datetime64("2024-01-02")) == 0
+        assert writer.record_actual(1, 100.0, np.datetime64("2024-01-03")) == 1
+        print(f"  Повторная регистрация того же прогноза не сбрасывает сверку ✓")
+
+        # Большой каталог: запрос не трогает файл, приём - только изменённые строки
+        version = writer._db.execute("SELECT MAX(version) FROM forecast_errors").fetchone()[0] + 1
+        rows = [(pid, "linear", 1.0, 5.0, 1, 0.0, version) for pid in range(10, 10 + products)]
+        with writer._db:
+            writer._db.executemany(
+                "INSERT OR REPLACE INTO forecast_errors "
+                "(product_id, model_type, weight, ape_sum, count, updated_at, version) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        writer.close()
+        wait_until(lambda: reader.mape(10 + products - 1, "linear") != reader.prior_mape)
+        synced = reader.synced_rows
+
+        start = time.perf_counter()
+        for pid in range(10, 10 + 2000):
+            reader.mape(pid, "linear")
+            reader.register(pid, "linear", np.datetime64("2024-02-01"), [100.0] * 7)
+        per_request = (time.perf_counter() - start) / 2000
+
+        in_process(_record_in_process, path, 1, 90.0, "2024-01-04")
+        wait_until(lambda: reader.synced_rows > synced)
+        assert reader.synced_rows - synced == 1, reader.synced_rows - synced
+        assert reader.pending_count() >= 2000
+        print(f"  {products} товаров: mape + register {per_request * 1e6:.1f} мкс на запрос, "
+              f"после чужой сверки принята 1 строка из {len(reader)} ✓")
+
+        reader.close()
+
+
+# ============================================================================
+# ГЛАВНАЯ ФУНКЦИЯ
+# ============================================================================
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Фактическая точность прогнозов по товарам')
+    parser.add_argument('db', nargs='?', help='SQLite-файл хранилища ошибок')
+    parser.add_argument('--model', default=None, help='Только эта модель')
+    parser.add_argument('--top', type=int, default=20, help='Сколько товаров показать')
+    parser.add_argument('--check', action='store_true', help='Проверка обмена между процессами')
+
+    args = parser.parse_args()
+
+    if args.check:
+        run_check()
+        raise SystemExit
+    if args.db is None:
+        parser.error("укажите SQLite-файл или --check")
+
+    store = ErrorStore(args.db)
+    rows = [row for row in store.items() if args.model is None or row[1] == args.model]
+    rows.sort(key=lambda r: r[2], reverse=True)
+
+    print(f"✅ Пар товар × модель: {len(rows)}, прогнозов на сверке: {store.pending_count()}")
+    print(f"\n📊 Наибольшая ошибка:")
+    for product_id, model_type, mape, count in rows[:args.top]:
+        print(f"  Товар {product_id:6d}  {model_type:8}  MAPE {mape:6.2f}%  (сравнений: {count})")
@@ -0,0 +1,290 @@
+"""
+Кэш результатов прогноза
+Повторные запросы одного товара между ежедневными обновлениями цен
+не пересчитывают весь пайплайн
+"""
+import copy
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Set, Tuple
+from dataclasses import dataclass
+
+
+CacheKey = Tuple[int, str, str, str, str]
+
+# Сколько хранится журнал сбросов (секунды). Процесс, пропустивший
+# удалённые из журнала записи, очищает свою память целиком
+INVALIDATION_RETENTION = 7 * 24 * 3600
+
+
+@dataclass
+class CacheStats:
+    """Счётчики кэша"""
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    invalidations: int = 0
+    disk_hits: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "disk_hits": self.disk_hits,
+            "hit_rate": round(self.hit_rate, 3)
+        }
+
+
+class ForecastCache:
+    """
+    LRU-кэш ответов MLForecastService.generate_forecast
+
+    Ключ: (товар, версия истории, модель, горизонт, сценарий).
+    Версия истории - метка последней цены, поэтому новая цена сама даёт
+    новый ключ; invalidate_product дополнительно освобождает старые записи.
+    Опциональный дисковый уровень (SQLite) переживает перезапуск процесса.
+
+    Без дискового уровня сброс действует только на кэш своего процесса.
+    С общим SQLite-файлом сбросы пишутся в журнал forecast_invalidations,
+    и остальные процессы (воркеры, PriceUpdater) не реже раза в refresh
+    секунд снимают записи этих товаров из своей памяти.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = None, disk_path: str = None,
+                 refresh: float = 1.0):
+        """
+        Args:
+            max_size: Максимум записей в памяти
+            ttl: Время жизни записи в секундах (None - без ограничения)
+            disk_path: Путь к файлу SQLite для дискового уровня
+            refresh: Как часто (секунды) читать журнал сбросов других процессов
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.refresh = refresh
+        self.stats = CacheStats()
+        self._seen = 0          # Последняя прочитанная запись журнала сбросов
+        self._checked = 0.0
+
+        self._entries: "OrderedDict[CacheKey, Tuple[Dict, float]]" = OrderedDict()
+        self._by_product: Dict[int, Set[CacheKey]] = {}
+        self._lock = threading.Lock()
+
+        self._disk = None
+        if disk_path is not None:
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS forecast_cache ("
+                " key TEXT PRIMARY KEY,"
+                " product_id INTEGER NOT NULL,"
+                " value TEXT NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+            self._disk.execute(
+                "CREATE INDEX IF NOT EXISTS ix_forecast_cache_product ON forecast_cache (product_id)"
+            )
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS forecast_invalidations ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " product_id INTEGER NOT NULL,"
+                " invalidated_at REAL NOT NULL)"
+            )
+            self._disk.commit()
+            self._seen = self._disk.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM forecast_invalidations"
+            ).fetchone()[0]
+            self._checked = time.monotonic()
+
+    @staticmethod
+    def make_key(
+        product_id: int,
+        history_version: str,
+        model_type: str,
+        horizon,
+        scenario: str
+    ) -> CacheKey:
+        """Ключ кэша (horizon - число дней или строка набора горизонтов "7,30,90")"""
+        return (int(product_id), str(history_version), model_type, str(horizon), scenario)
+
+    def get(self, key: CacheKey) -> Optional[Dict]:
+        """Ответ из кэша (копия) или None"""
+        now = time.time()
+
+        with self._lock:
+            if self._disk is not None:
+                self._poll_invalidations()
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if self._expired(created_at, now):
+                    self._remove(key)
+                    self.stats.expirations += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.stats.hits += 1
+                    return copy.deepcopy(value)
+
+            if self._disk is not None:
+                row = self._disk.execute(
+                    "SELECT value, created_at FROM forecast_cache WHERE key = ?",
+                    (self._disk_key(key),)
+                ).fetchone()
+                if row is not None and not self._expired(row[1], now):
+                    value = json.loads(row[0])
+                    self._store(key, value, row[1])
+                    self.stats.hits += 1
+                    self.stats.disk_hits += 1
+                    return copy.deepcopy(value)
+
+            self.stats.misses += 1
+            return None
+
+    def put(self, key: CacheKey, value: Dict) -> None:
+        """Сохранение ответа"""
+        created_at = time.time()
+        value = copy.deepcopy(value)
+
+        with self._lock:
+            self._store(key, value, created_at)
+            if self._disk is not None:
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO forecast_cache (key, product_id, value, created_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (self._disk_key(key), key[0], json.dumps(value, ensure_ascii=False), created_at)
+                )
+                self._disk.commit()
+
+    def invalidate_product(self, product_id: int) -> int:
+        """
+        Удаление всех записей товара (вызывается при новой цене)
+
+        Returns:
+            Количество удалённых записей в памяти
+        """
+        return self.invalidate_products([product_id])
+
+    def invalidate_products(self, product_ids: Iterable[int]) -> int:
+        """
+        Удаление записей товаров одной транзакцией дискового уровня
+        (например, всех товаров одного запуска PriceUpdater)
+
+        Returns:
+            Количество удалённых записей в памяти
+        """
+        product_ids = sorted({int(pid) for pid in product_ids})
+        with self._lock:
+            removed = self._drop_products(product_ids)
+
+            if self._disk is not None and product_ids:
+                now = time.time()
+                rows = [(pid,) for pid in product_ids]
+                with self._disk:
+                    self._disk.executemany("DELETE FROM forecast_cache WHERE product_id = ?", rows)
+                    self._disk.executemany(
+                        "INSERT INTO forecast_invalidations (product_id, invalidated_at) VALUES (?, ?)",
+                        [(pid, now) for pid in product_ids]
+                    )
+                    self._disk.execute(
+                        "DELETE FROM forecast_invalidations WHERE invalidated_at < ?",
+                        (now - INVALIDATION_RETENTION,)
+                    )
+        return removed
+
+    def clear(self) -> None:
+        """Полная очистка"""
+        with self._lock:
+            self._entries.clear()
+            self._by_product.clear()
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM forecast_cache")
+                self._disk.commit()
+
+    def close(self) -> None:
+        """Закрытие дискового уровня"""
+        if self._disk is not None:
+            self._disk.close()
+            self._disk = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl is not None and now - created_at > self.ttl
+
+    def _store(self, key: CacheKey, value: Dict, created_at: float) -> None:
+        """Запись в память с вытеснением по LRU (под блокировкой)"""
+        if key in self._entries:
+            self._entries.move_to_end(key)
+        self._entries[key] = (value, created_at)
+        self._by_product.setdefault(key[0], set()).add(key)
+
+        while len(self._entries) > self.max_size:
+            old_key, _ = self._entries.popitem(last=False)
+            self._forget(old_key)
+            self.stats.evictions += 1
+
+    def _drop_products(self, product_ids: Iterable[int]) -> int:
+        """Удаление записей товаров из памяти (под блокировкой)"""
+        removed = 0
+        for product_id in product_ids:
+            keys = list(self._by_product.get(product_id, ()))
+            for key in keys:
+                self._remove(key)
+            removed += len(keys)
+        self.stats.invalidations += removed
+        return removed
+
+    def _poll_invalidations(self) -> None:
+        """
+        Сбросы других процессов из журнала (под блокировкой)
+
+        Читаются только записи после последней увиденной - индексный
+        диапазон по seq, не чаще раза в refresh секунд.
+        """
+        now = time.monotonic()
+        if now - self._checked < self.refresh:
+            return
+        self._checked = now
+
+        rows = self._disk.execute(
+            "SELECT seq, product_id FROM forecast_invalidations WHERE seq > ? ORDER BY seq",
+            (self._seen,)
+        ).fetchall()
+        if not rows:
+            return
+        if rows[0][0] > self._seen + 1:
+            # Часть журнала уже удалена - какие товары сброшены, неизвестно
+            self.stats.invalidations += len(self._entries)
+            self._entries.clear()
+            self._by_product.clear()
+        else:
+            self._drop_products({product_id for _, product_id in rows})
+        self._seen = rows[-1][0]
+
+    def _remove(self, key: CacheKey) -> None:
+        """Удаление записи из памяти (под блокировкой)"""
+        if self._entries.pop(key, None) is not None:
+            self._forget(key)
+
+    def _forget(self, key: CacheKey) -> None:
+        keys = self._by_product.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_product[key[0]]
+
+    @staticmethod
+    def _disk_key(key: CacheKey) -> str:
+        return json.dumps(list(key), ensure_ascii=False)
@@ -0,0 +1,167 @@
+"""
+Локальная заглушка маркетплейса для проверки PriceCollector
+GET /{marketplace}/{article} -> {"article": ..., "price": ...}
+
+Умеет задержку ответа, случайные 503 и собственный лимит частоты
+(429 с Retry-After), чтобы проверять повторы и token bucket без сети.
+"""
+import json
+import random
+import threading
+import time
+import zlib
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Клиент закрыл соединение по таймауту - для заглушки это норма
+        pass
+
+
+class MarketplaceStub:
+    """
+    HTTP-сервер в фоновом потоке
+
+    Цена артикула детерминирована (от crc32 артикула), если не задана в prices.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        prices: Dict[str, Any] = None,
+        latency: float = 0.0,
+        fail_rate: float = 0.0,
+        rate_limit: Optional[float] = None,
+        seed: int = None
+    ):
+        """
+        Args:
+            port: Порт (0 - любой свободный)
+            prices: Цены по артикулу - отдаются как есть, так что можно
+                задать и битое значение (None, строку, список)
+            latency: Задержка ответа, секунды
+            fail_rate: Доля ответов 503
+            rate_limit: Допустимо запросов в секунду на маркетплейс (сверх - 429)
+        """
+        self.prices = prices or {}
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.rate_limit = rate_limit
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = defaultdict(list)       # marketplace -> времена запросов
+        self.rejected = 0
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # HTTP/1.1 - соединения остаются открытыми для пула клиента
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                stub._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = _Server((host, port), Handler)
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def price(self, article: str) -> Any:
+        if article in self.prices:
+            return self.prices[article]
+        return float(10000 + zlib.crc32(article.encode()) % 90000)
+
+    def start(self) -> "MarketplaceStub":
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "MarketplaceStub":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _handle(self, handler: BaseHTTPRequestHandler) -> None:
+        parts = handler.path.strip("/").split("/")
+        if len(parts) != 2:
+            self._send(handler, 404, {"error": "not found"})
+            return
+        marketplace, article = parts
+        now = time.monotonic()
+
+        with self.lock:
+            self.requests[marketplace].append(now)
+            limited = False
+            if self.rate_limit is not None:
+                recent = [t for t in self.requests[marketplace] if now - t < 1.0]
+                limited = len(recent) > self.rate_limit
+            if limited:
+                self.rejected += 1
+            failed = not limited and self.random.random() < self.fail_rate
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        if limited:
+            self._send(handler, 429, {"error": "too many requests"}, {"Retry-After": "1"})
+        elif failed:
+            self._send(handler, 503, {"error": "unavailable"})
+        else:
+            self._send(handler, 200, {"article": article, "price": self.price(article)})
+
+    @staticmethod
+    def _send(handler: BaseHTTPRequestHandler, status: int, payload: dict, headers: dict = None) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.wfile.write(body)
+
+
+# ============================================================================
+# ГЛАВНАЯ ФУНКЦИЯ
+# ============================================================================
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Заглушка маркетплейса')
+    parser.add_argument('--port', type=int, default=8081, help='Порт')
+    parser.add_argument('--latency', type=float, default=0.05, help='Задержка ответа, секунды')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Доля ответов 503')
+    parser.add_argument('--rate-limit', type=float, default=None, help='Запросов в секунду (сверх - 429)')
+
+    args = parser.parse_args()
+
+    stub = MarketplaceStub(
+        port=args.port,
+        latency=args.latency,
+        fail_rate=args.fail_rate,
+        rate_limit=args.rate_limit
+    )
+    print(f"🛒 Заглушка маркетплейса: {stub.base_url}/<marketplace>/<article>")
+    print("Для остановки нажмите Ctrl+C")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Остановлено")
@@ -0,0 +1,295 @@
+"""
+Асинхронный сбор цен с маркетплейсов
+Пул HTTP-соединений на маркетплейс, token bucket на маркетплейс,
+ограниченная конкурентность, таймауты и повторы с экспоненциальной паузой
+
+Время полного обхода определяется допустимой частотой запросов
+к каждому маркетплейсу, а не последовательным ожиданием.
+
+Разбор ответа - только JSON-шлюза вида {"price": ...} (заглушка
+services/marketplace_stub.py или свой прокси). Форматы страниц и API
+Wildberries/Ozon не поддерживаются: их разбор подключается через
+Marketplace.parse.
+"""
+import asyncio
+import json
+import math
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+# Ответы, после которых запрос имеет смысл повторить
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def parse_json_price(body: str) -> float:
+    """
+    Цена из JSON-ответа вида {"price": 51990.0} (формат заглушки)
+
+    Raises:
+        KeyError, TypeError, ValueError: Ответ не того формата или цена
+            не положительное число (null, строка, список)
+    """
+    price = json.loads(body)["price"]
+    if isinstance(price, bool) or not isinstance(price, (int, float)):
+        raise TypeError(f"цена не число: {price!r}")
+    if not math.isfinite(price) or price <= 0:
+        raise ValueError(f"недопустимая цена: {price!r}")
+    return float(price)
+
+
+class TokenBucket:
+    """
+    Ограничение частоты запросов
+
+    Токены пополняются со скоростью rate в секунду до capacity;
+    каждый запрос забирает один токен или ждёт его появления.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        """
+        Args:
+            rate: Запросов в секунду
+            capacity: Размер всплеска (по умолчанию - rate, но не меньше 1)
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+@dataclass
+class Marketplace:
+    """Настройки маркетплейса"""
+    name: str
+    url_template: str                          # "https://host/path/{article}"
+    rate: float = 5.0                          # Запросов в секунду
+    burst: float = None                        # Всплеск (по умолчанию - rate)
+    connections: int = 20                      # Соединений в пуле
+    parse: Callable[[str], float] = parse_json_price
+    headers: Dict[str, str] = field(default_factory=lambda: {'User-Agent': 'Mozilla/5.0'})
+
+
+def marketplaces_from_base_url(
+    base_url: str,
+    names=("wildberries", "ozon"),
+    rate: float = 5.0,
+    burst: float = None
+) -> Dict[str, Marketplace]:
+    """
+    Маркетплейсы за одним шлюзом: {base_url}/{name}/{article}
+
+    Так устроена заглушка services/marketplace_stub.py.
+    """
+    base_url = base_url.rstrip("/")
+    return {
+        name: Marketplace(name, f"{base_url}/{name}/{{article}}", rate=rate, burst=burst)
+        for name in names
+    }
+
+
+@dataclass
+class CollectResult:
+    """Результат запроса одной цены"""
+    key: Any
+    article: str
+    marketplace: str
+    price: Optional[float]
+    error: Optional[str]
+    attempts: int
+    elapsed: float
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class CollectorStats:
+    """Счётчики сборщика"""
+    requests: int = 0
+    retries: int = 0
+    timeouts: int = 0
+    failures: int = 0
+    elapsed: float = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+            "elapsed": round(self.elapsed, 3)
+        }
+
+
+class _RetryableStatus(Exception):
+    def __init__(self, status: int, retry_after: Optional[float]):
+        super().__init__(f"HTTP {status}")
+        self.retry_after = retry_after
+
+
+class PriceCollector:
+    """
+    Параллельный сбор цен
+
+    concurrency воркеров разбирают общую очередь запросов, поэтому память
+    не зависит от размера каталога. Перед каждым запросом воркер берёт
+    токен из bucket своего маркетплейса.
+    """
+
+    def __init__(
+        self,
+        marketplaces: Dict[str, Marketplace],
+        concurrency: int = 50,
+        timeout: float = 10.0,
+        retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 10.0
+    ):
+        """
+        Args:
+            marketplaces: Настройки по имени маркетплейса
+            concurrency: Одновременных запросов (всего)
+            timeout: Таймаут одного запроса, секунды
+            retries: Повторов после первой попытки
+            backoff: Начальная пауза перед повтором (удваивается)
+            max_backoff: Максимальная пауза (в том числе по Retry-After)
+        """
+        self.marketplaces = marketplaces
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.stats = CollectorStats()
+
+    async def collect(self, requests: Iterable[Tuple[Any, str, str]]) -> List[CollectResult]:
+        """
+        Сбор цен
+
+        Args:
+            requests: (key, article, marketplace) - key возвращается в результате
+
+        Returns:
+            Результаты в порядке запросов
+        """
+        if aiohttp is None:
+            raise ImportError("Установите aiohttp: pip install aiohttp")
+
+        start = time.perf_counter()
+        buckets = {
+            name: TokenBucket(m.rate, m.burst) for name, m in self.marketplaces.items()
+        }
+        sessions = {
+            name: aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=m.connections),
+                headers=m.headers,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+            for name, m in self.marketplaces.items()
+        }
+
+        items = enumerate(requests)
+        results: Dict[int, CollectResult] = {}
+
+        async def worker():
+            for i, (key, article, marketplace) in items:
+                results[i] = await self._fetch(sessions, buckets, key, str(article), marketplace)
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        finally:
+            for session in sessions.values():
+                await session.close()
+
+        self.stats.elapsed += time.perf_counter() - start
+        return [results[i] for i in range(len(results))]
+
+    def collect_sync(self, requests: Iterable[Tuple[Any, str, str]]) -> List[CollectResult]:
+        """collect() для синхронного кода (PriceUpdater)"""
+        return asyncio.run(self.collect(requests))
+
+    async def _fetch(
+        self,
+        sessions: Dict[str, Any],
+        buckets: Dict[str, TokenBucket],
+        key: Any,
+        article: str,
+        marketplace: str
+    ) -> CollectResult:
+        start = time.perf_counter()
+        config = self.marketplaces.get(marketplace)
+        if config is None:
+            self.stats.failures += 1
+            return CollectResult(key, article, marketplace, None,
+                                 f"Неподдерживаемый маркетплейс: {marketplace}", 0, 0.0)
+
+        url = config.url_template.format(article=article)
+        error = None
+
+        for attempt in range(1, self.retries + 2):
+            await buckets[marketplace].acquire()
+            self.stats.requests += 1
+            retry_after = None
+            try:
+                async with sessions[marketplace].get(url) as response:
+                    if response.status in RETRY_STATUSES:
+                        header = response.headers.get("Retry-After")
+                        raise _RetryableStatus(
+                            response.status,
+                            float(header) if header and header.replace('.', '', 1).isdigit() else None
+                        )
+                    response.raise_for_status()
+                    body = await response.text()
+                price = config.parse(body)
+                return CollectResult(key, article, marketplace, price, None, attempt,
+                                     time.perf_counter() - start)
+            except _RetryableStatus as e:
+                error, retry_after = str(e), e.retry_after
+            except asyncio.TimeoutError:
+                error = f"Таймаут {self.timeout}с"
+                self.stats.timeouts += 1
+            except aiohttp.ClientResponseError as e:
+                # 4xx кроме 429 - повтор не поможет
+                error = f"HTTP {e.status}"
+                break
+            except aiohttp.ClientError as e:
+                error = f"{type(e).__name__}: {e}"
+            except (KeyError, ValueError, TypeError) as e:
+                # Битый ответ - это неудача товара, а не всего обхода
+                error = f"Ошибка разбора ответа: {e}"
+                break
+
+            if attempt <= self.retries:
+                self.stats.retries += 1
+                delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+                if retry_after is not None:
+                    # Retry-After задаёт сервер - пауза всё равно не дольше max_backoff
+                    await asyncio.sleep(min(self.max_backoff, retry_after))
+                else:
+                    # Случайный разброс, чтобы повторы не шли волной
+                    await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+
+        self.stats.failures += 1
+        return CollectResult(key, article, marketplace, None, error, attempt,
+                             time.perf_counter() - start)
@@ -2,7 +2,7 @@
 Система рекомендаций: Оптимист и Пессимист
 Согласно документу "Детализация бизнес-логики для Рекомендаций"
 """
-from typing import Dict
+from typing import Dict, List
 from enum import Enum
 from dataclasses import dataclass
 
@@ -298,6 +298,30 @@ class RecommendationEngine:
             return cls.generate_pessimist_recommendation(
                 current_price, forecast_7d, forecast_30d, confidence, volatility
             )
+    
+    @classmethod
+    def generate_recommendations(
+        cls,
+        current_price: float,
+        forecast_7d: float,
+        forecast_30d: float,
+        confidence: float,
+        volatility: float,
+        scenarios: List[Scenario] = None
+    ) -> Dict[Scenario, Recommendation]:
+        """
+        Рекомендации для нескольких сценариев по одному прогнозу
+        
+        Прогноз и уверенность считаются один раз, сценарии отличаются
+        только правилами. По умолчанию - все сценарии.
+        """
+        scenarios = list(Scenario) if scenarios is None else scenarios
+        return {
+            scenario: cls.generate_recommendation(
+                current_price, forecast_7d, forecast_30d, confidence, volatility, scenario
+            )
+            for scenario in scenarios
+        }
 
 
 # ============================================================================
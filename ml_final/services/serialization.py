@@ -0,0 +1,38 @@
+"""
+Сериализация ответов сервиса
+JSON через orjson (если установлен) с прозрачным откатом на стандартный json
+"""
+import json
+from typing import Any
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(obj: Any) -> Any:
+    """Типы NumPy для стандартного json"""
+    if isinstance(obj, np.ndarray):
+        if np.issubdtype(obj.dtype, np.datetime64):
+            return np.datetime_as_string(obj).tolist()
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Тип не сериализуется в JSON: {type(obj).__name__}")
+
+
+def dumps(obj: Any) -> str:
+    """Объект -> JSON строка (массивы NumPy сериализуются без циклов Python)"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_SERIALIZE_NUMPY).decode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, default=_default)
+
+
+def loads(data) -> Any:
+    """JSON строка или bytes -> объект"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -0,0 +1,186 @@
+"""
+Замеры этапов запроса (spans) на perf_counter_ns
+Этапы: fit, trend, dates, confidence, recommendation, serialization
+
+Включённый трассировщик копит длительности в гистограммах процесса
+(корзины - степени двойки наносекунд), которые выгружаются по запросу
+(метод воркера "trace"). Запрос с include_spans получает свои замеры
+в блоке "metrics" ответа.
+
+Выключенный трассировщик отдаёт общий пустой span: одна проверка флага
+на этап, без вызова таймера и без выделения памяти.
+
+Использование:
+    from services.tracing import TRACER
+
+    with TRACER.span("confidence"):
+        ...
+    TRACER.dump()
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# Корзина k хранит длительности [2^(k-1), 2^k) нс; 2^40 нс ≈ 18 минут
+BUCKETS = 41
+PERCENTILES = (50, 90, 99)
+
+
+class Histogram:
+    """Гистограмма длительностей одного этапа"""
+
+    __slots__ = ("counts", "count", "total", "min", "max")
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def add(self, ns: int) -> None:
+        self.counts[min(ns.bit_length(), BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += ns
+        if self.min is None or ns < self.min:
+            self.min = ns
+        if ns > self.max:
+            self.max = ns
+
+    def percentile(self, q: float) -> int:
+        """Оценка перцентиля сверху: граница корзины, но не больше max"""
+        if self.count == 0:
+            return 0
+        rank = q / 100 * self.count
+        seen = 0
+        for bucket, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return min((1 << bucket) - 1, self.max)
+        return self.max
+
+    def to_dict(self) -> Dict:
+        """Сводка в микросекундах"""
+        summary = {
+            "count": self.count,
+            "mean_us": round(self.total / self.count / 1000, 3) if self.count else 0.0,
+            "min_us": round((self.min or 0) / 1000, 3),
+            "max_us": round(self.max / 1000, 3),
+        }
+        for q in PERCENTILES:
+            summary[f"p{q}_us"] = round(self.percentile(q) / 1000, 3)
+        # Непустые корзины: верхняя граница (мкс) -> число замеров
+        summary["buckets"] = {
+            str(round(((1 << bucket) - 1) / 1000, 3)): n
+            for bucket, n in enumerate(self.counts) if n
+        }
+        return summary
+
+
+class _NullSpan:
+    """Span выключенного трассировщика"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    __slots__ = ("tracer", "name", "start")
+
+    def __init__(self, tracer: "Tracer", name: str):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.name, time.perf_counter_ns() - self.start)
+        return False
+
+
+class Tracer:
+    """
+    Трассировщик процесса
+
+    enabled - запись в гистограммы. Независимо от него collect() собирает
+    замеры текущего потока для одного ответа. Вложенные этапы (dates и
+    trend внутри fit) учитываются в обоих.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.histograms: Dict[str, Histogram] = {}
+        self._collecting = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def span(self, name: str):
+        """Контекст замера этапа name"""
+        if not self.enabled and not self._collecting:
+            return NULL_SPAN
+        return Span(self, name)
+
+    def record(self, name: str, ns: int) -> None:
+        if self.enabled:
+            with self._lock:
+                histogram = self.histograms.get(name)
+                if histogram is None:
+                    histogram = self.histograms[name] = Histogram()
+                histogram.add(ns)
+
+        spans = getattr(self._local, "spans", None)
+        if spans is not None:
+            spans[name] = spans.get(name, 0) + ns
+
+    @contextmanager
+    def collect(self):
+        """
+        Замеры этапов текущего потока внутри блока
+
+        Yields:
+            {этап: суммарная длительность, нс} - заполняется по ходу блока
+        """
+        previous = getattr(self._local, "spans", None)
+        spans = {}
+        self._local.spans = spans
+        with self._lock:
+            self._collecting += 1
+        try:
+            yield spans
+        finally:
+            with self._lock:
+                self._collecting -= 1
+            self._local.spans = previous
+
+    def dump(self, reset: bool = False) -> Dict[str, Dict]:
+        """Сводка гистограмм по этапам (reset - начать накопление заново)"""
+        with self._lock:
+            summary = {name: h.to_dict() for name, h in sorted(self.histograms.items())}
+            if reset:
+                self.histograms = {}
+        return summary
+
+    def reset(self) -> None:
+        with self._lock:
+            self.histograms = {}
+
+
+def spans_us(spans: Optional[Dict[str, int]], items: int = 1) -> Dict[str, float]:
+    """Замеры collect() -> микросекунды (items - доля одного товара пакета)"""
+    return {name: round(ns / items / 1000, 3) for name, ns in sorted((spans or {}).items())}
+
+
+# Общий трассировщик процесса; ML_TRACE=1 включает гистограммы с запуска
+TRACER = Tracer(enabled=os.environ.get("ML_TRACE", "") not in ("", "0"))
@@ -0,0 +1,273 @@
+"""
+Долгоживущий воркер прогнозов (JSON-lines протокол)
+Модели загружаются один раз, запросы обслуживаются без запуска интерпретатора
+
+Протокол: одна JSON-строка на запрос, одна JSON-строка на ответ.
+
+Запрос:
+    {"id": 1, "method": "forecast", "params": {
+        "price_history": [50000, 51000, ...],
+        "dates": ["2025-01-01T00:00:00", ...],
+        "scenario": "optimist", "forecast_days": 7, "model_type": "linear",
+        "horizons": [7, 30, 90], "scenarios": ["optimist", "pessimist"],
+        "spans": true}}
+
+Ответ:
+    {"id": 1, "result": {...}}  или  {"id": 1, "error": "..."}
+
+Методы: forecast, forecast_batch, ping, trace
+
+"spans": true добавляет в "metrics" ответа длительности этапов запроса.
+trace отдаёт гистограммы этапов процесса ({"reset": true} - с обнулением),
+если трассировка включена (ml_service --trace или ML_TRACE=1).
+"""
+import os
+import signal
+import socket
+import sys
+from datetime import datetime
+from typing import Callable, Dict, List, TextIO
+
+from services.serialization import dumps, loads
+from services.tracing import TRACER
+
+
+class ForecastWorker:
+    """Обработчик запросов с тёплыми сервисами (по одному на тип модели)"""
+
+    def __init__(self, service_factory: Callable = None, cache=None, errors=None):
+        """
+        Args:
+            service_factory: Конструктор сервиса (по умолчанию MLForecastService)
+            cache: Общий ForecastCache для всех типов моделей
+            errors: Общий ErrorStore (фактическая MAPE по товарам)
+        """
+        if service_factory is None:
+            from ml_service import MLForecastService
+            service_factory = MLForecastService
+        self.service_factory = service_factory
+        self.cache = cache
+        self.errors = errors
+        self._services: Dict[str, object] = {}
+
+    def service(self, model_type: str = "linear"):
+        """Сервис для типа модели (создаётся один раз)"""
+        service = self._services.get(model_type)
+        if service is None:
+            if self.errors is not None:
+                service = self.service_factory(model_type=model_type, cache=self.cache, errors=self.errors)
+            else:
+                service = self.service_factory(model_type=model_type, cache=self.cache)
+            self._services[model_type] = service
+        return service
+
+    def warm_up(self, model_types: List[str] = ("naive", "ma", "linear")) -> None:
+        """Создание сервисов заранее, до первого запроса"""
+        for model_type in model_types:
+            self.service(model_type)
+
+    def handle(self, request: Dict) -> Dict:
+        """Обработка одного запроса"""
+        request_id = None
+        try:
+            if not isinstance(request, dict):
+                raise ValueError("Запрос должен быть JSON-объектом")
+            request_id = request.get("id")
+            method = request.get("method", "forecast")
+            params = request.get("params", {})
+            if not isinstance(params, dict):
+                raise ValueError("params должен быть JSON-объектом")
+
+            if method == "ping":
+                result = {"pong": True, "pid": os.getpid()}
+            elif method == "forecast":
+                result = self._forecast(params)
+            elif method == "forecast_batch":
+                result = self._forecast_batch(params)
+            elif method == "trace":
+                result = {"enabled": TRACER.enabled, "pid": os.getpid(),
+                          "spans": TRACER.dump(reset=bool(params.get("reset")))}
+            else:
+                raise ValueError(f"Неизвестный метод: {method}")
+
+            return {"id": request_id, "result": result}
+        except Exception as e:
+            return {"id": request_id, "error": f"{type(e).__name__}: {e}"}
+
+    def handle_line(self, line: str) -> str:
+        """JSON-строка запроса -> JSON-строка ответа"""
+        try:
+            request = loads(line)
+        except ValueError as e:
+            return dumps({"id": None, "error": f"{type(e).__name__}: {e}"})
+        response = self.handle(request)
+        with TRACER.span("json"):
+            return dumps(response)
+
+    def _forecast(self, params: Dict) -> Dict:
+        service = self.service(params.get("model_type", "linear"))
+        return service.generate_forecast(
+            price_history=params["price_history"],
+            dates=_parse_dates(params["dates"]),
+            scenario=params.get("scenario", "optimist"),
+            forecast_days=int(params.get("forecast_days", 7)),
+            product_id=params.get("product_id"),
+            horizons=params.get("horizons"),
+            scenarios=params.get("scenarios"),
+            include_spans=bool(params.get("spans"))
+        )
+
+    def _forecast_batch(self, params: Dict) -> List[Dict]:
+        service = self.service(params.get("model_type", "linear"))
+        return service.generate_forecast_batch(
+            last_dates=_parse_dates(params["last_dates"]),
+            prices=params.get("prices"),
+            lengths=params.get("lengths"),
+            values=params.get("values"),
+            offsets=params.get("offsets"),
+            scenario=params.get("scenario", "optimist"),
+            forecast_days=int(params.get("forecast_days", 7)),
+            horizons=params.get("horizons"),
+            scenarios=params.get("scenarios"),
+            product_ids=params.get("product_ids"),
+            include_spans=bool(params.get("spans"))
+        )
+
+
+def _parse_dates(values: List[str]) -> List[datetime]:
+    """ISO строки -> datetime"""
+    return [datetime.fromisoformat(v) for v in values]
+
+
+# ============================================================================
+# ТРАНСПОРТ
+# ============================================================================
+
+def serve_stream(worker: ForecastWorker, infile: TextIO = None, outfile: TextIO = None) -> None:
+    """Цикл чтения запросов из потока (по умолчанию stdin -> stdout)"""
+    infile = infile or sys.stdin
+    outfile = outfile or sys.stdout
+
+    for line in infile:
+        line = line.strip()
+        if not line:
+            continue
+        outfile.write(worker.handle_line(line) + "\n")
+        outfile.flush()
+
+
+def _serve_connection(worker: ForecastWorker, conn: socket.socket) -> None:
+    """Обслуживание одного клиента до закрытия соединения"""
+    with conn, conn.makefile("r", encoding="utf-8") as reader, \
+            conn.makefile("w", encoding="utf-8") as writer:
+        serve_stream(worker, reader, writer)
+
+
+def _accept_loop(worker: ForecastWorker, listener: socket.socket) -> None:
+    """Соединения по очереди; ошибка одного соединения не останавливает воркер"""
+    while True:
+        conn, _ = listener.accept()
+        try:
+            _serve_connection(worker, conn)
+        except (ConnectionError, OSError):
+            continue
+        except Exception as e:
+            print(f"⚠️  Соединение закрыто из-за ошибки: {type(e).__name__}: {e}", file=sys.stderr)
+
+
+def _is_tcp(address: str) -> bool:
+    """ "host:port" - TCP, иначе путь Unix-сокета"""
+    _, sep, port = address.rpartition(":")
+    return bool(sep) and port.isdigit()
+
+
+def open_listener(address: str) -> socket.socket:
+    """
+    Слушающий сокет
+
+    Args:
+        address: "host:port" для TCP или путь для Unix-сокета
+    """
+    if _is_tcp(address):
+        host, _, port = address.rpartition(":")
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((host or "127.0.0.1", int(port)))
+    else:
+        if os.path.exists(address):
+            os.unlink(address)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(address)
+    listener.listen(128)
+    return listener
+
+
+def serve_socket(
+    address: str,
+    workers: int = 1,
+    worker_factory: Callable[[], ForecastWorker] = ForecastWorker
+) -> None:
+    """
+    Pre-fork сервер: N процессов принимают соединения с одного сокета
+
+    Сокет открывается в родителе, воркеры прогревают модели после fork
+    и конкурируют за accept(). Родитель ждёт детей, заменяет упавших
+    и останавливает всех по SIGTERM/SIGINT.
+    """
+    listener = open_listener(address)
+    print(f"🚀 Воркеры прогнозов слушают {address} (процессов: {workers})", file=sys.stderr)
+
+    if workers <= 1 or not hasattr(os, "fork"):
+        worker = worker_factory()
+        worker.warm_up()
+        try:
+            _accept_loop(worker, listener)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            listener.close()
+        return
+
+    def spawn() -> int:
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            worker = worker_factory()
+            worker.warm_up()
+            try:
+                _accept_loop(worker, listener)
+            finally:
+                os._exit(1)
+        return pid
+
+    children = {spawn() for _ in range(workers)}
+    stopping = False
+
+    def stop(signum=None, frame=None):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        while children:
+            try:
+                pid, _ = os.wait()
+            except KeyboardInterrupt:
+                stop()
+                continue
+            children.discard(pid)
+            if not stopping:
+                print(f"⚠️  Воркер {pid} завершился, запускается замена", file=sys.stderr)
+                children.add(spawn())
+    except ChildProcessError:
+        pass
+    finally:
+        listener.close()
+        if not _is_tcp(address) and os.path.exists(address):
+            os.unlink(address)
@@ -0,0 +1,307 @@
+"""
+Компактная история каталога в памяти
+Цены - float32 (или float64), дни - int32 от эпохи, таблица смещений
+по товарам. Строка истории занимает 8 байт вместо ~100 в DataFrame
+и списках float/datetime.
+
+Контейнер повторяет интерфейс GroupedHistory (prices, offsets, lengths,
+created_at, last_dates, series, slice, take), поэтому его принимают
+модели, generate_forecast / generate_forecast_batch и предрасчёт.
+"""
+import os
+import sys
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from storage.grouped_history import GroupedHistory
+from storage.resample import DAY, resample_daily
+
+
+# float32 держит цену точно до полкопейки примерно до 130 000 руб.;
+# если в истории есть цены, которые так не помещаются, остаётся float64
+PRICE_TOLERANCE = 0.005
+
+
+class PriceRecord:
+    """Одна запись истории (без __dict__ - для построчной обработки)"""
+    __slots__ = ("product_id", "day", "price")
+
+    def __init__(self, product_id: int, day: np.datetime64, price: float):
+        self.product_id = product_id
+        self.day = day
+        self.price = price
+
+    def __repr__(self) -> str:
+        return f"PriceRecord(product_id={self.product_id}, day={self.day}, price={self.price})"
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, PriceRecord):
+            return NotImplemented
+        return (self.product_id, self.day, self.price) == (other.product_id, other.day, other.price)
+
+
+@dataclass
+class CompactHistory:
+    """
+    Дневные ряды: товар i - строки offsets[i]:offsets[i+1]
+
+    days - номер дня от epoch (int32), time_of_day - время последней
+    записи товара в секундах (int32): им помечаются все дни товара,
+    чтобы даты прогноза совпадали с исходной историей.
+    """
+    product_ids: np.ndarray
+    offsets: np.ndarray
+    prices: np.ndarray
+    days: np.ndarray
+    time_of_day: np.ndarray
+    epoch: np.datetime64 = np.datetime64('1970-01-01', 'D')
+
+    def __post_init__(self):
+        self._positions = None
+
+    @classmethod
+    def from_grouped(
+        cls,
+        history: GroupedHistory,
+        dtype=np.float32,
+        fill: Optional[str] = "ffill",
+        epoch=None
+    ) -> "CompactHistory":
+        """
+        Упаковка истории
+
+        Args:
+            history: GroupedHistory (или другая ragged-раскладка с created_at)
+            dtype: float32 или float64; float32 заменяется на float64,
+                если цены не помещаются в него с точностью PRICE_TOLERANCE
+            fill: История сначала приводится к дневным барам (resample_daily);
+                None - история уже дневная, один ряд - одна запись в день
+            epoch: Начало отсчёта дней (по умолчанию - самый ранний день истории)
+        """
+        if fill is not None:
+            history = resample_daily(history, fill=fill).to_grouped()
+
+        start, end = history.offsets[0], history.offsets[-1]
+        lengths = np.diff(history.offsets)
+        seconds = np.asarray(history.created_at[start:end]).astype('datetime64[s]').astype(np.int64)
+        day = seconds // DAY
+
+        if epoch is None:
+            epoch = np.datetime64(int(day.min()) if len(day) else 0, 'D')
+        epoch = np.datetime64(epoch, 'D')
+        days = day - epoch.astype(np.int64)
+        if len(days) and (days.min() < np.iinfo(np.int32).min or days.max() > np.iinfo(np.int32).max):
+            raise ValueError("Диапазон дат не помещается в int32")
+
+        time_of_day = np.zeros(len(lengths), dtype=np.int32)
+        has = lengths > 0
+        last = history.offsets[1:][has] - 1 - start
+        time_of_day[has] = seconds[last] - day[last] * DAY
+
+        source = np.asarray(history.prices[start:end], dtype=np.float64)
+        prices = source.astype(dtype)
+        if prices.dtype != np.float64 and len(prices) \
+                and np.max(np.abs(prices.astype(np.float64) - source)) > PRICE_TOLERANCE:
+            prices = source
+
+        return cls(
+            product_ids=np.asarray(history.product_ids).astype(np.int32),
+            offsets=(np.asarray(history.offsets, dtype=np.int64) - start),
+            prices=prices,
+            days=days.astype(np.int32),
+            time_of_day=time_of_day,
+            epoch=epoch
+        )
+
+    @classmethod
+    def load(cls, path: str, dtype=np.float32, fill: Optional[str] = "ffill") -> "CompactHistory":
+        """Каталог HistoryStore, файл SQLite или CSV-файл"""
+        return cls.from_grouped(GroupedHistory.load(path), dtype=dtype, fill=fill)
+
+    @classmethod
+    def from_stream(
+        cls,
+        stream,
+        batch_size: int = 10_000,
+        dtype=np.float32,
+        fill: Optional[str] = "ffill"
+    ) -> "CompactHistory":
+        """
+        Упаковка потока рядов (HistoryStream) пакетами товаров
+
+        В памяти - уже упакованные пакеты и один пакет в GroupedHistory,
+        а не весь CSV в DataFrame. Товары упорядочены по product_id, как в load.
+        """
+        parts = [cls.from_grouped(batch, dtype=dtype, fill=fill) for batch in stream.batches(batch_size)]
+        if not parts:
+            raise ValueError("Пустая история")
+        history = cls.concat(parts)
+        order = np.argsort(history.product_ids, kind='stable')
+        if np.any(order != np.arange(len(order))):
+            history = history.take(order)
+        return history
+
+    @classmethod
+    def concat(cls, parts: List["CompactHistory"]) -> "CompactHistory":
+        """Склейка контейнеров; эпоха - самая ранняя из частей"""
+        epoch = min(part.epoch for part in parts)
+        lengths = np.concatenate([part.lengths for part in parts])
+        days = [
+            part.days[part.offsets[0]:part.offsets[-1]].astype(np.int64)
+            + int((part.epoch - epoch).astype(np.int64))
+            for part in parts
+        ]
+        return cls(
+            product_ids=np.concatenate([part.product_ids for part in parts]),
+            offsets=np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64),
+            prices=np.concatenate([part.prices[part.offsets[0]:part.offsets[-1]] for part in parts]),
+            days=np.concatenate(days).astype(np.int32),
+            time_of_day=np.concatenate([part.time_of_day for part in parts]),
+            epoch=epoch
+        )
+
+    def to_grouped(self) -> GroupedHistory:
+        """Распаковка в GroupedHistory (цены float64, created_at datetime64[s])"""
+        return GroupedHistory(
+            product_ids=self.product_ids,
+            offsets=self.offsets,
+            prices=self.prices.astype(np.float64),
+            created_at=self.created_at
+        )
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    @property
+    def n_records(self) -> int:
+        return int(self.offsets[-1] - self.offsets[0])
+
+    @property
+    def nbytes(self) -> int:
+        """Память под массивы контейнера"""
+        return sum(a.nbytes for a in (self.product_ids, self.offsets, self.prices, self.days, self.time_of_day))
+
+    @property
+    def created_at(self) -> np.ndarray:
+        """Время каждой записи (datetime64[s]) - вычисляется при обращении"""
+        return self._timestamps(self.offsets[0], self.offsets[-1], np.repeat(self.time_of_day, self.lengths))
+
+    def _timestamps(self, lo: int, hi: int, time_of_day) -> np.ndarray:
+        seconds = (self.days[lo:hi].astype(np.int64) + self.epoch.astype(np.int64)) * DAY + time_of_day
+        return seconds.astype('datetime64[s]')
+
+    def position(self, product_id: int) -> Optional[int]:
+        """Номер товара в раскладке или None"""
+        if self._positions is None:
+            self._positions = {int(pid): i for i, pid in enumerate(self.product_ids)}
+        return self._positions.get(int(product_id))
+
+    def series(self, product_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (prices, created_at) товара - цены без копирования, даты datetime64[s]
+
+        Для товара без истории - пустые массивы.
+        """
+        i = self.position(product_id)
+        if i is None:
+            return self.prices[:0], np.empty(0, dtype='datetime64[s]')
+        lo, hi = self.offsets[i], self.offsets[i + 1]
+        return self.prices[lo:hi], self._timestamps(lo, hi, np.int64(self.time_of_day[i]))
+
+    def last_dates(self) -> List[datetime]:
+        """Дата последней цены каждого товара"""
+        last = self.offsets[1:] - 1
+        seconds = (self.days[last].astype(np.int64) + self.epoch.astype(np.int64)) * DAY + self.time_of_day
+        return seconds.astype('datetime64[s]').astype('datetime64[us]').tolist()
+
+    def record(self, row: int) -> PriceRecord:
+        """Строка row общей раскладки"""
+        i = int(np.searchsorted(self.offsets, row, side='right')) - 1
+        return PriceRecord(
+            int(self.product_ids[i]),
+            self.epoch + np.timedelta64(int(self.days[row]), 'D'),
+            float(self.prices[row])
+        )
+
+    def records(self, product_id: int = None) -> Iterator[PriceRecord]:
+        """Записи товара (или всего каталога) по одной"""
+        positions = range(len(self)) if product_id is None else [self.position(product_id)]
+        for i in positions:
+            if i is None:
+                continue
+            pid = int(self.product_ids[i])
+            lo, hi = int(self.offsets[i]), int(self.offsets[i + 1])
+            for day, price in zip(self.days[lo:hi].tolist(), self.prices[lo:hi].tolist()):
+                yield PriceRecord(pid, self.epoch + np.timedelta64(day, 'D'), price)
+
+    def slice(self, lo: int, hi: int) -> "CompactHistory":
+        """Товары [lo, hi) - без копирования цен и дней"""
+        offsets = self.offsets[lo:hi + 1]
+        start, end = offsets[0], offsets[-1]
+        return CompactHistory(
+            product_ids=self.product_ids[lo:hi],
+            offsets=offsets - start,
+            prices=self.prices[start:end],
+            days=self.days[start:end],
+            time_of_day=self.time_of_day[lo:hi],
+            epoch=self.epoch
+        )
+
+    def take(self, positions: np.ndarray) -> "CompactHistory":
+        """Выбранные товары (копия, непрерывная раскладка)"""
+        positions = np.asarray(positions, dtype=np.int64)
+        lengths = self.lengths[positions]
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        rows = np.repeat(self.offsets[positions] - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return CompactHistory(
+            product_ids=self.product_ids[positions],
+            offsets=offsets,
+            prices=self.prices[rows],
+            days=self.days[rows],
+            time_of_day=self.time_of_day[positions],
+            epoch=self.epoch
+        )
+
+    def __len__(self) -> int:
+        return len(self.product_ids)
+
+    def __iter__(self) -> Iterator[Tuple[int, np.ndarray, np.ndarray]]:
+        """(product_id, prices, created_at) по товарам"""
+        for i, product_id in enumerate(self.product_ids):
+            lo, hi = self.offsets[i], self.offsets[i + 1]
+            yield int(product_id), self.prices[lo:hi], self._timestamps(lo, hi, np.int64(self.time_of_day[i]))
+
+
+# ============================================================================
+# ГЛАВНАЯ ФУНКЦИЯ
+# ============================================================================
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description='Компактная история каталога')
+    parser.add_argument('history', help='CSV, каталог хранилища или SQLite-база')
+    parser.add_argument('--float64', action='store_true', help='Цены float64 вместо float32')
+
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    history = CompactHistory.load(args.history, dtype=np.float64 if args.float64 else np.float32)
+    elapsed = time.perf_counter() - start
+
+    frame_bytes = 0
+    if not os.path.isdir(args.history) and args.history.endswith('.csv'):
+        frame_bytes = int(pd.read_csv(args.history, parse_dates=['created_at']).memory_usage(deep=True).sum())
+
+    print(f"✅ Товаров: {len(history)}, записей: {history.n_records} ({elapsed:.3f}с)")
+    print(f"✅ Цены: {history.prices.dtype}, память: {history.nbytes / 1024:.1f} КБ"
+          + (f" (DataFrame: {frame_bytes / 1024:.1f} КБ)" if frame_bytes else ""))
@@ -0,0 +1,174 @@
+"""
+История цен, сгруппированная по товарам
+Разбор и сортировка выполняются один раз; ряд товара - срез общих
+непрерывных массивов по таблице смещений, без копирования
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from storage.history_store import frame_columns, open_history_store
+
+
+@dataclass
+class GroupedHistory:
+    """
+    Ragged-раскладка истории: товар i - строки offsets[i]:offsets[i+1]
+
+    prices и created_at - общие непрерывные массивы, отсортированные
+    по (product_id, created_at); created_at - datetime64[s].
+    """
+    product_ids: np.ndarray
+    offsets: np.ndarray
+    prices: np.ndarray
+    created_at: np.ndarray
+
+    def __post_init__(self):
+        self._positions: Optional[Dict[int, int]] = None
+
+    @classmethod
+    def from_columns(cls, columns: Dict[str, np.ndarray]) -> "GroupedHistory":
+        """
+        Группировка колонок, уже отсортированных по (product_id, created_at)
+
+        Колонки хранилища не копируются: prices и created_at остаются
+        представлениями mmap-массивов.
+        """
+        product_id = np.asarray(columns["product_id"])
+        product_ids, first = np.unique(product_id, return_index=True)
+        offsets = np.append(first, len(product_id)).astype(np.int64)
+        created_at = np.asarray(columns["created_at"])
+        if not np.issubdtype(created_at.dtype, np.datetime64):
+            created_at = created_at.view('datetime64[s]')
+        return cls(
+            product_ids=product_ids,
+            offsets=offsets,
+            prices=np.asarray(columns["price"]),
+            created_at=created_at
+        )
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "GroupedHistory":
+        """DataFrame с колонками id, product_id, price, created_at"""
+        return cls.from_columns(frame_columns(df))
+
+    @classmethod
+    def load(cls, path: str) -> "GroupedHistory":
+        """
+        Загрузка истории
+
+        Args:
+            path: Каталог HistoryStore, файл SQLite или CSV-файл
+        """
+        store = open_history_store(path)
+        if store is not None:
+            return cls.from_columns(store.columns)
+        return cls.from_frame(pd.read_csv(path))
+
+    @classmethod
+    def from_series(
+        cls,
+        series: Sequence[Sequence[float]],
+        dates: Sequence[Sequence] = None,
+        last_dates: Sequence = None,
+        product_ids: Sequence[int] = None
+    ) -> "GroupedHistory":
+        """
+        Сборка из отдельных рядов
+
+        Args:
+            series: Цены каждого товара
+            dates: Даты каждого ряда (или last_dates - тогда ряды считаются дневными)
+            last_dates: Дата последней цены каждого ряда
+            product_ids: ID товаров (по умолчанию 0..n-1)
+        """
+        lengths = np.array([len(s) for s in series], dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        prices = np.concatenate([np.asarray(s, dtype=np.float64) for s in series]) \
+            if len(series) else np.empty(0, dtype=np.float64)
+
+        if dates is not None:
+            created_at = np.concatenate([np.asarray(d, dtype='datetime64[s]') for d in dates])
+        elif last_dates is not None:
+            last = np.array([np.datetime64(d, 's') for d in last_dates], dtype='datetime64[s]')
+            # День j ряда длины n: last - (n - 1 - j) дней
+            rank = np.arange(len(prices)) - np.repeat(offsets[1:] - 1, lengths)
+            created_at = np.repeat(last, lengths) + rank * np.timedelta64(1, 'D')
+        else:
+            raise ValueError("Нужны dates или last_dates")
+
+        if product_ids is None:
+            product_ids = np.arange(len(series))
+        return cls(
+            product_ids=np.asarray(product_ids),
+            offsets=offsets,
+            prices=prices,
+            created_at=created_at
+        )
+
+    @property
+    def lengths(self) -> np.ndarray:
+        """Длина истории каждого товара"""
+        return np.diff(self.offsets)
+
+    @property
+    def n_records(self) -> int:
+        return int(self.offsets[-1] - self.offsets[0])
+
+    def position(self, product_id: int) -> Optional[int]:
+        """Номер товара в раскладке или None"""
+        if self._positions is None:
+            self._positions = {int(pid): i for i, pid in enumerate(self.product_ids)}
+        return self._positions.get(int(product_id))
+
+    def series(self, product_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (prices, created_at) товара - представления общих массивов
+
+        Для товара без истории - пустые массивы.
+        """
+        i = self.position(product_id)
+        if i is None:
+            return self.prices[:0], self.created_at[:0]
+        lo, hi = self.offsets[i], self.offsets[i + 1]
+        return self.prices[lo:hi], self.created_at[lo:hi]
+
+    def last_dates(self) -> List[datetime]:
+        """Дата последней цены каждого товара"""
+        return self.created_at[self.offsets[1:] - 1].astype('datetime64[us]').tolist()
+
+    def slice(self, lo: int, hi: int) -> "GroupedHistory":
+        """Товары [lo, hi) - без копирования цен и дат"""
+        offsets = self.offsets[lo:hi + 1]
+        start, end = offsets[0], offsets[-1]
+        return GroupedHistory(
+            product_ids=self.product_ids[lo:hi],
+            offsets=offsets - start,
+            prices=self.prices[start:end],
+            created_at=self.created_at[start:end]
+        )
+
+    def take(self, positions: np.ndarray) -> "GroupedHistory":
+        """Выбранные товары (копия, непрерывная раскладка)"""
+        positions = np.asarray(positions, dtype=np.int64)
+        lengths = self.lengths[positions]
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        rows = np.repeat(self.offsets[positions] - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return GroupedHistory(
+            product_ids=self.product_ids[positions],
+            offsets=offsets,
+            prices=self.prices[rows],
+            created_at=self.created_at[rows]
+        )
+
+    def __len__(self) -> int:
+        return len(self.product_ids)
+
+    def __iter__(self) -> Iterator[Tuple[int, np.ndarray, np.ndarray]]:
+        """(product_id, prices, created_at) по товарам"""
+        for i, product_id in enumerate(self.product_ids):
+            lo, hi = self.offsets[i], self.offsets[i + 1]
+            yield int(product_id), self.prices[lo:hi], self.created_at[lo:hi]
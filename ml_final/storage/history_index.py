@@ -0,0 +1,184 @@
+"""
+Индекс истории цен по товарам
+Последняя цена и время, число записей и диапазон строк товара в базе
+хранилища - без фильтрации и сортировки всей истории
+"""
+import os
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+
+@dataclass
+class HistoryIndex:
+    """
+    Колонки индекса, отсортированные по product_id
+
+    base_lo/base_hi - диапазон строк товара в базе хранилища
+    (для строк из сегментов - пустой), count - всего записей товара.
+    """
+    product_id: np.ndarray
+    last_price: np.ndarray
+    last_created_at: np.ndarray
+    count: np.ndarray
+    base_lo: np.ndarray
+    base_hi: np.ndarray
+    max_id: int = 0
+
+    def __post_init__(self):
+        self._positions: Optional[Dict[int, int]] = None
+
+    @classmethod
+    def empty(cls) -> "HistoryIndex":
+        return cls(
+            product_id=np.empty(0, dtype=np.int32),
+            last_price=np.empty(0, dtype=np.float64),
+            last_created_at=np.empty(0, dtype=np.int64),
+            count=np.empty(0, dtype=np.int64),
+            base_lo=np.empty(0, dtype=np.int64),
+            base_hi=np.empty(0, dtype=np.int64)
+        )
+
+    @classmethod
+    def build(cls, columns: Dict[str, np.ndarray], in_base: bool = True) -> "HistoryIndex":
+        """
+        Индекс по колонкам, отсортированным по (product_id, created_at)
+
+        Args:
+            columns: Колонки id, product_id, price, created_at
+            in_base: Колонки - база хранилища (заполняются base_lo/base_hi)
+        """
+        product_ids = np.asarray(columns["product_id"])
+        if len(product_ids) == 0:
+            return cls.empty()
+
+        unique, first, counts = np.unique(product_ids, return_index=True, return_counts=True)
+        last = first + counts - 1
+        base_lo = first.astype(np.int64) if in_base else np.zeros(len(unique), dtype=np.int64)
+        base_hi = (last + 1).astype(np.int64) if in_base else np.zeros(len(unique), dtype=np.int64)
+
+        return cls(
+            product_id=unique.astype(np.int32),
+            last_price=np.asarray(columns["price"])[last].astype(np.float64),
+            last_created_at=np.asarray(columns["created_at"])[last].astype(np.int64),
+            count=counts.astype(np.int64),
+            base_lo=base_lo,
+            base_hi=base_hi,
+            max_id=int(np.max(columns["id"]))
+        )
+
+    @classmethod
+    def from_latest(cls, product_ids, last_prices, last_created_at, counts, max_id: int = 0) -> "HistoryIndex":
+        """
+        Индекс по сводке товаров (например, собранной при потоковом чтении CSV)
+
+        Строки базы хранилища не задаются; порядок товаров - любой.
+        """
+        product_ids = np.asarray(product_ids, dtype=np.int32)
+        order = np.argsort(product_ids, kind='stable')
+        return cls(
+            product_id=product_ids[order],
+            last_price=np.asarray(last_prices, dtype=np.float64)[order],
+            last_created_at=np.asarray(last_created_at, dtype=np.int64)[order],
+            count=np.asarray(counts, dtype=np.int64)[order],
+            base_lo=np.zeros(len(order), dtype=np.int64),
+            base_hi=np.zeros(len(order), dtype=np.int64),
+            max_id=int(max_id)
+        )
+
+    def merge(self, columns: Dict[str, np.ndarray]) -> "HistoryIndex":
+        """
+        Индекс после дописывания строк (сегмента)
+
+        Стоимость - O(P + новых строк), история не перечитывается.
+        Последняя цена заменяется, если новая запись не старше текущей.
+        """
+        added = HistoryIndex.build(columns, in_base=False)
+        if len(added.product_id) == 0:
+            return self
+
+        product_id = np.union1d(self.product_id, added.product_id).astype(np.int32)
+        old = np.searchsorted(product_id, self.product_id)
+        new = np.searchsorted(product_id, added.product_id)
+
+        last_price = np.zeros(len(product_id), dtype=np.float64)
+        last_created_at = np.full(len(product_id), np.iinfo(np.int64).min, dtype=np.int64)
+        count = np.zeros(len(product_id), dtype=np.int64)
+        base_lo = np.zeros(len(product_id), dtype=np.int64)
+        base_hi = np.zeros(len(product_id), dtype=np.int64)
+
+        last_price[old] = self.last_price
+        last_created_at[old] = self.last_created_at
+        count[old] = self.count
+        base_lo[old] = self.base_lo
+        base_hi[old] = self.base_hi
+
+        newer = added.last_created_at >= last_created_at[new]
+        last_price[new[newer]] = added.last_price[newer]
+        last_created_at[new[newer]] = added.last_created_at[newer]
+        count[new] += added.count
+
+        return HistoryIndex(
+            product_id=product_id,
+            last_price=last_price,
+            last_created_at=last_created_at,
+            count=count,
+            base_lo=base_lo,
+            base_hi=base_hi,
+            max_id=max(self.max_id, added.max_id)
+        )
+
+    def position(self, product_id: int) -> Optional[int]:
+        """Строка индекса товара (O(1) после первого обращения)"""
+        if self._positions is None:
+            self._positions = {int(pid): i for i, pid in enumerate(self.product_id)}
+        return self._positions.get(int(product_id))
+
+    def latest(self, product_id: int) -> Optional[Tuple[float, int]]:
+        """(последняя цена, время в секундах от эпохи) или None"""
+        i = self.position(product_id)
+        if i is None:
+            return None
+        return float(self.last_price[i]), int(self.last_created_at[i])
+
+    def base_range(self, product_id: int) -> Tuple[int, int]:
+        """Диапазон [lo, hi) строк товара в базе (пустой, если товара там нет)"""
+        i = self.position(product_id)
+        if i is None:
+            return 0, 0
+        return int(self.base_lo[i]), int(self.base_hi[i])
+
+    def save(self, path: str) -> None:
+        """Атомарная запись в .npz с fsync"""
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez(
+                f,
+                product_id=self.product_id,
+                last_price=self.last_price,
+                last_created_at=self.last_created_at,
+                count=self.count,
+                base_lo=self.base_lo,
+                base_hi=self.base_hi,
+                max_id=np.int64(self.max_id)
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "HistoryIndex":
+        with np.load(path) as data:
+            return cls(
+                product_id=data["product_id"],
+                last_price=data["last_price"],
+                last_created_at=data["last_created_at"],
+                count=data["count"],
+                base_lo=data["base_lo"],
+                base_hi=data["base_hi"],
+                max_id=int(data["max_id"])
+            )
+
+    def __len__(self) -> int:
+        return len(self.product_id)
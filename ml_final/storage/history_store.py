@@ -0,0 +1,619 @@
+"""
+Колоночное бинарное хранилище истории цен
+Каждая колонка - отдельный .npy файл, который открывается через mmap
+без разбора текста; строки отсортированы по (product_id, created_at)
+
+Запись только дописыванием: ежедневное обновление кладёт новые строки
+в отдельный сегмент, фоновое уплотнение сливает сегменты с базой.
+Состав хранилища задаёт manifest.json, который заменяется атомарно,
+поэтому читатель всегда видит согласованный снимок.
+
+Раскладка каталога:
+    manifest.json       - {"base": ..., "segments": [...], "index": ..., "next_generation": N}
+    base-000001/        - уплотнённая история
+    seg-000002/         - дописанные строки (по сегменту на обновление)
+    index-000002.npz    - HistoryIndex этой версии манифеста
+
+Колонки в каждой части:
+    id.npy          int64   - ID записи (как в таблице price_history)
+    product_id.npy  int32   - ID товара
+    price.npy       float64 - цена
+    created_at.npy  int64   - время записи, секунды от эпохи Unix
+"""
+import json
+import os
+import shutil
+import sys
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from storage.history_index import HistoryIndex
+
+
+COLUMNS: Dict[str, np.dtype] = {
+    "id": np.dtype(np.int64),
+    "product_id": np.dtype(np.int32),
+    "price": np.dtype(np.float64),
+    "created_at": np.dtype(np.int64),
+}
+
+CSV_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+MANIFEST = "manifest.json"
+
+
+def to_epoch(values) -> np.ndarray:
+    """Даты (строки, datetime, datetime64) -> секунды от эпохи (int64)"""
+    return pd.to_datetime(np.asarray(values)).to_numpy(dtype='datetime64[s]').astype(np.int64)
+
+
+def from_epoch(seconds: np.ndarray) -> np.ndarray:
+    """Секунды от эпохи -> datetime64[s]"""
+    return np.asarray(seconds, dtype=np.int64).astype('datetime64[s]')
+
+
+def _fsync_dir(path: str) -> None:
+    """fsync каталога, чтобы переименование пережило сбой питания"""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _sorted_columns(ids, product_ids, prices, created_at) -> Dict[str, np.ndarray]:
+    """Приведение типов и сортировка по (product_id, created_at, id)"""
+    ids = np.asarray(ids, dtype=COLUMNS["id"])
+    product_ids = np.asarray(product_ids, dtype=COLUMNS["product_id"])
+    prices = np.asarray(prices, dtype=COLUMNS["price"])
+    created_at = np.asarray(created_at, dtype=COLUMNS["created_at"])
+
+    if not (len(ids) == len(product_ids) == len(prices) == len(created_at)):
+        raise ValueError("Колонки истории разной длины")
+
+    order = np.lexsort((ids, created_at, product_ids))
+    return {
+        "id": ids[order],
+        "product_id": product_ids[order],
+        "price": prices[order],
+        "created_at": created_at[order],
+    }
+
+
+def frame_columns(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """Типизированные колонки DataFrame истории, отсортированные по (product_id, created_at)"""
+    return _sorted_columns(
+        df['id'].to_numpy(),
+        df['product_id'].to_numpy(),
+        df['price'].to_numpy(),
+        to_epoch(df['created_at'])
+    )
+
+
+def _write_part(root: str, name: str, columns: Dict[str, np.ndarray]) -> None:
+    """
+    Запись части (базы или сегмента)
+
+    Колонки пишутся во временный каталог с fsync каждого файла,
+    затем каталог атомарно переименовывается.
+    """
+    tmp = os.path.join(root, name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for column, values in columns.items():
+        with open(os.path.join(tmp, f"{column}.npy"), "wb") as f:
+            np.save(f, values)
+            f.flush()
+            os.fsync(f.fileno())
+    _fsync_dir(tmp)
+    os.replace(tmp, os.path.join(root, name))
+    _fsync_dir(root)
+
+
+def _load_part(root: str, name: str) -> Dict[str, np.ndarray]:
+    return {
+        column: np.load(os.path.join(root, name, f"{column}.npy"), mmap_mode='r')
+        for column in COLUMNS
+    }
+
+
+class HistorySnapshot:
+    """
+    Согласованный снимок хранилища: база и сегменты одной версии манифеста
+
+    Колонки частей открыты через mmap; чтение ряда товара - бинарный поиск
+    в каждой части и склейка срезов (без склейки, если сегментов нет).
+    """
+
+    def __init__(self, parts: List[Dict[str, np.ndarray]], manifest: Dict, index: HistoryIndex = None):
+        self.parts = parts
+        self.manifest = manifest
+        self.index = index if index is not None else self._build_index()
+
+    def _build_index(self) -> HistoryIndex:
+        """Индекс по частям (для манифеста без сохранённого индекса)"""
+        if not self.parts:
+            return HistoryIndex.empty()
+        index = HistoryIndex.build(self.parts[0], in_base=bool(self.manifest.get("base")))
+        for part in self.parts[1:]:
+            index = index.merge(part)
+        return index
+
+    def series(self, product_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Ряд одного товара
+
+        Returns:
+            (prices, created_at) - created_at в секундах от эпохи
+        """
+        prices, created_at = [], []
+        segments = self.parts
+        if self.manifest.get("base"):
+            # Диапазон в базе - из индекса, без поиска по колонке
+            lo, hi = self.index.base_range(product_id)
+            if hi > lo:
+                prices.append(self.parts[0]["price"][lo:hi])
+                created_at.append(self.parts[0]["created_at"][lo:hi])
+            segments = self.parts[1:]
+
+        for part in segments:
+            column = part["product_id"]
+            lo = int(np.searchsorted(column, product_id, side='left'))
+            hi = int(np.searchsorted(column, product_id, side='right'))
+            if hi > lo:
+                prices.append(part["price"][lo:hi])
+                created_at.append(part["created_at"][lo:hi])
+
+        if not prices:
+            return np.empty(0, dtype=COLUMNS["price"]), np.empty(0, dtype=COLUMNS["created_at"])
+        if len(prices) == 1:
+            return prices[0], created_at[0]
+
+        prices = np.concatenate(prices)
+        created_at = np.concatenate(created_at)
+        order = np.argsort(created_at, kind='stable')
+        return prices[order], created_at[order]
+
+    @property
+    def columns(self) -> Dict[str, np.ndarray]:
+        """Все колонки, слитые и отсортированные по (product_id, created_at)"""
+        if len(self.parts) == 1:
+            return self.parts[0]
+        return _sorted_columns(*(
+            np.concatenate([part[column] for part in self.parts]) for column in COLUMNS
+        ))
+
+    def product_ids(self) -> np.ndarray:
+        """Уникальные ID товаров"""
+        return np.unique(np.concatenate([part["product_id"] for part in self.parts]))
+
+    def max_id(self) -> int:
+        """Наибольший ID записи (0 для пустой истории)"""
+        return self.index.max_id
+
+    def __len__(self) -> int:
+        return sum(len(part["id"]) for part in self.parts)
+
+
+class HistoryStore:
+    """
+    История цен в типизированных колонках с дописыванием сегментов
+
+    Один процесс-писатель (PriceUpdater); читателей сколько угодно.
+    Читатель открывает снимок по манифесту и не видит незавершённых записей.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Каталог хранилища
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._snapshot: Optional[HistorySnapshot] = None
+        self._snapshot_key: Optional[Tuple[int, int]] = None
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        """Есть ли в каталоге хранилище"""
+        return os.path.exists(os.path.join(path, MANIFEST))
+
+    @classmethod
+    def write(
+        cls,
+        path: str,
+        ids,
+        product_ids,
+        prices,
+        created_at
+    ) -> "HistoryStore":
+        """
+        Запись хранилища целиком (новая база без сегментов)
+
+        Args:
+            created_at: Секунды от эпохи (int64)
+        """
+        os.makedirs(path, exist_ok=True)
+        store = cls(path)
+        columns = _sorted_columns(ids, product_ids, prices, created_at)
+
+        with store._lock:
+            manifest = store._read_manifest() or {"base": None, "segments": [], "next_generation": 1}
+            old_parts = store._part_names(manifest)
+
+            generation = manifest["next_generation"]
+            base = f"base-{generation:06d}"
+            _write_part(path, base, columns)
+            index = store._write_index(generation, HistoryIndex.build(columns))
+            store._write_manifest({
+                "base": base, "segments": [], "index": index, "next_generation": generation + 1
+            })
+
+        store._remove_parts(old_parts)
+        return store
+
+    @classmethod
+    def write_frame(cls, path: str, df: pd.DataFrame) -> "HistoryStore":
+        """Запись DataFrame с колонками id, product_id, price, created_at"""
+        return cls.write(
+            path,
+            ids=df['id'].to_numpy(),
+            product_ids=df['product_id'].to_numpy(),
+            prices=df['price'].to_numpy(),
+            created_at=to_epoch(df['created_at'])
+        )
+
+    @classmethod
+    def from_csv(cls, csv_path: str, path: str) -> "HistoryStore":
+        """Импорт CSV price_history_dataset.csv (разбор дат - один раз)"""
+        return cls.write_frame(path, pd.read_csv(csv_path))
+
+    def append(self, ids, product_ids, prices, created_at) -> str:
+        """
+        Дописывание новых строк отдельным сегментом
+
+        Стоимость пропорциональна числу новых строк и товаров, а не размеру
+        истории. Сегмент и обновлённый индекс становятся видимыми читателям
+        одновременно - заменой манифеста.
+
+        Args:
+            created_at: Секунды от эпохи (int64)
+
+        Returns:
+            Имя сегмента
+        """
+        columns = _sorted_columns(ids, product_ids, prices, created_at)
+
+        with self._lock:
+            manifest = self._read_manifest()
+            if manifest is None:
+                raise FileNotFoundError(f"Хранилище не найдено: {self.path}")
+
+            generation = manifest["next_generation"]
+            segment = f"seg-{generation:06d}"
+            _write_part(self.path, segment, columns)
+            index = self._manifest_index(manifest).merge(columns)
+
+            old_index = manifest.get("index")
+            manifest["segments"] = manifest["segments"] + [segment]
+            manifest["index"] = self._write_index(generation, index)
+            manifest["next_generation"] = generation + 1
+            self._write_manifest(manifest)
+
+        self._remove_parts([old_index])
+        return segment
+
+    def append_frame(self, df: pd.DataFrame) -> str:
+        """Дописывание DataFrame с колонками id, product_id, price, created_at"""
+        return self.append(
+            ids=df['id'].to_numpy(),
+            product_ids=df['product_id'].to_numpy(),
+            prices=df['price'].to_numpy(),
+            created_at=to_epoch(df['created_at'])
+        )
+
+    def compact(self) -> bool:
+        """
+        Слияние базы и сегментов в новую базу
+
+        Чтение снимка, запись новой базы и построение её индекса идут без
+        блокировки, дописывание в это время не ждёт; под блокировкой -
+        только резерв номера поколения и замена манифеста. Сегменты,
+        появившиеся во время слияния, остаются в манифесте.
+
+        Returns:
+            True, если было что сливать
+        """
+        with self._compact_lock:
+            return self._compact()
+
+    def _compact(self) -> bool:
+        snapshot = self.snapshot()
+        merged = snapshot.manifest["segments"]
+        if not merged:
+            return False
+
+        columns = snapshot.columns
+
+        # Номер поколения резервируется в манифесте; запись новой базы
+        # и её индекса идёт без блокировки, дописывание в это время не ждёт
+        with self._lock:
+            manifest = self._read_manifest()
+            generation = manifest["next_generation"]
+            manifest["next_generation"] = generation + 1
+            self._write_manifest(manifest)
+
+        base = f"base-{generation:06d}"
+        _write_part(self.path, base, columns)
+        base_index = HistoryIndex.build(columns)
+
+        with self._lock:
+            manifest = self._read_manifest()
+
+            # Сегменты, дописанные во время слияния, доливаются в индекс новой базы
+            remaining = [s for s in manifest["segments"] if s not in merged]
+            index = base_index
+            for segment in remaining:
+                index = index.merge(_load_part(self.path, segment))
+
+            old_parts = [manifest["base"], manifest.get("index")] + merged
+            self._write_manifest({
+                "base": base,
+                "segments": remaining,
+                "index": self._write_index(generation, index),
+                "next_generation": manifest["next_generation"]
+            })
+
+        self._remove_parts(old_parts)
+        return True
+
+    def compact_async(self, min_segments: int = 1) -> Optional[threading.Thread]:
+        """
+        Уплотнение в фоновом потоке
+
+        Args:
+            min_segments: Уплотнять, только если сегментов не меньше
+
+        Returns:
+            Запущенный поток или None
+        """
+        manifest = self._read_manifest()
+        if manifest is None or len(manifest["segments"]) < min_segments:
+            return None
+        thread = threading.Thread(target=self.compact, name="history-compaction", daemon=True)
+        thread.start()
+        return thread
+
+    def snapshot(self) -> HistorySnapshot:
+        """
+        Текущий снимок (переоткрывается, только если манифест изменился)
+
+        Части, удалённые уплотнением между чтением манифеста и открытием
+        файлов, приводят к повторному чтению манифеста.
+        """
+        for _ in range(5):
+            try:
+                # Манифест заменяется через rename, поэтому новая версия - новый inode
+                st = os.stat(os.path.join(self.path, MANIFEST))
+                key = (st.st_ino, st.st_mtime_ns)
+                if self._snapshot is not None and key == self._snapshot_key:
+                    return self._snapshot
+
+                manifest = self._read_manifest()
+                names = ([manifest["base"]] if manifest["base"] else []) + manifest["segments"]
+                parts = [_load_part(self.path, name) for name in names]
+                index = HistoryIndex.load(os.path.join(self.path, manifest["index"])) \
+                    if manifest.get("index") else None
+            except FileNotFoundError:
+                continue
+
+            self._snapshot = HistorySnapshot(parts, manifest, index)
+            self._snapshot_key = key
+            return self._snapshot
+
+        raise FileNotFoundError(f"Не удалось открыть снимок хранилища: {self.path}")
+
+    def to_csv(self, csv_path: str) -> None:
+        """Экспорт в CSV того же формата, что и исходный датасет"""
+        df = self.to_frame()
+        df.to_csv(csv_path, index=False, encoding='utf-8', date_format=CSV_DATE_FORMAT)
+
+    def to_frame(self) -> pd.DataFrame:
+        """Вся история как DataFrame (created_at - datetime64)"""
+        columns = self.columns
+        return pd.DataFrame({
+            "id": columns["id"],
+            "product_id": columns["product_id"],
+            "price": columns["price"],
+            "created_at": from_epoch(columns["created_at"]),
+        })
+
+    @property
+    def columns(self) -> Dict[str, np.ndarray]:
+        """Колонки текущего снимка (только чтение)"""
+        return self.snapshot().columns
+
+    def product_ids(self) -> np.ndarray:
+        """Уникальные ID товаров"""
+        return self.snapshot().product_ids()
+
+    @property
+    def index(self) -> HistoryIndex:
+        """Индекс текущего снимка"""
+        return self.snapshot().index
+
+    def latest(self, product_id: int) -> Optional[Tuple[float, int]]:
+        """(последняя цена, время в секундах от эпохи) товара или None - O(1)"""
+        return self.snapshot().index.latest(product_id)
+
+    def series(self, product_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Ряд одного товара
+
+        Returns:
+            (prices, created_at) - срезы mmap-колонок, created_at в секундах от эпохи
+        """
+        return self.snapshot().series(product_id)
+
+    def __len__(self) -> int:
+        return len(self.snapshot())
+
+    def _read_manifest(self) -> Optional[Dict]:
+        try:
+            with open(os.path.join(self.path, MANIFEST), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_manifest(self, manifest: Dict) -> None:
+        """Атомарная замена манифеста (под блокировкой)"""
+        target = os.path.join(self.path, MANIFEST)
+        tmp = target + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, target)
+        _fsync_dir(self.path)
+
+    def _write_index(self, generation: int, index: HistoryIndex) -> str:
+        """Запись индекса версии generation (до замены манифеста)"""
+        name = f"index-{generation:06d}.npz"
+        index.save(os.path.join(self.path, name))
+        return name
+
+    def _manifest_index(self, manifest: Dict) -> HistoryIndex:
+        """Индекс версии манифеста (перестраивается, если не сохранён)"""
+        if manifest.get("index"):
+            return HistoryIndex.load(os.path.join(self.path, manifest["index"]))
+        names = ([manifest["base"]] if manifest["base"] else []) + manifest["segments"]
+        return HistorySnapshot([_load_part(self.path, name) for name in names], manifest).index
+
+    @staticmethod
+    def _part_names(manifest: Dict) -> List[str]:
+        return [manifest["base"], manifest.get("index")] + manifest["segments"]
+
+    def _remove_parts(self, names: List[str]) -> None:
+        """
+        Удаление частей и индексов, выпавших из манифеста
+
+        Уже открытые снимки продолжают читать свои mmap-файлы.
+        """
+        for name in names:
+            if not name:
+                continue
+            path = os.path.join(self.path, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.exists(path):
+                os.remove(path)
+
+
+def open_history_store(path: str):
+    """
+    Хранилище по пути: HistoryStore для каталога, SqlHistoryStore для
+    файла .db/.sqlite, None для CSV
+    """
+    from storage.sql_store import SqlHistoryStore, is_sql_path
+
+    if is_sql_path(path):
+        return SqlHistoryStore(path)
+    if os.path.isdir(path):
+        return HistoryStore(path)
+    return None
+
+
+def read_history_frame(path: str) -> pd.DataFrame:
+    """
+    История цен из хранилища, SQLite-базы или CSV
+
+    Args:
+        path: Каталог HistoryStore, файл .db/.sqlite или CSV-файл
+    """
+    store = open_history_store(path)
+    if store is not None:
+        return store.to_frame()
+    return pd.read_csv(path, parse_dates=['created_at'])
+
+
+def write_history_frame(path: str, df: pd.DataFrame) -> None:
+    """Сохранение истории в хранилище или CSV (по типу path)"""
+    if os.path.isdir(path):
+        HistoryStore.write_frame(path, df)
+    else:
+        df.to_csv(path, index=False, encoding='utf-8', date_format=CSV_DATE_FORMAT)
+
+
+def append_history_frame(path: str, df: pd.DataFrame) -> None:
+    """
+    Дописывание новых строк истории
+
+    Хранилище получает новый сегмент, база - пакетную вставку; в CSV
+    дописываются только новые строки одной записью с fsync, существующий
+    файл не переписывается.
+    """
+    store = open_history_store(path)
+    if store is not None:
+        store.append_frame(df)
+        return
+
+    data = df.to_csv(index=False, header=False, date_format=CSV_DATE_FORMAT)
+    with open(path, "a", encoding="utf-8", newline="") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+# ============================================================================
+# ГЛАВНАЯ ФУНКЦИЯ
+# ============================================================================
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description='Колоночное хранилище истории цен')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_import = sub.add_parser('import', help='CSV -> хранилище')
+    p_import.add_argument('csv')
+    p_import.add_argument('store')
+
+    p_export = sub.add_parser('export', help='Хранилище -> CSV')
+    p_export.add_argument('store')
+    p_export.add_argument('csv')
+
+    p_show = sub.add_parser('show', help='Ряд одного товара')
+    p_show.add_argument('store')
+    p_show.add_argument('product_id', type=int)
+
+    p_compact = sub.add_parser('compact', help='Слияние сегментов с базой')
+    p_compact.add_argument('store')
+
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        start = time.perf_counter()
+        store = HistoryStore.from_csv(args.csv, args.store)
+        print(f"✅ Импортировано записей: {len(store)} ({time.perf_counter() - start:.3f}с)")
+    elif args.command == 'export':
+        HistoryStore(args.store).to_csv(args.csv)
+        print(f"✅ Экспортировано в {args.csv}")
+    elif args.command == 'compact':
+        store = HistoryStore(args.store)
+        segments = len(store.snapshot().manifest["segments"])
+        if store.compact():
+            print(f"✅ Слито сегментов: {segments}, записей: {len(store)}")
+        else:
+            print("Сегментов нет")
+    else:
+        prices, created_at = HistoryStore(args.store).series(args.product_id)
+        for price, ts in zip(prices, from_epoch(created_at)):
+            print(f"  {ts}  {price:.2f}")
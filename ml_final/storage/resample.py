@@ -0,0 +1,240 @@
+"""
+Дневные бары из нерегулярных записей истории
+PriceUpdater ставит время datetime.now(), поэтому повторные запуски дают
+несколько цен за день, а пропущенные - дыры. Модели же считают позицию
+в ряду номером дня, поэтому перед ними история приводится к барам:
+один бар на товар и день, дубликаты убраны, пропуски заполнены или помечены.
+
+Всё считается сразу по всем товарам: одна сортировка, границы групп
+и np.*.reduceat - без groupby/resample по товарам.
+"""
+import os
+import sys
+from dataclasses import dataclass
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from storage.grouped_history import GroupedHistory
+
+
+DAY = 86400
+
+FILL_MODES = ("ffill", "flag", "none")
+BAR_FIELDS = ("last", "mean", "min", "max")
+
+
+@dataclass
+class DailyBars:
+    """
+    Дневные бары в ragged-раскладке: товар i - бары offsets[i]:offsets[i+1]
+
+    created_at - время последней записи дня (для заполненных дней - время
+    предыдущего бара, сдвинутое на целые дни), missing - день без записей,
+    count - записей в дне после удаления дубликатов.
+    """
+    product_ids: np.ndarray
+    offsets: np.ndarray
+    day: np.ndarray              # datetime64[D]
+    created_at: np.ndarray       # datetime64[s]
+    last: np.ndarray
+    mean: np.ndarray
+    min: np.ndarray
+    max: np.ndarray
+    count: np.ndarray
+    missing: np.ndarray
+    duplicates: int = 0          # Удалено повторов (товар, время)
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def __len__(self) -> int:
+        return len(self.product_ids)
+
+    def to_grouped(self, field: str = "last", include_missing: bool = True) -> GroupedHistory:
+        """
+        Бары как GroupedHistory - вход моделей и generate_forecast_batch
+
+        Args:
+            field: Цена бара (last, mean, min, max)
+            include_missing: Оставить дни без записей (при fill="flag" их цена - NaN)
+        """
+        if field not in BAR_FIELDS:
+            raise ValueError(f"Неизвестное поле бара: {field}")
+        prices = getattr(self, field)
+
+        if include_missing or not self.missing.any():
+            return GroupedHistory(
+                product_ids=self.product_ids,
+                offsets=self.offsets,
+                prices=prices,
+                created_at=self.created_at
+            )
+
+        keep = ~self.missing
+        kept = np.concatenate([[0], np.cumsum(keep)])
+        return GroupedHistory(
+            product_ids=self.product_ids,
+            offsets=kept[self.offsets],
+            prices=prices[keep],
+            created_at=self.created_at[keep]
+        )
+
+
+def resample_daily(history: GroupedHistory, fill: str = "ffill") -> DailyBars:
+    """
+    Дневные бары по всем товарам
+
+    Args:
+        history: История (порядок строк внутри товара не важен)
+        fill: ffill - пропущенные дни получают значения предыдущего бара,
+              flag - пропущенные дни с NaN, none - только дни с записями.
+              Во всех режимах пропуски отмечены в missing.
+
+    Returns:
+        DailyBars - товары в том же порядке, что и в history
+    """
+    if fill not in FILL_MODES:
+        raise ValueError(f"Неизвестный режим заполнения: {fill}")
+
+    n_products = len(history)
+    lengths = history.lengths
+    start, end = history.offsets[0], history.offsets[-1]
+    product = np.repeat(np.arange(n_products), lengths)
+    ts = np.asarray(history.created_at[start:end]).astype('datetime64[s]').astype(np.int64)
+    prices = np.asarray(history.prices[start:end], dtype=np.float64)
+
+    if len(prices) == 0:
+        return _empty(history.product_ids, n_products)
+
+    # Сортировка (товар, время); при равном времени сохраняется исходный порядок.
+    # Хранилища отдают строки уже упорядоченными - тогда сортировка не нужна
+    same_product = product[1:] == product[:-1]
+    if np.any(same_product & (ts[1:] < ts[:-1])):
+        order = np.lexsort((np.arange(len(ts)), ts, product))
+        product, ts, prices = product[order], ts[order], prices[order]
+        same_product = product[1:] == product[:-1]
+
+    # Дубликаты (товар, время): остаётся последняя запись
+    keep = np.ones(len(ts), dtype=bool)
+    keep[:-1] = ~same_product | (ts[1:] != ts[:-1])
+    duplicates = int(len(keep) - keep.sum())
+    if duplicates:
+        product, ts, prices = product[keep], ts[keep], prices[keep]
+
+    # Границы групп (товар, день)
+    day = ts // DAY
+    first = np.ones(len(ts), dtype=bool)
+    first[1:] = (product[1:] != product[:-1]) | (day[1:] != day[:-1])
+    starts = np.flatnonzero(first)
+    ends = np.append(starts[1:], len(ts))
+
+    count = ends - starts
+    bar_product = product[starts]
+    bar_day = day[starts]
+    bar_ts = ts[ends - 1]
+    last = prices[ends - 1]
+    mean = np.add.reduceat(prices, starts) / count
+    low = np.minimum.reduceat(prices, starts)
+    high = np.maximum.reduceat(prices, starts)
+
+    bars_per_product = np.bincount(bar_product, minlength=n_products)
+
+    if fill == "none":
+        offsets = np.concatenate([[0], np.cumsum(bars_per_product)])
+        return DailyBars(
+            product_ids=history.product_ids,
+            offsets=offsets,
+            day=bar_day.astype('datetime64[D]'),
+            created_at=bar_ts.astype('datetime64[s]'),
+            last=last, mean=mean, min=low, max=high,
+            count=count.astype(np.int64),
+            missing=np.zeros(len(starts), dtype=bool),
+            duplicates=duplicates
+        )
+
+    # Непрерывный календарь от первого до последнего дня каждого товара
+    bar_offsets = np.concatenate([[0], np.cumsum(bars_per_product)])
+    has = bars_per_product > 0
+    first_day = np.zeros(n_products, dtype=np.int64)
+    last_day = np.zeros(n_products, dtype=np.int64)
+    first_day[has] = bar_day[bar_offsets[:-1][has]]
+    last_day[has] = bar_day[bar_offsets[1:][has] - 1]
+    span = np.where(has, last_day - first_day + 1, 0)
+    offsets = np.concatenate([[0], np.cumsum(span)])
+    total = int(offsets[-1])
+
+    position = offsets[bar_product] + (bar_day - first_day[bar_product])
+    observed = np.zeros(total, dtype=bool)
+    observed[position] = True
+    out_day = np.repeat(first_day, span) + (np.arange(total) - np.repeat(offsets[:-1], span))
+
+    # Номер бара-источника: для дня без записей - предыдущий бар товара.
+    # Первый день товара всегда наблюдаемый, поэтому через границу не переносит
+    source = np.zeros(total, dtype=np.int64)
+    source[position] = np.arange(len(starts))
+    source = np.maximum.accumulate(np.where(observed, source, 0))
+
+    # Время дня без записей - время предыдущего бара на целое число дней позже
+    created_at = bar_ts[source] + (out_day - bar_day[source]) * DAY
+
+    def spread(values: np.ndarray) -> np.ndarray:
+        if fill == "ffill":
+            return values[source]
+        out = np.full(total, np.nan)
+        out[position] = values
+        return out
+
+    out_count = np.zeros(total, dtype=np.int64)
+    out_count[position] = count
+
+    return DailyBars(
+        product_ids=history.product_ids,
+        offsets=offsets,
+        day=out_day.astype('datetime64[D]'),
+        created_at=created_at.astype('datetime64[s]'),
+        last=spread(last), mean=spread(mean), min=spread(low), max=spread(high),
+        count=out_count,
+        missing=~observed,
+        duplicates=duplicates
+    )
+
+
+def _empty(product_ids: np.ndarray, n_products: int) -> DailyBars:
+    empty = np.empty(0, dtype=np.float64)
+    return DailyBars(
+        product_ids=product_ids,
+        offsets=np.zeros(n_products + 1, dtype=np.int64),
+        day=np.empty(0, dtype='datetime64[D]'),
+        created_at=np.empty(0, dtype='datetime64[s]'),
+        last=empty, mean=empty.copy(), min=empty.copy(), max=empty.copy(),
+        count=np.empty(0, dtype=np.int64),
+        missing=np.empty(0, dtype=bool)
+    )
+
+
+# ============================================================================
+# ГЛАВНАЯ ФУНКЦИЯ
+# ============================================================================
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description='Дневные бары истории цен')
+    parser.add_argument('history', help='CSV, каталог хранилища или SQLite-база')
+    parser.add_argument('--fill', choices=FILL_MODES, default='ffill', help='Заполнение пропущенных дней')
+
+    args = parser.parse_args()
+
+    history = GroupedHistory.load(args.history)
+    start = time.perf_counter()
+    bars = resample_daily(history, fill=args.fill)
+    elapsed = time.perf_counter() - start
+
+    print(f"✅ Товаров: {len(bars)}, записей: {history.n_records} -> баров: {int(bars.offsets[-1])} "
+          f"({elapsed:.3f}с)")
+    print(f"✅ Дубликатов удалено: {bars.duplicates}, дней без записей: {int(bars.missing.sum())}, "
+          f"дней с несколькими записями: {int((bars.count > 1).sum())}")
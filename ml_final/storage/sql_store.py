@@ -0,0 +1,304 @@
+"""
+История цен в локальной SQLite-базе
+Схема повторяет таблицу PriceHistory из AppDbContext (.NET API):
+Id, ProductId, Price (decimal), CreatedAt - с индексом (ProductId, CreatedAt).
+Позволяет гонять Python-часть на объёмах продакшена без сервера.
+"""
+import os
+import sqlite3
+import sys
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from storage.history_index import HistoryIndex
+from storage.history_store import COLUMNS, CSV_DATE_FORMAT, from_epoch, to_epoch
+
+
+SQL_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS "PriceHistory" (
+    "Id" INTEGER PRIMARY KEY AUTOINCREMENT,
+    "ProductId" INTEGER NOT NULL,
+    "Price" NUMERIC(18, 2) NOT NULL,
+    "CreatedAt" TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS "IX_PriceHistory_ProductId_CreatedAt"
+    ON "PriceHistory" ("ProductId", "CreatedAt");
+"""
+
+# Время отдаётся базой сразу в секундах от эпохи - без разбора строк в Python
+_SELECT = (
+    'SELECT "Id", "ProductId", "Price", CAST(strftime(\'%s\', "CreatedAt") AS INTEGER) '
+    'FROM "PriceHistory"'
+)
+_ROW_DTYPE = np.dtype([
+    ("id", COLUMNS["id"]),
+    ("product_id", COLUMNS["product_id"]),
+    ("price", COLUMNS["price"]),
+    ("created_at", COLUMNS["created_at"]),
+])
+
+
+def is_sql_path(path: str) -> bool:
+    """Путь к SQLite-базе (по расширению)"""
+    return str(path).lower().endswith(SQL_EXTENSIONS)
+
+
+def _format_time(value) -> str:
+    """datetime / строка / секунды от эпохи -> текст CreatedAt"""
+    if isinstance(value, (int, np.integer)):
+        value = from_epoch(np.int64(value))
+    return pd.Timestamp(value).strftime(CSV_DATE_FORMAT)
+
+
+class SqlHistoryStore:
+    """
+    Адаптер таблицы PriceHistory
+
+    Интерфейс чтения совпадает с HistoryStore (columns, series, index,
+    latest), поэтому GroupedHistory и PriceUpdater работают с обоими.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Файл SQLite (создаётся при первом обращении)
+        """
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._index: Optional[HistoryIndex] = None
+        self._index_version = None
+
+    @classmethod
+    def from_csv(cls, csv_path: str, path: str) -> "SqlHistoryStore":
+        """Импорт CSV price_history_dataset.csv"""
+        store = cls(path)
+        store.append_frame(pd.read_csv(csv_path))
+        return store
+
+    def append(self, ids, product_ids, prices, created_at) -> int:
+        """
+        Пакетная вставка одной транзакцией (executemany)
+
+        Args:
+            ids: ID записей или None (назначит база)
+            created_at: Секунды от эпохи (int64)
+
+        Returns:
+            Количество вставленных строк
+        """
+        product_ids = np.asarray(product_ids, dtype=np.int64).tolist()
+        prices = np.round(np.asarray(prices, dtype=np.float64), 2).tolist()
+        created_at = np.asarray(created_at, dtype=np.int64)
+        created_at_text = np.datetime_as_string(from_epoch(created_at), unit='s')
+        created_at_text = np.char.replace(created_at_text, 'T', ' ').tolist()
+
+        with self.conn:
+            if ids is None:
+                self.conn.executemany(
+                    'INSERT INTO "PriceHistory" ("ProductId", "Price", "CreatedAt") VALUES (?, ?, ?)',
+                    zip(product_ids, prices, created_at_text)
+                )
+            else:
+                self.conn.executemany(
+                    'INSERT INTO "PriceHistory" ("Id", "ProductId", "Price", "CreatedAt") VALUES (?, ?, ?, ?)',
+                    zip(np.asarray(ids, dtype=np.int64).tolist(), product_ids, prices, created_at_text)
+                )
+
+        # Индекс дополняется новыми строками, если базу с его построения
+        # не меняло другое соединение; иначе он перестроится при обращении
+        if self._index is not None and self._data_version() == self._index_version:
+            order = np.lexsort((created_at, product_ids))
+            self._index = self._index.merge({
+                "id": np.array([self.max_id()], dtype=np.int64),
+                "product_id": np.asarray(product_ids, dtype=np.int64)[order],
+                "price": np.asarray(prices, dtype=np.float64)[order],
+                "created_at": created_at[order],
+            })
+        return len(product_ids)
+
+    def append_frame(self, df: pd.DataFrame) -> int:
+        """Вставка DataFrame с колонками id, product_id, price, created_at"""
+        return self.append(
+            ids=df['id'].to_numpy() if 'id' in df else None,
+            product_ids=df['product_id'].to_numpy(),
+            prices=df['price'].to_numpy(),
+            created_at=to_epoch(df['created_at'])
+        )
+
+    def read(
+        self,
+        product_id: int = None,
+        start=None,
+        end=None
+    ) -> Dict[str, np.ndarray]:
+        """
+        Строки истории в колонки NumPy, отсортированные по (product_id, created_at)
+
+        Args:
+            product_id: Только этот товар (None - все)
+            start: Начало диапазона created_at (включительно)
+            end: Конец диапазона created_at (не включительно)
+        """
+        where, params = [], []
+        if product_id is not None:
+            where.append('"ProductId" = ?')
+            params.append(int(product_id))
+        if start is not None:
+            where.append('"CreatedAt" >= ?')
+            params.append(_format_time(start))
+        if end is not None:
+            where.append('"CreatedAt" < ?')
+            params.append(_format_time(end))
+
+        query = _SELECT
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += ' ORDER BY "ProductId", "CreatedAt", "Id"'
+
+        rows = np.fromiter(self.conn.execute(query, params), dtype=_ROW_DTYPE)
+        return {name: np.ascontiguousarray(rows[name]) for name in _ROW_DTYPE.names}
+
+    @property
+    def columns(self) -> Dict[str, np.ndarray]:
+        """Вся история (как HistoryStore.columns)"""
+        return self.read()
+
+    def series(self, product_id: int, start=None, end=None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Ряд одного товара - выборка по индексу (ProductId, CreatedAt)
+
+        Returns:
+            (prices, created_at) - created_at в секундах от эпохи
+        """
+        columns = self.read(product_id, start, end)
+        return columns["price"], columns["created_at"]
+
+    @property
+    def index(self) -> HistoryIndex:
+        """
+        HistoryIndex базы
+
+        Строится агрегирующим запросом при первом обращении, дальше
+        дополняется строками append за O(P + новых строк). Заново строится,
+        только если базу изменило другое соединение (PRAGMA data_version).
+        """
+        version = self._data_version()
+        if self._index is None or version != self._index_version:
+            self._index = self._build_index()
+            self._index_version = version
+        return self._index
+
+    def _data_version(self) -> int:
+        """Счётчик коммитов других соединений"""
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _build_index(self) -> HistoryIndex:
+        """
+        HistoryIndex одним проходом по таблице
+
+        Последняя запись товара - как в latest(): наибольший CreatedAt,
+        при равном времени - наибольший Id.
+        """
+        rows = np.fromiter(
+            self.conn.execute(
+                'SELECT "ProductId", "Price", CAST(strftime(\'%s\', "CreatedAt") AS INTEGER), "Count" FROM ('
+                ' SELECT "ProductId", "Price", "CreatedAt",'
+                ' ROW_NUMBER() OVER (PARTITION BY "ProductId" ORDER BY "CreatedAt" DESC, "Id" DESC) AS "Rank",'
+                ' COUNT(*) OVER (PARTITION BY "ProductId") AS "Count"'
+                ' FROM "PriceHistory")'
+                ' WHERE "Rank" = 1 ORDER BY "ProductId"'
+            ),
+            dtype=[("product_id", np.int32), ("price", np.float64),
+                   ("created_at", np.int64), ("count", np.int64)]
+        )
+        return HistoryIndex(
+            product_id=np.ascontiguousarray(rows["product_id"]),
+            last_price=np.ascontiguousarray(rows["price"]),
+            last_created_at=np.ascontiguousarray(rows["created_at"]),
+            count=np.ascontiguousarray(rows["count"]),
+            base_lo=np.zeros(len(rows), dtype=np.int64),
+            base_hi=np.zeros(len(rows), dtype=np.int64),
+            max_id=self.max_id()
+        )
+
+    def latest(self, product_id: int) -> Optional[Tuple[float, int]]:
+        """(последняя цена, время в секундах от эпохи) товара или None"""
+        row = self.conn.execute(
+            'SELECT "Price", CAST(strftime(\'%s\', "CreatedAt") AS INTEGER) FROM "PriceHistory" '
+            'WHERE "ProductId" = ? ORDER BY "CreatedAt" DESC, "Id" DESC LIMIT 1',
+            (int(product_id),)
+        ).fetchone()
+        return (float(row[0]), int(row[1])) if row else None
+
+    def max_id(self) -> int:
+        row = self.conn.execute('SELECT MAX("Id") FROM "PriceHistory"').fetchone()
+        return int(row[0]) if row[0] is not None else 0
+
+    def product_ids(self) -> np.ndarray:
+        return np.fromiter(
+            (r[0] for r in self.conn.execute('SELECT DISTINCT "ProductId" FROM "PriceHistory" ORDER BY 1')),
+            dtype=np.int64
+        )
+
+    def to_frame(self) -> pd.DataFrame:
+        """Вся история как DataFrame (created_at - datetime64)"""
+        columns = self.read()
+        return pd.DataFrame({
+            "id": columns["id"],
+            "product_id": columns["product_id"],
+            "price": columns["price"],
+            "created_at": from_epoch(columns["created_at"]),
+        })
+
+    def to_csv(self, csv_path: str) -> None:
+        """Экспорт в CSV того же формата, что и исходный датасет"""
+        self.to_frame().to_csv(csv_path, index=False, encoding='utf-8', date_format=CSV_DATE_FORMAT)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __len__(self) -> int:
+        return self.conn.execute('SELECT COUNT(*) FROM "PriceHistory"').fetchone()[0]
+
+
+# ============================================================================
+# ГЛАВНАЯ ФУНКЦИЯ
+# ============================================================================
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description='История цен в SQLite (схема PriceHistory)')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_import = sub.add_parser('import', help='CSV -> база')
+    p_import.add_argument('csv')
+    p_import.add_argument('db')
+
+    p_show = sub.add_parser('show', help='Ряд одного товара')
+    p_show.add_argument('db')
+    p_show.add_argument('product_id', type=int)
+    p_show.add_argument('--start', default=None, help='Начало диапазона (YYYY-MM-DD)')
+    p_show.add_argument('--end', default=None, help='Конец диапазона (YYYY-MM-DD)')
+
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        start = time.perf_counter()
+        store = SqlHistoryStore.from_csv(args.csv, args.db)
+        print(f"✅ Импортировано записей: {len(store)} ({time.perf_counter() - start:.3f}с)")
+    else:
+        store = SqlHistoryStore(args.db)
+        prices, created_at = store.series(args.product_id, args.start, args.end)
+        for price, ts in zip(prices, from_epoch(created_at)):
+            print(f"  {ts}  {price:.2f}")
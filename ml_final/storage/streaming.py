@@ -0,0 +1,242 @@
+"""
+Потоковое чтение истории цен с ограниченной памятью
+CSV читается блоками фиксированного размера, строки раскладываются
+по товарам, готовые ряды отдаются генератором
+
+Отсортированный по product_id файл (выгрузка ORDER BY) читается за один
+проход: в памяти только текущий блок и хвост незавершённого товара.
+Неотсортированный файл сначала раскладывается по хэш-корзинам на диске,
+затем корзины читаются по одной.
+"""
+import math
+import os
+import shutil
+import sys
+import tempfile
+from dataclasses import dataclass
+from typing import Iterator, Tuple
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from storage.grouped_history import GroupedHistory
+from storage.history_store import COLUMNS, to_epoch
+
+
+ROW_DTYPE = np.dtype([
+    ("product_id", COLUMNS["product_id"]),
+    ("price", COLUMNS["price"]),
+    ("created_at", COLUMNS["created_at"]),
+])
+
+Series = Tuple[int, np.ndarray, np.ndarray]
+
+
+@dataclass
+class StreamStats:
+    """Счётчики потокового чтения"""
+    rows: int = 0
+    chunks: int = 0
+    products: int = 0
+    buckets: int = 0
+    spilled_bytes: int = 0
+    max_buffered_rows: int = 0
+    max_id: int = 0          # Наибольший ID записи (если в файле есть колонка id)
+
+    def to_dict(self) -> dict:
+        return {
+            "rows": self.rows,
+            "chunks": self.chunks,
+            "products": self.products,
+            "buckets": self.buckets,
+            "spilled_bytes": self.spilled_bytes,
+            "max_buffered_rows": self.max_buffered_rows,
+            "max_id": self.max_id
+        }
+
+
+class HistoryStream:
+    """
+    Генератор рядов товаров из CSV любого размера
+
+    Каждый ряд - (product_id, prices float64, created_at datetime64[s]),
+    отсортированный по времени. Пиковая память - блок chunk_rows строк
+    плюс история одного товара (sorted_input) или одна корзина
+    размером ~memory_limit (неотсортированный файл).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        chunk_rows: int = 100_000,
+        sorted_input: bool = False,
+        memory_limit: int = 256 * 1024 * 1024,
+        buckets: int = None,
+        spill_dir: str = None
+    ):
+        """
+        Args:
+            path: CSV с колонками product_id, price, created_at
+            chunk_rows: Строк в блоке чтения
+            sorted_input: Файл отсортирован по product_id (за один проход, без диска)
+            memory_limit: Целевой объём корзины в байтах (для неотсортированного файла)
+            buckets: Число корзин (по умолчанию - по размеру файла и memory_limit)
+            spill_dir: Каталог для корзин (по умолчанию - системный temp)
+        """
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.sorted_input = sorted_input
+        self.memory_limit = memory_limit
+        self.buckets = buckets
+        self.spill_dir = spill_dir
+        self.stats = StreamStats()
+
+    def __iter__(self) -> Iterator[Series]:
+        if self.sorted_input:
+            return self._iter_sorted()
+        return self._iter_spilled()
+
+    def batches(self, size: int) -> Iterator[GroupedHistory]:
+        """Ряды, собранные в пакеты по size товаров (для generate_forecast_batch)"""
+        product_ids, prices, dates = [], [], []
+        for product_id, series_prices, series_dates in self:
+            product_ids.append(product_id)
+            prices.append(series_prices)
+            dates.append(series_dates)
+            if len(product_ids) == size:
+                yield GroupedHistory.from_series(prices, dates=dates, product_ids=product_ids)
+                product_ids, prices, dates = [], [], []
+        if product_ids:
+            yield GroupedHistory.from_series(prices, dates=dates, product_ids=product_ids)
+
+    def _chunks(self) -> Iterator[np.ndarray]:
+        """Блоки CSV как типизированные записи"""
+        reader = pd.read_csv(
+            self.path,
+            usecols=lambda column: column in ("id", "product_id", "price", "created_at"),
+            chunksize=self.chunk_rows
+        )
+        for df in reader:
+            if "id" in df and len(df):
+                self.stats.max_id = max(self.stats.max_id, int(df["id"].max()))
+            rows = np.empty(len(df), dtype=ROW_DTYPE)
+            rows["product_id"] = df["product_id"].to_numpy()
+            rows["price"] = df["price"].to_numpy()
+            rows["created_at"] = to_epoch(df["created_at"])
+            self.stats.rows += len(rows)
+            self.stats.chunks += 1
+            yield rows
+
+    def _groups(self, rows: np.ndarray) -> Iterator[Series]:
+        """Ряды товаров из блока завершённых товаров"""
+        if len(rows) == 0:
+            return
+        rows = rows[np.lexsort((rows["created_at"], rows["product_id"]))]
+        product_ids, first = np.unique(rows["product_id"], return_index=True)
+        bounds = np.append(first, len(rows))
+        for i, product_id in enumerate(product_ids):
+            part = rows[bounds[i]:bounds[i + 1]]
+            self.stats.products += 1
+            yield int(product_id), part["price"].copy(), part["created_at"].astype('datetime64[s]')
+
+    def _iter_sorted(self) -> Iterator[Series]:
+        """
+        Один проход по файлу, отсортированному по product_id
+
+        Последний товар блока может продолжиться в следующем блоке,
+        поэтому его строки переносятся; остальные товары блока завершены.
+        """
+        carry = np.empty(0, dtype=ROW_DTYPE)
+        last_finished = None
+
+        for chunk in self._chunks():
+            pids = chunk["product_id"]
+            if np.any(np.diff(pids) < 0) or (len(carry) and pids[0] < carry["product_id"][0]) \
+                    or (last_finished is not None and len(pids) and pids[0] <= last_finished):
+                raise ValueError("Файл не отсортирован по product_id - используйте sorted_input=False")
+
+            rows = np.concatenate([carry, chunk]) if len(carry) else chunk
+            self.stats.max_buffered_rows = max(self.stats.max_buffered_rows, len(rows))
+
+            cut = int(np.searchsorted(rows["product_id"], rows["product_id"][-1], side='left'))
+            if cut:
+                last_finished = int(rows["product_id"][cut - 1])
+            yield from self._groups(rows[:cut])
+            carry = rows[cut:].copy()
+
+        yield from self._groups(carry)
+
+    def _iter_spilled(self) -> Iterator[Series]:
+        """
+        Два прохода для неотсортированного файла
+
+        1. Строки блока раскладываются по корзинам product_id % buckets
+           и дописываются в двоичные файлы корзин.
+        2. Корзины читаются по одной и группируются в памяти.
+        """
+        buckets = self.buckets or max(1, math.ceil(os.path.getsize(self.path) / self.memory_limit))
+        self.stats.buckets = buckets
+        tmp = tempfile.mkdtemp(prefix="history-spill-", dir=self.spill_dir)
+
+        try:
+            paths = [os.path.join(tmp, f"bucket-{i:05d}.bin") for i in range(buckets)]
+            files = [open(p, "wb") for p in paths]
+            try:
+                for chunk in self._chunks():
+                    bucket = chunk["product_id"].astype(np.int64) % buckets
+                    order = np.argsort(bucket, kind='stable')
+                    chunk, bucket = chunk[order], bucket[order]
+                    bounds = np.searchsorted(bucket, np.arange(buckets + 1))
+                    for i in np.flatnonzero(np.diff(bounds)):
+                        chunk[bounds[i]:bounds[i + 1]].tofile(files[i])
+                    self.stats.spilled_bytes += chunk.nbytes
+                    self.stats.max_buffered_rows = max(self.stats.max_buffered_rows, len(chunk))
+            finally:
+                for f in files:
+                    f.close()
+
+            for path in paths:
+                rows = np.fromfile(path, dtype=ROW_DTYPE)
+                os.remove(path)
+                self.stats.max_buffered_rows = max(self.stats.max_buffered_rows, len(rows))
+                yield from self._groups(rows)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+# ============================================================================
+# ГЛАВНАЯ ФУНКЦИЯ
+# ============================================================================
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description='Потоковое чтение истории цен')
+    parser.add_argument('csv', help='CSV с историей цен')
+    parser.add_argument('--chunk-rows', type=int, default=100_000, help='Строк в блоке')
+    parser.add_argument('--sorted', action='store_true', help='Файл отсортирован по product_id')
+    parser.add_argument('--memory-mb', type=int, default=256, help='Объём корзины, МБ')
+    parser.add_argument('--buckets', type=int, default=None, help='Число корзин')
+
+    args = parser.parse_args()
+
+    stream = HistoryStream(
+        args.csv,
+        chunk_rows=args.chunk_rows,
+        sorted_input=args.sorted,
+        memory_limit=args.memory_mb * 1024 * 1024,
+        buckets=args.buckets
+    )
+
+    start = time.perf_counter()
+    longest = 0
+    for _, prices, _ in stream:
+        longest = max(longest, len(prices))
+    elapsed = time.perf_counter() - start
+
+    print(f"✅ Товаров: {stream.stats.products}, записей: {stream.stats.rows} ({elapsed:.3f}с)")
+    print(f"✅ Самый длинный ряд: {longest}")
+    print(f"✅ Статистика: {stream.stats.to_dict()}")